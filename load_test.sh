@@ -0,0 +1,27 @@
+#!/bin/bash
+# Load tests the site in docker compose with several uWSGI worker models.
+# Usage: ./load_test.sh [username password]
+# The worker models are "processes:threads" pairs, override them with WORKER_MODELS="2:1 4:4".
+set -e
+
+WORKER_MODELS=${WORKER_MODELS:-"1:1 2:2 4:1 4:2 4:4 8:2"}
+DURATION=${DURATION:-10}
+CONCURRENCY=${CONCURRENCY:-20}
+
+CREDENTIALS=()
+if [ -n "$2" ]; then
+    CREDENTIALS=(--username "$1" --password "$2")
+fi
+
+for model in $WORKER_MODELS; do
+    export WEB_PROCESSES=${model%%:*}
+    export WEB_THREADS=${model##*:}
+    echo "=== processes: $WEB_PROCESSES, threads: $WEB_THREADS ==="
+    docker compose up -d --no-deps --force-recreate web
+    # The entrypoint applies migrations and loads the fixture before uWSGI starts
+    until docker compose exec web python -c "import urllib.request; urllib.request.urlopen('http://localhost:8000/')" 2>/dev/null; do
+        sleep 2
+    done
+    docker compose exec web python manage.py benchmark_load \
+        --url http://localhost:8000 --duration "$DURATION" --concurrency "$CONCURRENCY" "${CREDENTIALS[@]}"
+done
@@ -6,7 +6,7 @@ from .models import Post
 # Register your models here.
 class PostAdmin(admin.ModelAdmin):
     empty_value_display = "Пусто"
-    readonly_fields = ("time_create", "time_update")
+    readonly_fields = ("time_create", "time_update", "views", "comments_count", "last_commented_at")
     fields = (
         "title",
         "slug",
@@ -16,11 +16,25 @@ class PostAdmin(admin.ModelAdmin):
         "image",
         "time_create",
         "time_update",
+        "views",
+        "comments_count",
+        "last_commented_at",
+        "is_draft",
+        "is_published",
+        "is_pinned",
+    )
+    list_display = (
+        "title",
+        "author",
+        "image",
+        "time_create",
+        "time_update",
+        "last_commented_at",
+        "comments_count",
         "is_draft",
         "is_published",
         "is_pinned",
     )
-    list_display = ("title", "author", "image", "time_create", "time_update", "is_draft", "is_published", "is_pinned")
     prepopulated_fields = {"slug": ("title",)}
 
 
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.utils import make_excerpt
+
+
+class Command(BaseCommand):
+    """
+    Command to generate excerpts of existing posts.
+    New and edited posts get the excerpt on save, the command is needed for posts created before the field.
+    """
+
+    help = "Generates plain text excerpts of posts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of posts updated by one query")
+        parser.add_argument("--all", action="store_true", help="Regenerate excerpts that are already filled")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        posts = Post.objects.only("article", "excerpt").order_by("pk")
+        if not options["all"]:
+            posts = posts.filter(excerpt="")
+
+        batch = []
+        count = 0
+        for post in posts.iterator(chunk_size=batch_size):
+            post.excerpt = make_excerpt(post.article)
+            batch.append(post)
+            if len(batch) == batch_size:
+                count += Post.objects.bulk_update(batch, ["excerpt"])
+                batch = []
+        if batch:
+            count += Post.objects.bulk_update(batch, ["excerpt"])
+        self.stdout.write(f"Updated {count} posts")
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+
+class Command(BaseCommand):
+    """
+    Command to measure what persistent database connections save per request.
+
+    Requests are simulated with the request_started and request_finished signals, which close
+    expired connections the same way the request handler does, and each request runs one query.
+    With CONN_MAX_AGE = 0 every request connects anew, with a persistent connection it is reused
+    after a health check. Run it with POSTGRES_HOST pointing at PgBouncer to measure the pooled mode.
+    """
+
+    help = "Benchmarks requests with a new and a persistent database connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1_000, help="Number of simulated requests")
+        parser.add_argument("--database", default="default", help="Database alias")
+
+    def handle(self, *args, **options):
+        requests = options["requests"]
+        connection = connections[options["database"]]
+        conn_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        self.stdout.write(f"Requests: {requests}, host: {connection.settings_dict['HOST']}")
+        try:
+            results = {}
+            for mode, max_age in (("New connection per request", 0), ("Persistent connection", None)):
+                # The expiry of a connection is taken from the settings when it is opened
+                connection.close()
+                connection.settings_dict["CONN_MAX_AGE"] = max_age
+                results[mode] = self.run_requests(connection, requests) / requests
+                self.stdout.write(f"{mode}: {results[mode] * 1000:.3f} ms per request")
+        finally:
+            connection.close()
+            connection.settings_dict["CONN_MAX_AGE"] = conn_max_age
+        new, persistent = results.values()
+        self.stdout.write(f"Saved per request: {(new - persistent) * 1000:.3f} ms ({1 - persistent / new:.1%})")
+
+    def run_requests(self, connection, requests: int) -> float:
+        """
+        Runs the requests and returns the elapsed time
+        """
+        start = time.perf_counter()
+        for _ in range(requests):
+            request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            request_finished.send(sender=self.__class__)
+        return time.perf_counter() - start
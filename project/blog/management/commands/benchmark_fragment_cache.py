@@ -0,0 +1,82 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from blog.models import Post
+from blog.utils import make_excerpt
+from blog.views import IndexView
+
+ARTICLE = "".join(f"<p>Абзац {number} статьи о <b>кэшировании</b> фрагментов шаблонов.</p>" for number in range(50))
+
+
+class Command(BaseCommand):
+    """
+    Command to measure how template fragment caching changes the render time of the home page.
+
+    Renders the page for a logged in user, who bypasses the full-page cache.
+    Seeds posts inside a transaction that is rolled back at the end, so the database is left unchanged.
+    """
+
+    help = "Benchmarks rendering of the home page with and without cached fragments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50], help="Numbers of posts on the page")
+        parser.add_argument("--iterations", type=int, default=50, help="Renders measured for each case")
+
+    def handle(self, *args, **options):
+        sizes, iterations = options["sizes"], options["iterations"]
+        with transaction.atomic():
+            user = self.seed(max(sizes))
+            for size in sizes:
+                cold = self.measure(user, size, iterations, clear_cache=True)
+                warm = self.measure(user, size, iterations, clear_cache=False)
+                self.stdout.write(
+                    f"{size} posts: {cold:.2f} ms without cached fragments, {warm:.2f} ms with cached fragments"
+                )
+            transaction.set_rollback(True)
+
+    def seed(self, count: int):
+        """
+        Creates published posts of one author and returns the author
+        """
+        author = get_user_model().objects.create(
+            username="benchmark_fragments", email="benchmark_fragments@test.com", is_author=True
+        )
+        Post.objects.bulk_create(
+            Post(
+                title=f"Benchmark fragments {number}",
+                slug=f"benchmark-fragments-{number}",
+                article=ARTICLE,
+                excerpt=make_excerpt(ARTICLE),
+                author=author,
+                is_draft=False,
+                is_published=True,
+            )
+            for number in range(count)
+        )
+        return author
+
+    def measure(self, user, size: int, iterations: int, clear_cache: bool) -> float:
+        """
+        Returns the median time of rendering the page in milliseconds
+        """
+        view = IndexView.as_view(paginate_by=size)
+        request_factory = RequestFactory()
+        fragments = caches["fragments"]
+        fragments.clear()
+        timings = []
+        for _ in range(iterations + 1):
+            if clear_cache:
+                fragments.clear()
+            request = request_factory.get("/")
+            request.user = user
+            started = time.perf_counter()
+            view(request).render()
+            timings.append(time.perf_counter() - started)
+        # The first render warms up the cache and template loaders
+        return statistics.median(timings[1:]) * 1000
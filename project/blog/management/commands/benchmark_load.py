@@ -0,0 +1,182 @@
+import re
+import statistics
+import threading
+import time
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from blog.models import Post
+
+PAGES = ("home", "post", "search", "subscriptions")
+CSRF_TOKEN_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class Command(BaseCommand):
+    """
+    Command to load test the pages of a running server.
+
+    Each of the concurrent clients keeps its own HTTP connection and requests the page
+    in a loop for the given duration. Reports requests per second and p50/p95/p99 latency
+    of every page. The server is anything serving the project: uWSGI in docker compose
+    or runserver, the worker model is compared by running the command against each setup,
+    see load_test.sh.
+
+    The post and the search text are taken from the newest published post, unless they are given.
+    The subscriptions page is requested by a logged in user, it is skipped without credentials.
+    """
+
+    help = "Load tests the home, post, search and subscriptions pages and reports RPS and latency percentiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000", help="Address of the server")
+        parser.add_argument("--pages", nargs="+", choices=PAGES, default=PAGES, help="Pages to request")
+        parser.add_argument("--concurrency", type=int, default=10, help="Number of concurrent clients")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds each page is requested")
+        parser.add_argument("--post-slug", help="Slug of the requested post")
+        parser.add_argument("--search-text", help="Text of the requested search")
+        parser.add_argument("--username", help="User requesting the subscriptions page")
+        parser.add_argument("--password", help="Password of the user")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        paths = self.get_paths(options)
+        self.stdout.write(
+            f"Server: {options['url']}, clients: {options['concurrency']}, {options['duration']} s per page"
+        )
+        for page in options["pages"]:
+            cookie = ""
+            if page == "subscriptions":
+                if not (options["username"] and options["password"]):
+                    self.stdout.write("subscriptions: skipped, --username and --password are required")
+                    continue
+                cookie = self.login(url, options["username"], options["password"])
+            latencies, errors = self.run_clients(url, paths[page], cookie, options["concurrency"], options["duration"])
+            self.report(page, latencies, errors, options["duration"])
+
+    def get_paths(self, options) -> dict[str, str]:
+        """
+        Returns paths of the pages
+        """
+        post_slug, search_text = options["post_slug"], options["search_text"]
+        if post_slug is None or search_text is None:
+            post = Post.objects.filter(is_draft=False, is_published=True).only("slug", "title").order_by("-pk").first()
+            if post is None:
+                raise CommandError("There are no published posts, pass --post-slug and --search-text")
+            post_slug = post_slug or post.slug
+            search_text = search_text or post.title.split()[0]
+        return {
+            "home": reverse("home"),
+            "post": reverse("post", kwargs={"post_slug": post_slug}),
+            "search": f"{reverse('search')}?{urlencode({'text': search_text})}",
+            "subscriptions": reverse("subscriptions"),
+        }
+
+    def connect(self, url) -> HTTPConnection:
+        """
+        Returns a new connection to the server
+        """
+        connection_class = HTTPSConnection if url.scheme == "https" else HTTPConnection
+        return connection_class(url.netloc, timeout=30)
+
+    def login(self, url, username: str, password: str) -> str:
+        """
+        Logs in with the login form and returns the Cookie header of the session
+        """
+        path = reverse("users:login")
+        connection = self.connect(url)
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            cookies = self.get_cookies(response)
+            token = CSRF_TOKEN_RE.search(response.read().decode())
+            if token is None:
+                raise CommandError("The login form has no CSRF token")
+            body = urlencode({"username": username, "password": password, "csrfmiddlewaretoken": token.group(1)})
+            headers = {
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Cookie": self.get_cookie_header(cookies),
+                "Referer": f"{url.scheme}://{url.netloc}{path}",
+            }
+            connection.request("POST", path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            cookies.update(self.get_cookies(response))
+        finally:
+            connection.close()
+        if "sessionid" not in cookies:
+            raise CommandError(f"Could not log in as {username}")
+        return self.get_cookie_header(cookies)
+
+    def get_cookies(self, response) -> dict[str, str]:
+        """
+        Returns cookies set by the response
+        """
+        cookie = SimpleCookie()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookie.load(header)
+        return {name: morsel.value for name, morsel in cookie.items()}
+
+    def get_cookie_header(self, cookies: dict[str, str]) -> str:
+        """
+        Returns the Cookie header with the cookies
+        """
+        return "; ".join(f"{name}={value}" for name, value in cookies.items())
+
+    def run_clients(self, url, path: str, cookie: str, concurrency: int, duration: float) -> tuple[list[float], int]:
+        """
+        Requests the path by the concurrent clients until the time is over.
+        Returns latencies of the successful requests and the number of failed ones.
+        """
+        latencies: list[float] = []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+        headers = {"Cookie": cookie} if cookie else {}
+
+        def client():
+            nonlocal errors
+            connection = self.connect(url)
+            client_latencies, client_errors = [], 0
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    connection.request("GET", path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, HTTPException):
+                    connection.close()
+                    client_errors += 1
+                    continue
+                if response.status == 200:
+                    client_latencies.append(time.perf_counter() - start)
+                else:
+                    client_errors += 1
+            connection.close()
+            with lock:
+                latencies.extend(client_latencies)
+                errors += client_errors
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors
+
+    def report(self, page: str, latencies: list[float], errors: int, duration: float) -> None:
+        """
+        Prints requests per second and latency percentiles of the page
+        """
+        if len(latencies) < 2:
+            self.stdout.write(f"{page}: not enough successful requests, errors: {errors}")
+            return
+        percentiles = statistics.quantiles(latencies, n=100)
+        p50, p95, p99 = (percentiles[index] * 1000 for index in (49, 94, 98))
+        self.stdout.write(
+            f"{page}: {len(latencies) / duration:.1f} rps, "
+            f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, errors: {errors}"
+        )
@@ -0,0 +1,74 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from blog.models import SEARCH_CONFIG, Post
+
+# A large vocabulary keeps each word in a small share of posts, like in real texts
+WORDS = (
+    "django python redis postgres celery поиск статья блог автор редактор черновик публикация "
+    "индекс запрос страница подписка комментарий просмотр кэш очередь сервер клиент шаблон"
+).split() + [f"term{number}" for number in range(20_000)]
+
+
+class Command(BaseCommand):
+    """
+    Command to compare search over the stored vector with the vector computed at request time.
+
+    Seeds posts inside a transaction that is rolled back at the end, so the database is left unchanged.
+    """
+
+    help = "Benchmarks full-text search of posts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100_000, help="Number of posts to seed")
+        parser.add_argument("--queries", nargs="+", default=["django", "редактор", "python celery"])
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options["posts"])
+            for text in options["queries"]:
+                self.stdout.write(f'Query "{text}":')
+                computed = Post.objects.annotate(search=SearchVector("title", "article", config=SEARCH_CONFIG))
+                computed = computed.filter(search=SearchQuery(text, config=SEARCH_CONFIG), is_published=True)
+                stored = Post.objects.filter(search_vector=SearchQuery(text, config=SEARCH_CONFIG), is_published=True)
+                self.report("vector computed per request", computed)
+                self.report("stored vector with GIN index", stored)
+            transaction.set_rollback(True)
+
+    def seed(self, count: int) -> None:
+        """
+        Creates posts with random titles and HTML articles
+        """
+        author = get_user_model().objects.create(username="benchmark_search", email="benchmark_search@test.com")
+        random.seed(0)
+        started = time.perf_counter()
+        posts = (
+            Post(
+                title=f"{' '.join(random.choices(WORDS, k=4))} {number}",
+                slug=f"benchmark-search-{number}",
+                epigraph=" ".join(random.choices(WORDS, k=6)),
+                article="".join(f"<p>{' '.join(random.choices(WORDS, k=60))}</p>" for _ in range(5)),
+                author=author,
+                is_draft=False,
+                is_published=True,
+            )
+            for number in range(count)
+        )
+        Post.objects.bulk_create(posts, batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Post._meta.db_table}")
+        self.stdout.write(f"Seeded {count} posts in {time.perf_counter() - started:.1f}s")
+
+    def report(self, name: str, queryset) -> None:
+        """
+        Prints execution time and the plan node used to find the posts
+        """
+        plan = queryset.values("pk").explain(analyze=True)
+        lines = plan.splitlines()
+        scan = next((line.strip() for line in lines if "Scan" in line), lines[0].strip())
+        self.stdout.write(f"    {name}: {lines[-1].strip()}, {scan}")
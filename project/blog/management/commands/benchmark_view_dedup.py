@@ -0,0 +1,93 @@
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from blog.redis_services import get_redis_connection
+from blog.views import VISITOR_ID_COOKIE
+
+BENCHMARK_PREFIX = "benchmark:viewers:"
+FILL_BATCH_SIZE = 10_000
+
+
+class Command(BaseCommand):
+    """
+    Command to compare the per post view cookies with the visitor id and HyperLogLog deduplication.
+
+    Measures the Cookie header a reader sends after viewing N posts and how accurately
+    the HyperLogLog separates first views from repeated ones for posts with the given audiences.
+    New views are counted both by the reply of PFADD and by the growth of PFCOUNT to show
+    why the views follow the estimate. Uses its own Redis keys and removes them afterwards.
+    """
+
+    help = "Benchmarks header size and accuracy of unique post view deduplication"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=10_000, help="Number of posts viewed by the reader")
+        parser.add_argument(
+            "--audience",
+            type=int,
+            nargs="+",
+            default=[10_000, 100_000, 1_000_000],
+            help="Unique visitors each post already has, every value is measured separately",
+        )
+        parser.add_argument("--sample", type=int, default=10, help="Number of posts the accuracy is measured on")
+        parser.add_argument("--readers", type=int, default=1_000, help="New readers viewing every sampled post")
+
+    def handle(self, *args, **options):
+        posts, sample, readers = options["posts"], options["sample"], options["readers"]
+        redis_connection = get_redis_connection()
+        keys = [f"{BENCHMARK_PREFIX}{pk}" for pk in range(1, sample + 1)]
+        self.stdout.write(f"Posts viewed by the reader: {posts}")
+        self.report_header_size(posts)
+        self.stdout.write(f"Accuracy on {sample} posts viewed by {readers} new readers each")
+        try:
+            for audience in options["audience"]:
+                redis_connection.delete(*keys)
+                self.fill_audience(redis_connection, keys, audience)
+                self.report_accuracy(redis_connection, keys, audience, readers)
+        finally:
+            redis_connection.delete(*keys)
+
+    def report_header_size(self, posts: int) -> None:
+        """
+        Prints the size of the Cookie header for both schemes
+        """
+        old_header = "; ".join(f"post_view_{pk}=true" for pk in range(1, posts + 1))
+        new_header = f"{VISITOR_ID_COOKIE}={uuid.uuid4().hex}"
+        self.stdout.write(f"Cookie header with per post cookies: {len(old_header)} bytes")
+        self.stdout.write(f"Cookie header with visitor id: {len(new_header)} bytes")
+
+    def fill_audience(self, redis_connection, keys: list[str], audience: int) -> None:
+        """
+        Adds the existing visitors to every post
+        """
+        with redis_connection.pipeline(transaction=False) as pipe:
+            for key in keys:
+                for start in range(0, audience, FILL_BATCH_SIZE):
+                    pipe.pfadd(key, *(uuid.uuid4().hex for _ in range(min(FILL_BATCH_SIZE, audience - start))))
+                pipe.execute()
+
+    def report_accuracy(self, redis_connection, keys: list[str], audience: int, readers: int) -> None:
+        """
+        Views every post twice by the new readers and prints how many views were counted
+        by the reply of PFADD and by the growth of PFCOUNT
+        """
+        new_readers = [uuid.uuid4().hex for _ in range(readers)]
+        views = len(keys) * readers
+        for attempt in ("first", "repeated"):
+            by_pfadd = by_pfcount = 0
+            for key in keys:
+                with redis_connection.pipeline(transaction=False) as pipe:
+                    for reader in new_readers:
+                        pipe.pfcount(key)
+                        pipe.pfadd(key, reader)
+                        pipe.pfcount(key)
+                    replies = pipe.execute()
+                for start in range(0, len(replies), 3):
+                    before, added, after = replies[start : start + 3]
+                    by_pfadd += added
+                    by_pfcount += max(after - before, 0)
+            self.stdout.write(
+                f"Audience {audience}, {attempt} views: counted by PFADD {by_pfadd / views:.2%}, "
+                f"by PFCOUNT {by_pfcount / views:.2%}"
+            )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.redis_services import (
+    AUTOCOMPLETE_INDEX,
+    AUTOCOMPLETE_MEMBERS_PREFIX,
+    get_redis_connection,
+)
+from blog.utils import update_autocomplete_index
+
+
+class Command(BaseCommand):
+    """
+    Command to build the autocomplete index from scratch.
+    The index is maintained incrementally on post saves, the command is needed for existing data.
+    """
+
+    help = "Rebuilds the autocomplete index of published posts and their authors"
+
+    def handle(self, *args, **options):
+        redis_connection = get_redis_connection()
+        redis_connection.delete(AUTOCOMPLETE_INDEX)
+        for key in redis_connection.scan_iter(match=f"{AUTOCOMPLETE_MEMBERS_PREFIX}*"):
+            redis_connection.delete(key)
+
+        posts = (
+            Post.objects.filter(is_published=True, is_draft=False)
+            .select_related("author")
+            .only("title", "slug", "is_published", "is_draft", "author__username")
+        )
+        count = 0
+        for post in posts.iterator():
+            update_autocomplete_index(post)
+            count += 1
+        self.stdout.write(f"Indexed {count} posts")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from blog.utils import reconcile_post_comments
+
+
+class Command(BaseCommand):
+    """
+    Command to repair comment counters of posts.
+    The counters are maintained by the comment signals, the command fixes drift
+    left by changes that bypass them, such as QuerySet.update() or raw SQL.
+    """
+
+    help = "Recalculates comment counters of posts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of posts updated by one query")
+
+    def handle(self, *args, **options):
+        count = reconcile_post_comments(options["batch_size"])
+        self.stdout.write(f"Fixed {count} posts")
@@ -0,0 +1,13 @@
+from django.db import models
+
+
+class PostManager(models.Manager):
+    """
+    Post manager
+    """
+
+    def get_queryset(self) -> models.QuerySet:
+        """
+        Defers the search vector, it is used only in WHERE clauses of search queries.
+        """
+        return super().get_queryset().defer("search_vector")
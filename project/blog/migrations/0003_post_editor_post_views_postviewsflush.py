@@ -0,0 +1,54 @@
+# Generated by Django 4.2.9 on 2026-10-18 17:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("blog", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostViewsFlush",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("batch_id", models.CharField(max_length=32, unique=True, verbose_name="Пакет")),
+                ("time_create", models.DateTimeField(auto_now_add=True, verbose_name="Время создания")),
+            ],
+            options={
+                "verbose_name": "Сброс просмотров",
+                "verbose_name_plural": "Сбросы просмотров",
+            },
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="editor",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="editor_posts",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Редактор",
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="views",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Просмотры"),
+        ),
+        migrations.AlterField(
+            model_name="post",
+            name="author",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="author_posts",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Автор",
+            ),
+        ),
+    ]
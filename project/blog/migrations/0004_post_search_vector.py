@@ -0,0 +1,54 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:01
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Title is weighted above epigraph above article. HTML tags and entities of the article are stripped.
+CREATE_TRIGGER = """
+CREATE FUNCTION blog_post_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.epigraph, '')), 'B') ||
+        setweight(
+            to_tsvector('russian', regexp_replace(coalesce(NEW.article, ''), '<[^>]*>|&[#a-z0-9]+;', ' ', 'gi')),
+            'C'
+        );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER blog_post_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, epigraph, article ON blog_post
+    FOR EACH ROW EXECUTE FUNCTION blog_post_search_vector_update();
+
+UPDATE blog_post SET title = title;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER blog_post_search_vector_trigger ON blog_post;
+DROP FUNCTION blog_post_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0003_post_editor_post_views_postviewsflush"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="blog_post_search_vector_idx"
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
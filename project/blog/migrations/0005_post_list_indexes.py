@@ -0,0 +1,51 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0004_post_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_draft", False), ("is_pinned", False), ("is_published", True)),
+                fields=["time_update", "id"],
+                name="blog_post_feed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_pinned", True)), fields=["time_create", "id"], name="blog_post_pinned_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_draft", False), ("is_published", False)),
+                fields=["time_update", "id"],
+                name="blog_post_unpublished_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_published", True)),
+                fields=["author", "time_create", "id"],
+                name="blog_post_author_published_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_draft", True)),
+                fields=["author", "time_create", "id"],
+                name="blog_post_author_drafts_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0005_post_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="excerpt",
+            field=models.TextField(blank=True, editable=False, verbose_name="Отрывок"),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+# Counters of existing posts, later they are maintained by the comment signals
+FILL_COUNTERS = """
+UPDATE blog_post
+SET comments_count = comments.count, last_commented_at = comments.last_commented_at
+FROM (
+    SELECT post_id, count(*) AS count, max(time_create) AS last_commented_at
+    FROM comments_comment
+    WHERE is_published
+    GROUP BY post_id
+) AS comments
+WHERE blog_post.id = comments.post_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0006_post_excerpt"),
+        ("comments", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="comments_count",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Комментарии"),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="last_commented_at",
+            field=models.DateTimeField(editable=False, null=True, verbose_name="Последний комментарий"),
+        ),
+        migrations.RunSQL(FILL_COUNTERS, migrations.RunSQL.noop),
+    ]
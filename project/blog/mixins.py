@@ -1,3 +1,20 @@
+from functools import partial
+
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+from .paginators import CursorPaginator, InvalidCursor
+from .redis_services import prefetch_posts_views
+from .utils import cache_anonymous_page, is_page_cacheable
+
+
 class TitleMixin:
     """Add title atribute in view"""
 
@@ -9,3 +26,116 @@ class TitleMixin:
         if self.title:
             context["title"] = self.title
         return context
+
+
+class PostViewsMixin:
+    """Fetch views of all posts on the page with a single Redis call"""
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        """Add views to the posts of the current page"""
+        context = super().get_context_data(**kwargs)
+        prefetch_posts_views(context["object_list"])
+        return context
+
+
+class CursorPaginationMixin:
+    """
+    Paginate list by cursor instead of page number.
+    Views opt in by setting cursor_ordering, for example "-time_update".
+    Links with a page number are still served by the usual paginator.
+    """
+
+    cursor_ordering = ""
+    cursor_paginator_class = CursorPaginator
+
+    def get_cursor_paginator(self, queryset, page_size):
+        """Return the cursor paginator of the list"""
+        return self.cursor_paginator_class(queryset, page_size, self.cursor_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        """Return the page following the "after" cursor or preceding the "before" cursor"""
+        if not self.cursor_ordering or self.page_kwarg in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        try:
+            page = paginator.page(after=self.request.GET.get("after"), before=self.request.GET.get("before"))
+        except InvalidCursor:
+            raise Http404("Неверный курсор")
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+class AnonymousPageCacheMixin:
+    """
+    Cache the whole page for anonymous visitors.
+    Pages of a group are invalidated together, see blog.signals.
+    """
+
+    def get_page_cache_group(self) -> str:
+        """Return the group of the page"""
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        """Return the cached page or render it"""
+        return cache_anonymous_page(
+            request, self.get_page_cache_group(), partial(super().get, request, *args, **kwargs)
+        )
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GET requests of anonymous visitors with 304 Not Modified without rendering the page.
+    Logged in visitors see personalized pages and always get the full response.
+    """
+
+    def get_validators(self) -> tuple[str, int | None] | None:
+        """Return the ETag and the Last-Modified unix time of the page, or None if there is no page"""
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        """Return 304 if the page has not changed since the visitor's copy"""
+        validators = self.get_validators() if is_page_cacheable(request) else None
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        etag = quote_etag(etag)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers["ETag"] = etag
+            if last_modified is not None:
+                response.headers["Last-Modified"] = http_date(last_modified)
+            # Browsers have to revalidate the page instead of guessing how long it stays fresh
+            patch_cache_control(response, no_cache=True)
+            patch_vary_headers(response, ["Cookie"])
+        return response
+
+
+class RequestObjectMixin:
+    """
+    Load the object of a single object view once per request.
+
+    The object is looked up by slug among all objects of the model, so permission mixins can tell
+    a forbidden object from a missing one, and is marked whether it belongs to the view's queryset.
+    A view instance serves a single request, so the object is kept on it.
+    """
+
+    def get_requested_object(self):
+        """Return the object with the slug from the URL, whatever the queryset of the view is"""
+        if not hasattr(self, "_requested_object"):
+            in_view_queryset = Exists(self.get_queryset().filter(pk=OuterRef("pk")))
+            queryset = self.model._default_manager.select_related("author").annotate(in_view_queryset=in_view_queryset)
+            self._requested_object = get_object_or_404(
+                queryset, **{self.get_slug_field(): self.kwargs[self.slug_url_kwarg]}
+            )
+        return self._requested_object
+
+    def get_object(self, queryset=None):
+        """Return the requested object if it belongs to the view's queryset"""
+        if queryset is not None:
+            return super().get_object(queryset)
+        requested_object = self.get_requested_object()
+        if not requested_object.in_view_queryset:
+            raise Http404("Пост не найден")
+        return requested_object
@@ -1,15 +1,22 @@
 from ckeditor_uploader.fields import RichTextUploadingField
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.urls import reverse
 from slugify import slugify
 
 from comments.models import Comment
 
+from .managers import PostManager
 from .redis_services import get_post_views
-from .utils import slug_replacements
+from .utils import make_excerpt, slug_replacements
 
 # Create your models here.
 
+# Text search configuration of Post.search_vector.
+# The vector is built by a trigger, see blog/migrations/0004_post_search_vector.py
+SEARCH_CONFIG = "russian"
+
 
 class Post(models.Model):
     """Post model"""
@@ -20,6 +27,8 @@ class Post(models.Model):
 
     # ckeditor field
     article = RichTextUploadingField(verbose_name="Текст")
+    # Plain text beginning of the article for the post lists, generated on save
+    excerpt = models.TextField(blank=True, editable=False, verbose_name="Отрывок")
 
     author = models.ForeignKey(
         "users.CustomUser", on_delete=models.PROTECT, verbose_name="Автор", related_name="author_posts"
@@ -33,6 +42,12 @@ class Post(models.Model):
     is_draft = models.BooleanField(default=True, verbose_name="Черновик")
     is_published = models.BooleanField(default=False, verbose_name="Опубликовать")
     is_pinned = models.BooleanField(default=False, verbose_name="Закрепить")
+    views = models.PositiveIntegerField(default=0, editable=False, verbose_name="Просмотры")
+    # Published comments, maintained by the comment signals, see blog/signals.py
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Комментарии")
+    last_commented_at = models.DateTimeField(null=True, editable=False, verbose_name="Последний комментарий")
+    search_vector = SearchVectorField(null=True, editable=False)
+    objects = PostManager()
 
     def __str__(self):
         return self.title
@@ -43,18 +58,46 @@ class Post(models.Model):
 
     def get_comments(self):
         """Returns comments"""
-        return Comment.objects.filter(post=self.pk, is_published=True).select_related()
+        return Comment.objects.filter(post=self.pk, is_published=True).select_related("author")
 
     def get_views(self):
         """
-        Rerurns views
+        Rerurns views.
+        Uses the value set by prefetch_posts_views, if there is one.
         """
+        if hasattr(self, "prefetched_views"):
+            return self.prefetched_views
         return get_post_views(self)
 
     def save(self, *args, **kwargs):
-        """Add custom slug"""
+        """
+        Add custom slug.
+
+        The views field is written only by the periodic flush,
+        so saving a stale instance doesn't overwrite flushed views.
+        Comment counters are updated by the comment signals for the same reason.
+        The search vector is maintained by a database trigger.
+        The excerpt is regenerated if the article is loaded.
+        The post is saved in one transaction with the published posts counter of the author.
+        """
         self.slug = slugify(self.title, word_boundary=True, replacements=slug_replacements)
-        return super().save(*args, **kwargs)
+        deferred_fields = self.get_deferred_fields()
+        if "article" not in deferred_fields:
+            self.excerpt = make_excerpt(self.article)
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and "article" in update_fields and "excerpt" not in update_fields:
+                kwargs["update_fields"] = [*update_fields, "excerpt"]
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # Deferred fields are not loaded, so they are not changed either
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in ("views", "search_vector", "comments_count", "last_commented_at")
+                and field.attname not in deferred_fields
+            ]
+        with transaction.atomic():
+            return super().save(*args, **kwargs)
 
     class Meta:
         """Metadata"""
@@ -62,3 +105,51 @@ class Post(models.Model):
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
         ordering = ["-time_create"]
+        # Partial indexes follow the filters and the keyset ordering of the post lists
+        indexes = [
+            GinIndex(fields=["search_vector"], name="blog_post_search_vector_idx"),
+            models.Index(
+                fields=["time_update", "id"],
+                condition=models.Q(is_draft=False, is_published=True, is_pinned=False),
+                name="blog_post_feed_idx",
+            ),
+            models.Index(
+                fields=["time_create", "id"],
+                condition=models.Q(is_pinned=True),
+                name="blog_post_pinned_idx",
+            ),
+            models.Index(
+                fields=["time_update", "id"],
+                condition=models.Q(is_draft=False, is_published=False),
+                name="blog_post_unpublished_idx",
+            ),
+            models.Index(
+                fields=["author", "time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="blog_post_author_published_idx",
+            ),
+            models.Index(
+                fields=["author", "time_create", "id"],
+                condition=models.Q(is_draft=True),
+                name="blog_post_author_drafts_idx",
+            ),
+        ]
+
+
+class PostViewsFlush(models.Model):
+    """
+    Batch of views flushed from Redis to the database.
+    Makes the flush idempotent: a batch is added to the posts only once.
+    """
+
+    batch_id = models.CharField(max_length=32, unique=True, verbose_name="Пакет")
+    time_create = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
+
+    def __str__(self):
+        return self.batch_id
+
+    class Meta:
+        """Metadata"""
+
+        verbose_name = "Сброс просмотров"
+        verbose_name_plural = "Сбросы просмотров"
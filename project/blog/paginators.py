@@ -0,0 +1,190 @@
+import base64
+from datetime import datetime
+
+from django.db import models
+from django.db.models import Func, Value
+
+from .redis_services import get_timeline_items, remove_from_timeline, timeline_exists
+from .utils import rebuild_timeline
+
+
+class Row(Func):
+    """
+    Row constructor, compares several columns at once: (a, b) < (c, d).
+    """
+
+    function = "ROW"
+    output_field = models.Field()
+
+
+class InvalidCursor(Exception):
+    """Cursor can't be decoded"""
+
+
+class CursorPage:
+    """
+    Page of a cursor paginator
+    """
+
+    def __init__(self, object_list: list, paginator: "CursorPaginator", has_next: bool, has_previous: bool):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_other_pages(self) -> bool:
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self) -> str | None:
+        """Cursor of the next page"""
+        return self.paginator.encode_cursor(self.object_list[-1]) if self.object_list else None
+
+    @property
+    def previous_cursor(self) -> str | None:
+        """Cursor of the previous page"""
+        return self.paginator.encode_cursor(self.object_list[0]) if self.object_list else None
+
+
+class CursorPaginator:
+    """
+    Keyset paginator.
+
+    Pages are found by comparing (ordering field, id) with the cursor of the neighbouring page
+    instead of COUNT(*) and OFFSET, so a deep page costs the same as the first one.
+    """
+
+    def __init__(self, object_list: models.QuerySet, per_page: int, ordering: str):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.field = ordering.lstrip("-")
+        self.descending = ordering.startswith("-")
+
+    def encode_cursor(self, instance: models.Model) -> str:
+        """
+        Returns the cursor pointing at the instance
+        """
+        value: datetime = getattr(instance, self.field)
+        return base64.urlsafe_b64encode(f"{value.isoformat()}|{instance.pk}".encode()).decode()
+
+    def decode_cursor(self, cursor: str) -> tuple[datetime, int]:
+        """
+        Returns the ordering field value and the id encoded in the cursor
+        """
+        try:
+            value, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(value), int(pk)
+        except ValueError as error:
+            raise InvalidCursor(cursor) from error
+
+    def get_page_queryset(self, after: str | None = None, before: str | None = None) -> models.QuerySet:
+        """
+        Returns the queryset of the page with one extra row, which tells if there are more pages.
+        Walking backwards reads the rows in the opposite order.
+        """
+        cursor = after if before is None else before
+        descending = self.descending == (before is None)
+        order = "-" if descending else ""
+        queryset = self.object_list.order_by(f"{order}{self.field}", f"{order}pk")
+
+        if cursor is not None:
+            value, pk = self.decode_cursor(cursor)
+            key = Row(self.field, "pk")
+            bound = Row(Value(value), Value(pk))
+            queryset = queryset.alias(cursor_key=key)
+            queryset = queryset.filter(cursor_key__lt=bound) if descending else queryset.filter(cursor_key__gt=bound)
+
+        return queryset[: self.per_page + 1]
+
+    def page(self, after: str | None = None, before: str | None = None) -> CursorPage:
+        """
+        Returns the page following the "after" cursor or preceding the "before" cursor.
+        Without cursors returns the first page.
+        """
+        object_list = list(self.get_page_queryset(after, before))
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+        if before is None:
+            return CursorPage(object_list, self, has_next=has_more, has_previous=after is not None)
+        return CursorPage(object_list[::-1], self, has_next=True, has_previous=has_more)
+
+
+class TimelinePaginator(CursorPaginator):
+    """
+    Cursor paginator of a subscription timeline.
+
+    Ids of the page are taken from the user's timeline in Redis and from the posts of followed authors
+    that are not fanned out, then the posts are loaded with one query.
+    object_list is the queryset the posts are loaded from, ordering must be "-time_create".
+    """
+
+    def __init__(
+        self, object_list: models.QuerySet, per_page: int, ordering: str, user_id: int, pull_authors: list[int]
+    ):
+        super().__init__(object_list, per_page, ordering)
+        self.user_id = user_id
+        self.pull_authors = pull_authors
+
+    def get_candidates(self, after: str | None, before: str | None) -> list[tuple[float, int]]:
+        """
+        Returns (score, id) keys of the posts following the cursor in the walking order, one more than a page.
+        """
+        cursor = after if before is None else before
+        descending = self.descending == (before is None)
+        bound = None
+        if cursor is not None:
+            value, pk = self.decode_cursor(cursor)
+            bound = (value.timestamp(), pk)
+
+        limit = self.per_page + 1
+        # The bound is inclusive, the post of the cursor itself is fetched too
+        items = get_timeline_items(self.user_id, bound and bound[0], descending, limit + 1)
+        if not items and not timeline_exists(self.user_id):
+            rebuild_timeline(self.user_id)
+            items = get_timeline_items(self.user_id, bound and bound[0], descending, limit + 1)
+        candidates = {pk: score for pk, score in items}
+        if self.pull_authors:
+            pulled = self.get_pulled_queryset(after, before)
+            candidates.update((pk, value.timestamp()) for pk, value in pulled.values_list("pk", self.field))
+
+        keys = sorted(((score, pk) for pk, score in candidates.items()), reverse=descending)
+        if bound is not None:
+            keys = [key for key in keys if (key < bound if descending else key > bound)]
+        return keys[:limit]
+
+    def get_pulled_queryset(self, after: str | None, before: str | None) -> models.QuerySet:
+        """
+        Returns the queryset of the page of posts by the followed authors that are not fanned out.
+        """
+        return CursorPaginator(
+            self.object_list.model.objects.filter(author_id__in=self.pull_authors, is_published=True),
+            self.per_page,
+            f"{'-' if self.descending else ''}{self.field}",
+        ).get_page_queryset(after, before)
+
+    def page(self, after: str | None = None, before: str | None = None) -> CursorPage:
+        """
+        Returns the page following the "after" cursor or preceding the "before" cursor.
+        Posts that are no longer published are skipped and removed from the timeline.
+        """
+        keys = self.get_candidates(after, before)
+        has_more = len(keys) > self.per_page
+        ids = [pk for _, pk in keys[: self.per_page]]
+        posts = self.object_list.in_bulk(ids)
+        remove_from_timeline(self.user_id, (pk for pk in ids if pk not in posts))
+        object_list = [posts[pk] for pk in ids if pk in posts]
+        if before is None:
+            return CursorPage(object_list, self, has_next=has_more, has_previous=after is not None)
+        return CursorPage(object_list[::-1], self, has_next=True, has_previous=has_more)
@@ -1,23 +1,637 @@
+import hashlib
+import json
+import time
+import uuid
+from typing import Iterable
+
 import redis
+from django.conf import settings
+
+POST_VIEWS_HASH = "post_views"
+# Views not yet flushed to the database: {post pk: delta}
+POST_VIEWS_PENDING_HASH = "post_views:pending"
+# Batches of deltas taken from the pending hash and being flushed to the database
+POST_VIEWS_BATCHES_SET = "post_views:batches"
+POST_VIEWS_BATCH_PREFIX = "post_views:batch:"
+
+# Search results cache. Entries of older generations are never read again and expire or get evicted.
+SEARCH_GENERATION_KEY = "search:generation"
+SEARCH_LRU_KEY = "search:lru"
+SEARCH_PAGE_PREFIX = "search:page:"
+
+# Autocomplete prefix index. All members have score 0 and are ordered lexicographically:
+# "<term>\x00<kind>\x00<url>\x00<label>", where term is a suffix of the label starting at a word.
+AUTOCOMPLETE_INDEX = "autocomplete:index"
+AUTOCOMPLETE_MEMBERS_PREFIX = "autocomplete:members:"
+AUTOCOMPLETE_TERM_LENGTH = 50
+
+# Full-page cache for anonymous visitors. Pages are grouped by what they show, a change bumps
+# the generation of the affected groups, so their older pages are never read again and expire.
+PAGE_CACHE_PREFIX = "page:"
+PAGE_GENERATION_PREFIX = "page:generation:"
+# Unix time of the last invalidation of a group, the Last-Modified of its pages
+PAGE_MODIFIED_PREFIX = "page:modified:"
+
+# Subscription timelines: sorted sets {post id: creation time} with the newest posts of followed authors.
+# Posts are fanned out on publishing, except for authors with large audiences, whose posts are read
+# from the database when a timeline is shown.
+TIMELINE_PREFIX = "timeline:"
+TIMELINE_PULL_AUTHORS_SET = "timeline:pull_authors"
+
+# Ids of the authors a user follows, cached from the subscriptions table.
+# The marker member is always added, so that a user without subscriptions is cached too.
+SUBSCRIPTIONS_PREFIX = "subscriptions:"
+SUBSCRIPTIONS_LOADED_MARKER = 0
+
+# Trending posts are ranked by views with forward decay: a view adds 2 ** ((time - epoch) / half-life)
+# to the post's score, so newer views weigh more and the ranking doesn't need old views to be subtracted.
+# Epochs are aligned to the time and the scores are rescaled to the current epoch periodically,
+# see TRENDING_WINDOWS in neuron/settings.py for the half-lives of the windows.
+TRENDING_PREFIX = "trending:"
+TRENDING_EPOCHS_HASH = "trending:epochs"
+TRENDING_EPOCHS_PER_HALF_LIFE = 6
+
+_connection_pool: redis.ConnectionPool | None = None
+
+
+def get_connection_pool() -> redis.ConnectionPool:
+    """
+    Returns the process-wide connection pool.
+
+    The pool is created lazily on first use, so uWSGI workers and Celery processes
+    forked from the master create their own sockets. redis-py also checks the pid
+    on every checkout and resets the pool if it is used from a forked child.
+    """
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = redis.ConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        )
+    return _connection_pool
+
+
+def reset_connection_pool() -> None:
+    """
+    Closes the connections of the pool, the next call creates a new pool.
+    """
+    global _connection_pool
+    if _connection_pool is not None:
+        _connection_pool.disconnect()
+        _connection_pool = None
+
+
+def get_redis_connection() -> redis.Redis:
+    """
+    Returns a client that borrows connections from the shared pool.
+    """
+    return redis.Redis(connection_pool=get_connection_pool())
+
+
+def get_post_views_key(post: "Post") -> str:
+    """
+    Returns the field name of the post in the views hash.
+    """
+    return f"{post._meta.model_name}:{post.pk}:views"
+
 
-redis_db = 1
+def increase_post_views(post: "Post", views: int = 1) -> None:
+    """
+    Increases the number of views by the given number, 1 by default.
+    If there are no views yet, it creates a key for the post and sets the value to the number.
+    The views are also added to the pending deltas, which are flushed to the database periodically.
+    """
+    increase_posts_views([post], views)
 
 
-def increase_post_views(post: "Post") -> None:
+def get_post_viewers_key(post: "Post") -> str:
     """
-    Increases the number of views by 1.
-    If there are no views yet, it creates a key for the post and sets the value to 1.
+    Returns the key of the HyperLogLog with the visitors of the post.
+    """
+    return f"{post._meta.model_name}:{post.pk}:viewers"
+
+
+def register_post_view(post: "Post", visitor_id: str) -> bool:
+    """
+    Adds the visitor to the post's HyperLogLog and increases the number of views
+    by the growth of its estimated cardinality.
+    Returns True if any views were counted.
+
+    HyperLogLog keeps about 12 KB per post however many visitors it has, the price is
+    that the views follow its estimate with a standard error of 0.81%. The reply of PFADD
+    is not used: it is 1 only when a register of the HyperLogLog changed, which gets rare
+    as the audience grows, so most new visitors of a popular post would not be counted.
     """
-    key = f"{post._meta.model_name}:{post.pk}:views"
-    with redis.Redis(host="redis", port=6379, db=redis_db) as redis_connect:
-        redis_connect.hincrby("post_views", key, 1)
+    key = get_post_viewers_key(post)
+    with get_redis_connection().pipeline() as pipe:
+        pipe.pfcount(key)
+        pipe.pfadd(key, visitor_id)
+        pipe.pfcount(key)
+        before, _, after = pipe.execute()
+    if after <= before:
+        return False
+    increase_post_views(post, after - before)
+    return True
 
 
 def get_post_views(post: "Post") -> str:
     """
     Returns the number of views for a post.
     """
-    key = f"{post._meta.model_name}:{post.pk}:views"
-    with redis.Redis(host="redis", port=6379, db=redis_db) as redis_connect:
-        views: bytes = redis_connect.hget("post_views", key)
+    views: bytes | None = get_redis_connection().hget(POST_VIEWS_HASH, get_post_views_key(post))
     return views.decode() if views is not None else "0"
+
+
+def increase_posts_views(posts: Iterable["Post"], views: int = 1) -> None:
+    """
+    Increases the number of views by the given number, 1 by default, for each post
+    in a single pipelined round trip.
+    The views also raise the scores of the posts in the trending windows.
+    """
+    now = time.time()
+    increments = {
+        get_trending_key(window): get_trending_increment(half_life, now)
+        for window, half_life in settings.TRENDING_WINDOWS.items()
+    }
+    with get_redis_connection().pipeline() as pipe:
+        for post in posts:
+            pipe.hincrby(POST_VIEWS_HASH, get_post_views_key(post), views)
+            pipe.hincrby(POST_VIEWS_PENDING_HASH, post.pk, views)
+            for key, increment in increments.items():
+                pipe.zincrby(key, increment * views, post.pk)
+        pipe.execute()
+
+
+def get_posts_views(posts: Iterable["Post"]) -> dict[int, str]:
+    """
+    Returns the number of views for each post, keyed by post pk, with a single HMGET.
+    """
+    posts = list(posts)
+    if not posts:
+        return {}
+    keys = [get_post_views_key(post) for post in posts]
+    values: list[bytes | None] = get_redis_connection().hmget(POST_VIEWS_HASH, keys)
+    return {post.pk: value.decode() if value is not None else "0" for post, value in zip(posts, values)}
+
+
+def prefetch_posts_views(posts: Iterable["Post"]) -> None:
+    """
+    Fetches views for all posts with a single HMGET and stores them on the post objects,
+    so that Post.get_views doesn't make a Redis call for each post.
+    """
+    posts = list(posts)
+    views = get_posts_views(posts)
+    for post in posts:
+        post.prefetched_views = views[post.pk]
+
+
+def get_views_batch_key(batch_id: str) -> str:
+    """
+    Returns the key of the hash with the deltas of a batch.
+    """
+    return f"{POST_VIEWS_BATCH_PREFIX}{batch_id}"
+
+
+def rotate_pending_views() -> list[str]:
+    """
+    Atomically moves the pending deltas into a new batch and returns ids of all batches
+    that have not been flushed yet, including batches left over by a crashed flush.
+
+    Views counted after the rotation go to a fresh pending hash.
+    """
+    batch_id = uuid.uuid4().hex
+    with get_redis_connection().pipeline() as pipe:
+        pipe.sadd(POST_VIEWS_BATCHES_SET, batch_id)
+        # Fails if there are no pending views, the batch then stays empty.
+        pipe.rename(POST_VIEWS_PENDING_HASH, get_views_batch_key(batch_id))
+        pipe.smembers(POST_VIEWS_BATCHES_SET)
+        *_, batch_ids = pipe.execute(raise_on_error=False)
+    return sorted(batch_id.decode() for batch_id in batch_ids)
+
+
+def get_views_batch(batch_id: str) -> dict[int, int]:
+    """
+    Returns the deltas of a batch: {post pk: number of views}.
+    """
+    deltas: dict[bytes, bytes] = get_redis_connection().hgetall(get_views_batch_key(batch_id))
+    return {int(pk): int(delta) for pk, delta in deltas.items()}
+
+
+def delete_views_batch(batch_id: str) -> None:
+    """
+    Deletes a flushed batch.
+    """
+    with get_redis_connection().pipeline() as pipe:
+        pipe.delete(get_views_batch_key(batch_id))
+        pipe.srem(POST_VIEWS_BATCHES_SET, batch_id)
+        pipe.execute()
+
+
+def get_search_generation() -> int:
+    """
+    Returns the current generation of the search cache.
+    """
+    generation: bytes | None = get_redis_connection().get(SEARCH_GENERATION_KEY)
+    return int(generation) if generation is not None else 0
+
+
+def bump_search_generation() -> None:
+    """
+    Invalidates all cached search results.
+    """
+    get_redis_connection().incr(SEARCH_GENERATION_KEY)
+
+
+def get_search_page_key(generation: int, text: str, page_number: int) -> str:
+    """
+    Returns the key of a cached search results page.
+    """
+    text_hash = hashlib.sha1(text.encode()).hexdigest()
+    return f"{SEARCH_PAGE_PREFIX}{generation}:{text_hash}:{page_number}"
+
+
+def get_cached_search_page(generation: int, text: str, page_number: int) -> tuple[list[int], int] | None:
+    """
+    Returns post ids of the page and the total number of results, or None if the page is not cached.
+    """
+    key = get_search_page_key(generation, text, page_number)
+    with get_redis_connection().pipeline(transaction=False) as pipe:
+        pipe.get(key)
+        pipe.zadd(SEARCH_LRU_KEY, {key: time.time()}, xx=True)
+        value, _ = pipe.execute()
+    if value is None:
+        return None
+    data = json.loads(value)
+    return data["ids"], data["count"]
+
+
+def set_cached_search_page(generation: int, text: str, page_number: int, ids: list[int], count: int) -> None:
+    """
+    Caches post ids of the page and the total number of results.
+    Evicts the least recently used pages when there are more than SEARCH_CACHE_MAX_ENTRIES.
+    """
+    redis_connection = get_redis_connection()
+    key = get_search_page_key(generation, text, page_number)
+    with redis_connection.pipeline(transaction=False) as pipe:
+        pipe.set(key, json.dumps({"ids": ids, "count": count}), ex=settings.SEARCH_CACHE_TTL)
+        pipe.zadd(SEARCH_LRU_KEY, {key: time.time()})
+        pipe.zcard(SEARCH_LRU_KEY)
+        *_, entries = pipe.execute()
+    if entries > settings.SEARCH_CACHE_MAX_ENTRIES:
+        evicted = redis_connection.zpopmin(SEARCH_LRU_KEY, entries - settings.SEARCH_CACHE_MAX_ENTRIES)
+        redis_connection.delete(*[evicted_key for evicted_key, _ in evicted])
+
+
+def normalize_autocomplete_text(text: str) -> str:
+    """
+    Returns text in the form it is stored in the autocomplete index.
+    """
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+def index_autocomplete_item(kind: str, item_id: int, label: str, url: str) -> None:
+    """
+    Adds or replaces an item in the autocomplete index.
+    Every word of the label starts a term, so the item is found by a prefix of any of its words.
+    """
+    words = normalize_autocomplete_text(label).split(" ")
+    terms = {" ".join(words[start:])[:AUTOCOMPLETE_TERM_LENGTH] for start in range(len(words))}
+    members = {f"{term}\x00{kind}\x00{url}\x00{label}": 0 for term in terms if term}
+    members_key = f"{AUTOCOMPLETE_MEMBERS_PREFIX}{kind}:{item_id}"
+
+    redis_connection = get_redis_connection()
+    old_members: set[bytes] = redis_connection.smembers(members_key)
+    with redis_connection.pipeline() as pipe:
+        if old_members:
+            pipe.zrem(AUTOCOMPLETE_INDEX, *old_members)
+        pipe.delete(members_key)
+        if members:
+            pipe.zadd(AUTOCOMPLETE_INDEX, members)
+            pipe.sadd(members_key, *members)
+        pipe.execute()
+
+
+def remove_autocomplete_item(kind: str, item_id: int) -> None:
+    """
+    Removes an item from the autocomplete index.
+    """
+    members_key = f"{AUTOCOMPLETE_MEMBERS_PREFIX}{kind}:{item_id}"
+    redis_connection = get_redis_connection()
+    old_members: set[bytes] = redis_connection.smembers(members_key)
+    if old_members:
+        with redis_connection.pipeline() as pipe:
+            pipe.zrem(AUTOCOMPLETE_INDEX, *old_members)
+            pipe.delete(members_key)
+            pipe.execute()
+
+
+def get_autocomplete_items(prefix: str, limit: int) -> list[dict[str, str]]:
+    """
+    Returns up to limit items with a word starting with prefix, ordered by the matched term.
+    """
+    prefix = normalize_autocomplete_text(prefix)[:AUTOCOMPLETE_TERM_LENGTH]
+    if not prefix:
+        return []
+    # An item can match by several words, fetch more members to fill the limit after deduplication
+    # 0xFF never occurs in UTF-8, so it sorts after every term starting with the prefix
+    min_member = b"[" + prefix.encode()
+    members: list[bytes] = get_redis_connection().zrangebylex(
+        AUTOCOMPLETE_INDEX, min_member, min_member + b"\xff", start=0, num=limit * 3
+    )
+    items: dict[str, dict[str, str]] = {}
+    for member in members:
+        _, kind, url, label = member.decode().split("\x00")
+        items.setdefault(url, {"type": kind, "label": label, "url": url})
+    return list(items.values())[:limit]
+
+
+def get_page_cache_key(group: str, generation: int, path: str) -> str:
+    """
+    Returns the key of a cached page.
+    """
+    path_hash = hashlib.sha1(path.encode()).hexdigest()
+    return f"{PAGE_CACHE_PREFIX}{group}:{generation}:{path_hash}"
+
+
+def get_cached_page(group: str, path: str) -> tuple[int, bytes | None]:
+    """
+    Returns the current generation of the group and the cached page, or None if the page is not cached.
+    """
+    redis_connection = get_redis_connection()
+    generation: bytes | None = redis_connection.get(f"{PAGE_GENERATION_PREFIX}{group}")
+    generation = int(generation) if generation is not None else 0
+    return generation, redis_connection.get(get_page_cache_key(group, generation, path))
+
+
+def set_cached_page(group: str, generation: int, path: str, content: bytes) -> None:
+    """
+    Caches the page rendered for the given generation of the group.
+    If the group has been invalidated since, the page is stored under the old generation and never read.
+    """
+    get_redis_connection().set(get_page_cache_key(group, generation, path), content, ex=settings.PAGE_CACHE_TTL)
+
+
+def invalidate_cached_pages(*groups: str) -> None:
+    """
+    Invalidates all cached pages of the groups.
+    """
+    now = int(time.time())
+    with get_redis_connection().pipeline(transaction=False) as pipe:
+        for group in groups:
+            pipe.incr(f"{PAGE_GENERATION_PREFIX}{group}")
+            pipe.set(f"{PAGE_MODIFIED_PREFIX}{group}", now)
+        pipe.execute()
+
+
+def get_page_group_state(group: str) -> tuple[int, int | None]:
+    """
+    Returns the generation of the group and the time it was last invalidated, if it ever was.
+    """
+    generation, modified = get_redis_connection().mget(
+        f"{PAGE_GENERATION_PREFIX}{group}", f"{PAGE_MODIFIED_PREFIX}{group}"
+    )
+    return int(generation) if generation is not None else 0, int(modified) if modified is not None else None
+
+
+def get_comments_version_key(post_id: int) -> str:
+    """
+    Returns the key of the version of the post's comments.
+    """
+    return f"post:{post_id}:comments_version"
+
+
+def get_comments_modified_key(post_id: int) -> str:
+    """
+    Returns the key of the time the post's comments last changed.
+    """
+    return f"post:{post_id}:comments_modified"
+
+
+def get_comments_version(post: "Post") -> int:
+    """
+    Returns the version of the post's comments, it changes whenever the comments do.
+    """
+    version: bytes | None = get_redis_connection().get(get_comments_version_key(post.pk))
+    return int(version) if version is not None else 0
+
+
+def bump_comments_version(post_id: int) -> None:
+    """
+    Changes the version of the post's comments and remembers the time of the change.
+    """
+    with get_redis_connection().pipeline(transaction=False) as pipe:
+        pipe.incr(get_comments_version_key(post_id))
+        pipe.set(get_comments_modified_key(post_id), int(time.time()))
+        pipe.execute()
+
+
+def get_comments_state(post_id: int) -> tuple[int, int | None]:
+    """
+    Returns the version of the post's comments and the time they last changed, if they ever did.
+    """
+    version, modified = get_redis_connection().mget(
+        get_comments_version_key(post_id), get_comments_modified_key(post_id)
+    )
+    return int(version) if version is not None else 0, int(modified) if modified is not None else None
+
+
+def get_timeline_key(user_id: int) -> str:
+    """
+    Returns the key of the user's subscription timeline.
+    """
+    return f"{TIMELINE_PREFIX}{user_id}"
+
+
+def add_to_timelines(user_ids: Iterable[int], items: dict[int, float], create: bool = False) -> None:
+    """
+    Adds posts with their scores to timelines of the users, only the newest posts are kept.
+    Timelines that have not been built are skipped unless create is True: a timeline holding
+    only the new posts would look built and never be rebuilt with the earlier ones.
+    """
+    redis_connection = get_redis_connection()
+    keys = [get_timeline_key(user_id) for user_id in user_ids]
+    if not create:
+        with redis_connection.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.exists(key)
+            keys = [key for key, exists in zip(keys, pipe.execute()) if exists]
+    if not keys:
+        return
+    with redis_connection.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.zadd(key, items)
+            pipe.zremrangebyrank(key, 0, -settings.TIMELINE_MAX_LENGTH - 1)
+        pipe.execute()
+
+
+def remove_from_timeline(user_id: int, post_ids: Iterable[int]) -> None:
+    """
+    Removes posts from the user's timeline.
+    """
+    post_ids = list(post_ids)
+    if post_ids:
+        get_redis_connection().zrem(get_timeline_key(user_id), *post_ids)
+
+
+def timeline_exists(user_id: int) -> bool:
+    """
+    Checks if the user's timeline has been built.
+    """
+    return bool(get_redis_connection().exists(get_timeline_key(user_id)))
+
+
+def get_timeline_items(user_id: int, bound: float | None, descending: bool, limit: int) -> list[tuple[int, float]]:
+    """
+    Returns up to limit (post id, score) pairs of the timeline, starting from the bound score inclusive.
+    Descending order walks from newer posts to older ones.
+    """
+    redis_connection = get_redis_connection()
+    key = get_timeline_key(user_id)
+    if descending:
+        max_score = "+inf" if bound is None else bound
+        items = redis_connection.zrevrangebyscore(key, max_score, "-inf", start=0, num=limit, withscores=True)
+    else:
+        min_score = "-inf" if bound is None else bound
+        items = redis_connection.zrangebyscore(key, min_score, "+inf", start=0, num=limit, withscores=True)
+    return [(int(member), score) for member, score in items]
+
+
+def add_timeline_pull_author(author_id: int) -> None:
+    """
+    Marks the author as one whose posts are not fanned out.
+    """
+    get_redis_connection().sadd(TIMELINE_PULL_AUTHORS_SET, author_id)
+
+
+def get_timeline_pull_authors() -> set[int]:
+    """
+    Returns ids of the authors whose posts are read from the database.
+    """
+    return {int(author_id) for author_id in get_redis_connection().smembers(TIMELINE_PULL_AUTHORS_SET)}
+
+
+def get_subscriptions_key(user_id: int) -> str:
+    """
+    Returns the key of the cached subscriptions of the user.
+    """
+    return f"{SUBSCRIPTIONS_PREFIX}{user_id}"
+
+
+def get_cached_subscription_ids(user_id: int) -> set[int] | None:
+    """
+    Returns ids of the authors the user follows, or None if they are not cached.
+    """
+    members: set[bytes] = get_redis_connection().smembers(get_subscriptions_key(user_id))
+    if not members:
+        return None
+    return {int(member) for member in members} - {SUBSCRIPTIONS_LOADED_MARKER}
+
+
+def is_cached_subscription(user_id: int, author_id: int) -> bool | None:
+    """
+    Checks if the user follows the author, returns None if subscriptions of the user are not cached.
+    """
+    loaded, subscribed = get_redis_connection().smismember(
+        get_subscriptions_key(user_id), [SUBSCRIPTIONS_LOADED_MARKER, author_id]
+    )
+    if not loaded:
+        return None
+    return bool(subscribed)
+
+
+def cache_subscription_ids(user_id: int, author_ids: Iterable[int]) -> None:
+    """
+    Caches ids of the authors the user follows.
+    """
+    key = get_subscriptions_key(user_id)
+    with get_redis_connection().pipeline() as pipe:
+        pipe.delete(key)
+        pipe.sadd(key, SUBSCRIPTIONS_LOADED_MARKER, *author_ids)
+        pipe.expire(key, settings.SUBSCRIPTIONS_CACHE_TTL)
+        pipe.execute()
+
+
+def delete_cached_subscription_ids(*user_ids: int) -> None:
+    """
+    Removes cached subscriptions of the users, they are loaded from the database again.
+    """
+    if user_ids:
+        get_redis_connection().delete(*(get_subscriptions_key(user_id) for user_id in user_ids))
+
+
+def get_trending_key(window: str) -> str:
+    """
+    Returns the key of the sorted set with trending posts of the window.
+    """
+    return f"{TRENDING_PREFIX}{window}"
+
+
+def get_trending_epoch(half_life: int, now: float) -> float:
+    """
+    Returns the start of the current epoch of a window, the scores of the window are relative to it.
+    Epochs are computed from the time, so counting a view doesn't read anything from Redis.
+    """
+    step = half_life / TRENDING_EPOCHS_PER_HALF_LIFE
+    return now // step * step
+
+
+def get_trending_increment(half_life: int, now: float) -> float:
+    """
+    Returns the weight of a view made now.
+    """
+    return 2 ** ((now - get_trending_epoch(half_life, now)) / half_life)
+
+
+def renormalize_trending_posts(now: float | None = None) -> None:
+    """
+    Rescales scores of the windows whose epoch has ended to the current epoch,
+    drops posts with negligible scores and keeps only the top posts.
+
+    Views counted between the end of the epoch and the rescaling are rescaled too,
+    which underweights them by at most 2 ** (-1 / TRENDING_EPOCHS_PER_HALF_LIFE).
+    The epochs hash is watched, so concurrent runs don't rescale a window twice.
+    """
+    now = time.time() if now is None else now
+    with get_redis_connection().pipeline() as pipe:
+        for window, half_life in settings.TRENDING_WINDOWS.items():
+            key = get_trending_key(window)
+            epoch = get_trending_epoch(half_life, now)
+            try:
+                pipe.watch(TRENDING_EPOCHS_HASH)
+                saved_epoch = pipe.hget(TRENDING_EPOCHS_HASH, window)
+                if saved_epoch is not None and float(saved_epoch) >= epoch:
+                    pipe.unwatch()
+                    continue
+                pipe.multi()
+                if saved_epoch is not None:
+                    pipe.zunionstore(key, {key: 2 ** ((float(saved_epoch) - epoch) / half_life)})
+                pipe.zremrangebyscore(key, "-inf", f"({settings.TRENDING_MIN_SCORE}")
+                pipe.zremrangebyrank(key, 0, -settings.TRENDING_MAX_POSTS - 1)
+                pipe.hset(TRENDING_EPOCHS_HASH, window, epoch)
+                pipe.execute()
+            except redis.WatchError:
+                continue
+            finally:
+                pipe.reset()
+
+
+def get_trending_post_ids(window: str, limit: int) -> list[int]:
+    """
+    Returns ids of the posts with the highest scores in the window.
+    """
+    return [int(post_id) for post_id in get_redis_connection().zrevrange(get_trending_key(window), 0, limit - 1)]
+
+
+def remove_trending_post(post_id: int) -> None:
+    """
+    Removes a deleted post from the trending windows.
+    """
+    with get_redis_connection().pipeline() as pipe:
+        for window in settings.TRENDING_WINDOWS:
+            pipe.zrem(get_trending_key(window), post_id)
+        pipe.execute()
@@ -0,0 +1,181 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from comments.models import Comment
+from users.models import CustomUser
+from users.utils import update_user_counters
+
+from .models import Post
+from .redis_services import (
+    bump_comments_version,
+    bump_search_generation,
+    invalidate_cached_pages,
+    remove_autocomplete_item,
+    remove_trending_post,
+)
+from .tasks import fan_out_post_task
+from .utils import (
+    HOME_PAGE_GROUP,
+    add_post_comment,
+    get_author_page_group,
+    get_post_page_group,
+    remove_post_comment,
+    update_autocomplete_index,
+)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def handle_post_change(sender, instance: Post, **kwargs):
+    """
+    Invalidates cached search results when a post is created, edited, published, unpublished or deleted.
+    The generation is bumped after the commit, otherwise a search running before it
+    would cache the old results under the new generation.
+    """
+    transaction.on_commit(bump_search_generation)
+
+
+@receiver(post_save, sender=Post)
+def handle_post_save(sender, instance: Post, **kwargs):
+    """
+    Keeps the autocomplete index up to date when a post is published, unpublished or renamed.
+    """
+    update_autocomplete_index(instance)
+
+
+@receiver(post_delete, sender=Post)
+def handle_post_delete(sender, instance: Post, **kwargs):
+    """
+    Removes a deleted post from the autocomplete index and the trending posts.
+    """
+    remove_autocomplete_item("post", instance.pk)
+    remove_trending_post(instance.pk)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_public_state(sender, instance: Post, **kwargs):
+    """
+    Remembers the slug, the publication and the author of the saved post,
+    pages with the post as it was before have to be invalidated too and the author's counters updated.
+    """
+    instance._saved_public_state = (
+        Post.objects.filter(pk=instance.pk).values_list("slug", "is_published", "author__username", "author_id").first()
+        if instance.pk is not None
+        else None
+    )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance: Post, **kwargs):
+    """
+    Invalidates cached pages showing the post when it is published, unpublished, edited, pinned or deleted.
+    Posts that are not published neither before nor after the change are not shown on cached pages.
+    The pages are invalidated after the commit, otherwise a request running before it
+    would cache the page with the old post again.
+    """
+    states = [(instance.slug, instance.is_published, instance.author.username)]
+    if saved_state := getattr(instance, "_saved_public_state", None):
+        states.append(saved_state[:3])
+    groups = set()
+    for slug, is_published, username in states:
+        groups.add(get_post_page_group(slug))
+        if is_published:
+            groups.update((HOME_PAGE_GROUP, get_author_page_group(username)))
+    if any(is_published for _, is_published, _ in states):
+        transaction.on_commit(partial(invalidate_cached_pages, *groups))
+
+
+@receiver(post_save, sender=Post)
+def handle_post_publication(sender, instance: Post, **kwargs):
+    """
+    Updates published posts counters of the author when a post is published or unpublished.
+    A published post is fanned out to subscription timelines after the transaction commits,
+    whatever published it: the staff form, the admin or a plain save().
+    """
+    saved_state = getattr(instance, "_saved_public_state", None)
+    saved_author_id, was_published = (saved_state[3], saved_state[1]) if saved_state else (None, False)
+    if (saved_author_id, was_published) == (instance.author_id, instance.is_published):
+        return
+    if was_published:
+        update_user_counters([saved_author_id], published_posts_count=-1)
+    if instance.is_published:
+        update_user_counters([instance.author_id], published_posts_count=1)
+        transaction.on_commit(partial(fan_out_post_task.delay, instance.pk))
+
+
+@receiver(post_delete, sender=Post)
+def handle_published_post_delete(sender, instance: Post, **kwargs):
+    """
+    Updates published posts counter of the author when a published post is deleted.
+    """
+    if instance.is_published:
+        update_user_counters([instance.author_id], published_posts_count=-1)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_state(sender, instance: Comment, **kwargs):
+    """
+    Remembers the post and the publication of the saved comment to update the comment counters.
+    """
+    instance._saved_counted_state = (
+        Comment.objects.filter(pk=instance.pk).values_list("post_id", "is_published").first()
+        if instance.pk is not None
+        else None
+    )
+
+
+@receiver(post_save, sender=Comment)
+def handle_comment_save(sender, instance: Comment, **kwargs):
+    """
+    Updates comment counters of the post when a comment is added or (un)published.
+    Only published comments are counted.
+    """
+    saved_state = getattr(instance, "_saved_counted_state", None) or (instance.post_id, False)
+    new_state = (instance.post_id, instance.is_published)
+    instance._counters_changed = saved_state != new_state and (saved_state[1] or new_state[1])
+    if not instance._counters_changed:
+        return
+    if saved_state[1]:
+        remove_post_comment(saved_state[0])
+    if new_state[1]:
+        add_post_comment(instance.post_id, instance.time_create)
+
+
+@receiver(post_delete, sender=Comment)
+def handle_comment_delete(sender, instance: Comment, **kwargs):
+    """
+    Updates comment counters of the post when a published comment is deleted.
+    """
+    instance._counters_changed = instance.is_published
+    if instance.is_published:
+        remove_post_comment(instance.post_id)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance: Comment, **kwargs):
+    """
+    Invalidates cached pages and the comment list of the post when a comment is added, (un)published or deleted.
+    Lists of published posts show comment counters, so they are invalidated when the counters change.
+    """
+    transaction.on_commit(partial(bump_comments_version, instance.post_id))
+    post = instance.post
+    groups = [get_post_page_group(post.slug)]
+    if post.is_published and getattr(instance, "_counters_changed", False):
+        groups += [HOME_PAGE_GROUP, get_author_page_group(post.author.username)]
+    transaction.on_commit(partial(invalidate_cached_pages, *groups))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_pages(sender, instance: CustomUser, update_fields=None, **kwargs):
+    """
+    Invalidates cached lists showing the author's name and photo when the profile is edited.
+    Logins update only the last login time, which is not shown.
+    """
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    transaction.on_commit(partial(invalidate_cached_pages, HOME_PAGE_GROUP, get_author_page_group(instance.username)))
@@ -1,6 +1,9 @@
 from celery import shared_task
 
+from .redis_services import renormalize_trending_posts
 from .utils import (
+    fan_out_post,
+    flush_post_views,
     send_feedback,
     send_mail_your_post_has_been_published,
     send_mail_your_post_has_been_returned,
@@ -29,3 +32,27 @@ def send_feedback_task(data):
     The task is processed in blog/views.py contact
     """
     send_feedback(data)
+
+
+@shared_task
+def flush_post_views_task():
+    """
+    The task is scheduled by Celery beat, see CELERY_BEAT_SCHEDULE in neuron/settings.py
+    """
+    flush_post_views()
+
+
+@shared_task
+def fan_out_post_task(post_id):
+    """
+    The task is processed in blog/signals.py handle_post_publication
+    """
+    fan_out_post(post_id)
+
+
+@shared_task
+def renormalize_trending_posts_task():
+    """
+    The task is scheduled by Celery beat, see CELERY_BEAT_SCHEDULE in neuron/settings.py
+    """
+    renormalize_trending_posts()
@@ -1,10 +1,14 @@
 from django import template
 
+from blog.paginators import CursorPage
+from blog.redis_services import get_comments_version
+
 register = template.Library()
 
 navigation_menu = [
     {"title": "Главная", "url_name": "home"},
     {"title": "Подписки", "url_name": "subscriptions"},
+    {"title": "Популярное", "url_name": "popular"},
     {"title": "Обо мне", "url_name": "about"},
     {"title": "Галлерея", "url_name": "gallery"},
     {"title": "Контакты", "url_name": "contact"},
@@ -18,10 +22,30 @@ def navigation(user):
     return {"navigation_menu": navigation_menu, "user": user}
 
 
-@register.inclusion_tag("blog/tags_templates/pagination.html")
-def pagination(paginator, page_obj):
-    """Inser pagination in template"""
-    return {"page_obj": page_obj, "paginator": paginator}
+@register.inclusion_tag("blog/tags_templates/pagination.html", takes_context=True)
+def pagination(context, paginator, page_obj):
+    """
+    Inser pagination in template.
+    Keeps the other query parameters, such as the search text, in page links.
+    Pages of a cursor paginator are linked by cursors instead of numbers.
+    """
+    query = context["request"].GET.copy()
+    for parameter in ("page", "after", "before"):
+        query.pop(parameter, None)
+    return {
+        "page_obj": page_obj,
+        "paginator": paginator,
+        "query": query.urlencode(),
+        "cursor": isinstance(page_obj, CursorPage),
+    }
+
+
+@register.simple_tag
+def comments_version(post) -> int:
+    """
+    Returns the version of the post's comments for the cache key of the comment list.
+    """
+    return get_comments_version(post)
 
 
 @register.inclusion_tag("blog/tags_templates/author_buttons_for_drafts.html", takes_context=True)
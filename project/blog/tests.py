@@ -1,25 +1,79 @@
+from io import StringIO
 from unittest.mock import patch
 
+import redis
 from django.conf import settings
-from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.postgres.search import SearchQuery
 from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
 from django.http import HttpResponse
 from django.shortcuts import reverse
 from django.template.loader import render_to_string
 from django.template.response import TemplateResponse
-from django.test import RequestFactory, TestCase
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from slugify import slugify
 
-from blog.models import Post
+from blog.models import SEARCH_CONFIG, Post, PostViewsFlush
+from comments.models import Comment
 from users.models import CustomUser
+from users.views import AuthorPosts
 
 from .forms import FeedbackForm, SearchForm
+from .paginators import CursorPaginator, TimelinePaginator
+from .redis_services import (
+    POST_VIEWS_BATCHES_SET,
+    POST_VIEWS_HASH,
+    POST_VIEWS_PENDING_HASH,
+    TIMELINE_PREFIX,
+    TRENDING_PREFIX,
+    bump_search_generation,
+    delete_cached_subscription_ids,
+    get_cached_search_page,
+    get_comments_version,
+    get_connection_pool,
+    get_post_viewers_key,
+    get_post_views,
+    get_post_views_key,
+    get_posts_views,
+    get_redis_connection,
+    get_search_generation,
+    get_timeline_key,
+    get_timeline_pull_authors,
+    get_trending_key,
+    get_trending_post_ids,
+    increase_post_views,
+    increase_posts_views,
+    invalidate_cached_pages,
+    register_post_view,
+    renormalize_trending_posts,
+    set_cached_search_page,
+    timeline_exists,
+)
 from .utils import (
+    EXCERPT_WORDS,
+    HOME_PAGE_GROUP,
+    fan_out_post,
+    flush_post_views,
+    get_author_page_group,
+    get_post_page_group,
+    make_excerpt,
+    rebuild_timeline,
     send_feedback,
     send_mail_your_post_has_been_published,
     send_mail_your_post_has_been_returned,
 )
-from .views import SubscriptionsView, contact, search
+from .views import (
+    SEARCH_HEADLINE_MAX_WORDS,
+    VISITOR_ID_COOKIE,
+    DraftPostsView,
+    IndexView,
+    SubscriptionsView,
+    UnpublishedPostsView,
+    contact,
+)
 
 # Create your tests here.
 
@@ -52,9 +106,12 @@ class CreateTestUsersAndPostsMixin:
     @classmethod
     def setUpTestData(cls):
         """
-        Create users and posts from class's data
+        Create users and posts from class's data.
+        The test Redis database is emptied first, the database rollback doesn't reach
+        the pages and counters cached by the previous tests.
         """
 
+        get_redis_connection().flushdb()
         cls.test_users = [None]
         cls.test_posts = []
 
@@ -68,6 +125,17 @@ class CreateTestUsersAndPostsMixin:
             cls.test_posts.append(post)
 
 
+def delete_redis_keys(*patterns: str) -> None:
+    """
+    Deletes keys matching the patterns from the test Redis database
+    """
+    redis_connection = get_redis_connection()
+    for pattern in patterns:
+        keys = list(redis_connection.scan_iter(match=pattern))
+        if keys:
+            redis_connection.delete(*keys)
+
+
 class AccessMixin:
     """
     Mixin сontains methods for testing status codes for a specific URL.
@@ -808,6 +876,9 @@ class TestSubscriptionsView(CreateTestUsersAndPostsMixin, TestCase):
     Test SubscriptionsView
     """
 
+    def setUp(self):
+        delete_cached_subscription_ids(*CustomUser.objects.values_list("pk", flat=True))
+
     def test_queryset(self):
         """
         Test only published posts in quetyset
@@ -816,12 +887,7 @@ class TestSubscriptionsView(CreateTestUsersAndPostsMixin, TestCase):
         request = request_factory.get(reverse("subscriptions"))
         request.user = CustomUser.objects.get(username="user")
 
-        middleware = SessionMiddleware(lambda request: None)
-        middleware.process_request(request)
-        request.session.save()
-
-        request.session["subscriptions"] = ["author"]
-        request.session.save()
+        request.user.subscriptions.add(CustomUser.objects.get(username="author"))
 
         view = SubscriptionsView()
         view.setup(request)
@@ -985,6 +1051,9 @@ class TestSearch(CreateTestUsersAndPostsMixin, TestCase):
     Test search
     """
 
+    def setUp(self):
+        bump_search_generation()
+
     def test_serach_form(self):
         """
         Test search form
@@ -1064,7 +1133,8 @@ class TestSearch(CreateTestUsersAndPostsMixin, TestCase):
         self.assertIn("Нет результатов", response.content.decode())
 
         author = CustomUser.objects.get(username="author")
-        Post.objects.create(title="test_post", is_draft=False, is_published=True, author=author)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title="test_post", is_draft=False, is_published=True, author=author)
         post_data = {"text": "test_post"}
         response = self.client.get(reverse("search"), data=post_data)
         self.assertEqual(response.status_code, 200)
@@ -1078,3 +1148,1511 @@ class TestSearch(CreateTestUsersAndPostsMixin, TestCase):
         self.assertTemplateUsed(response, "blog/search.html")
         self.assertIn("published_post", response.content.decode())
         self.assertIn("test_post", response.content.decode())
+
+
+class TestRedisServices(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test the Redis service layer
+    """
+
+    def setUp(self):
+        self.redis = get_redis_connection()
+        self.keys = [get_post_views_key(post) for post in self.test_posts]
+        self.redis.hdel(POST_VIEWS_HASH, *self.keys)
+
+    def tearDown(self):
+        self.redis.hdel(POST_VIEWS_HASH, *self.keys)
+
+    def test_connection_pool_is_shared(self):
+        """
+        Test that all clients borrow connections from one pool
+        """
+        self.assertIs(get_redis_connection().connection_pool, get_connection_pool())
+        self.assertIs(get_connection_pool(), get_connection_pool())
+
+    def test_test_database(self):
+        """
+        Test that tests don't use the Redis database from the settings
+        """
+        self.assertEqual(settings.REDIS_DB, settings.REDIS_TEST_DB)
+        self.assertEqual(get_connection_pool().connection_kwargs["db"], settings.REDIS_TEST_DB)
+
+    def test_post_views(self):
+        """
+        Test increasing and reading views of a single post
+        """
+        post = self.test_posts[0]
+        self.assertEqual(get_post_views(post), "0")
+        increase_post_views(post)
+        increase_post_views(post)
+        self.assertEqual(get_post_views(post), "2")
+
+    def test_posts_views_batch(self):
+        """
+        Test increasing and reading views of many posts at once
+        """
+        self.assertEqual(get_posts_views([]), {})
+        self.assertEqual(get_posts_views(self.test_posts), {post.pk: "0" for post in self.test_posts})
+
+        increase_posts_views(self.test_posts)
+        increase_posts_views(self.test_posts[:1])
+
+        views = get_posts_views(self.test_posts)
+        self.assertEqual(views[self.test_posts[0].pk], "2")
+        for post in self.test_posts[1:]:
+            self.assertEqual(views[post.pk], "1")
+
+
+class TestPostViewsPrefetch(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test that list pages fetch views of all posts with a constant number of Redis calls
+    """
+
+    def count_redis_calls(self, url, data=None):
+        """
+        Makes a GET request and returns the response and the number of Redis commands sent
+        """
+        with patch.object(
+            redis.Redis, "execute_command", side_effect=redis.Redis.execute_command, autospec=True
+        ) as mock_execute_command:
+            response = self.client.get(url, data=data)
+        return response, mock_execute_command.call_count
+
+    def test_index_view(self):
+        """
+        Test that the number of Redis calls doesn't depend on the number of posts on the page
+        """
+        # Logged in users bypass the page cache
+        self.client.force_login(CustomUser.objects.get(username="user"))
+        response, calls_for_one_post = self.count_redis_calls(reverse("home"))
+        self.assertEqual(len(response.context["posts"]), 1)
+
+        author = CustomUser.objects.get(username="author")
+        for i in range(4):
+            Post.objects.create(title=f"views_post_{i}", is_draft=False, is_published=True, author=author)
+
+        response, calls_for_five_posts = self.count_redis_calls(reverse("home"))
+        self.assertEqual(len(response.context["posts"]), 5)
+        self.assertEqual(calls_for_one_post, 1)
+        self.assertEqual(calls_for_five_posts, calls_for_one_post)
+        for post in response.context["posts"]:
+            self.assertTrue(hasattr(post, "prefetched_views"))
+
+    def test_search_view(self):
+        """
+        Test that the number of Redis calls doesn't depend on the number of search results
+        """
+        author = CustomUser.objects.get(username="author")
+        for i in range(4):
+            Post.objects.create(title=f"views_post_{i}", is_draft=False, is_published=True, author=author)
+
+        response, calls_for_one_post = self.count_redis_calls(reverse("search"), data={"text": "published"})
+        self.assertEqual(len(response.context["posts"]), 1)
+
+        response, calls_for_five_posts = self.count_redis_calls(reverse("search"), data={"text": "post"})
+        self.assertEqual(len(response.context["posts"]), 5)
+        self.assertEqual(calls_for_five_posts, calls_for_one_post)
+
+
+class TestFlushPostViews(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test flushing views from Redis to the database
+    """
+
+    def setUp(self):
+        self.redis = get_redis_connection()
+        self.clear_redis()
+
+    def tearDown(self):
+        self.clear_redis()
+
+    def clear_redis(self):
+        """
+        Removes views and pending batches
+        """
+        delete_redis_keys(f"{POST_VIEWS_HASH}*")
+
+    def test_flush(self):
+        """
+        Test that pending views are added to Post.views and removed from Redis
+        """
+        published, unpublished = self.test_posts[3], self.test_posts[2]
+        increase_posts_views([published, published, unpublished])
+
+        flush_post_views()
+
+        published.refresh_from_db()
+        unpublished.refresh_from_db()
+        self.assertEqual(published.views, 2)
+        self.assertEqual(unpublished.views, 1)
+        self.assertFalse(self.redis.exists(POST_VIEWS_PENDING_HASH))
+        self.assertFalse(self.redis.exists(POST_VIEWS_BATCHES_SET))
+
+        increase_post_views(published)
+        flush_post_views()
+        flush_post_views()
+
+        published.refresh_from_db()
+        self.assertEqual(published.views, 3)
+        self.assertEqual(get_post_views(published), "3")
+
+    def test_flush_without_views(self):
+        """
+        Test that flush does nothing if there are no pending views
+        """
+        flush_post_views()
+        self.assertFalse(PostViewsFlush.objects.exists())
+        self.assertFalse(self.redis.exists(POST_VIEWS_BATCHES_SET))
+
+    def test_flush_after_crash(self):
+        """
+        Test that a batch left in Redis is flushed once, whether or not it reached the database
+        """
+        post = self.test_posts[3]
+        increase_post_views(post)
+
+        # The flush crashed before the database transaction
+        with patch("blog.utils.get_views_batch", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                flush_post_views()
+
+        increase_post_views(post)
+
+        # The flush crashed after the database transaction of the first batch
+        with patch("blog.utils.delete_views_batch", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                flush_post_views()
+
+        post.refresh_from_db()
+        self.assertEqual(post.views, 1)
+
+        increase_post_views(post)
+        flush_post_views()
+
+        post.refresh_from_db()
+        self.assertEqual(post.views, 3)
+        self.assertFalse(self.redis.exists(POST_VIEWS_BATCHES_SET))
+
+    def test_save_does_not_overwrite_views(self):
+        """
+        Test that saving a stale post instance keeps flushed views
+        """
+        post = Post.objects.get(pk=self.test_posts[3].pk)
+        increase_post_views(post)
+        flush_post_views()
+
+        post.title = "renamed_post"
+        post.save()
+
+        post.refresh_from_db()
+        self.assertEqual(post.title, "renamed_post")
+        self.assertEqual(post.views, 1)
+
+
+class TestUniquePostViews(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test counting unique views by the visitor id cookie
+    """
+
+    def setUp(self):
+        self.redis = get_redis_connection()
+        self.post = Post.objects.get(slug="published-post")
+        self.clear_redis()
+
+    def tearDown(self):
+        self.clear_redis()
+
+    def clear_redis(self):
+        """
+        Removes views and visitors of the test post
+        """
+        self.redis.delete(get_post_viewers_key(self.post), POST_VIEWS_PENDING_HASH)
+        self.redis.hdel(POST_VIEWS_HASH, get_post_views_key(self.post))
+
+    def test_views_are_counted_once_per_visitor(self):
+        """
+        Test that repeated views of the same visitor are not counted
+        """
+        url = reverse("post", kwargs={"post_slug": self.post.slug})
+
+        response = self.client.get(url)
+        self.assertIn(VISITOR_ID_COOKIE, response.cookies)
+        self.client.get(url)
+        self.assertEqual(get_post_views(self.post), "1")
+
+        Client().get(url)
+        self.assertEqual(get_post_views(self.post), "2")
+
+    def test_single_cookie(self):
+        """
+        Test that only the visitor id cookie is set and the per post cookies are removed
+        """
+        url = reverse("post", kwargs={"post_slug": self.post.slug})
+        self.client.cookies["post_view_1"] = "true"
+
+        response = self.client.get(url)
+        self.assertEqual(set(response.cookies), {VISITOR_ID_COOKIE, "post_view_1"})
+        self.assertEqual(response.cookies["post_view_1"]["max-age"], 0)
+
+        response = self.client.get(url)
+        self.assertNotIn(VISITOR_ID_COOKIE, response.cookies)
+
+    def test_register_post_view(self):
+        """
+        Test register_post_view function
+        """
+        self.assertTrue(register_post_view(self.post, "visitor"))
+        self.assertFalse(register_post_view(self.post, "visitor"))
+        self.assertTrue(register_post_view(self.post, "another_visitor"))
+        self.assertEqual(get_post_views(self.post), "2")
+
+    def test_register_post_view_follows_estimate(self):
+        """
+        Test that the views grow by the growth of PFCOUNT even if PFADD changed no register
+        """
+        with patch("redis.client.Pipeline.execute", return_value=[5, 0, 7]), patch(
+            "blog.redis_services.increase_post_views"
+        ) as mock_increase_post_views:
+            self.assertTrue(register_post_view(self.post, "visitor"))
+        mock_increase_post_views.assert_called_once_with(self.post, 2)
+
+        with patch("redis.client.Pipeline.execute", return_value=[7, 1, 7]), patch(
+            "blog.redis_services.increase_post_views"
+        ) as mock_increase_post_views:
+            self.assertFalse(register_post_view(self.post, "visitor"))
+        mock_increase_post_views.assert_not_called()
+
+
+class TestSearchVector(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test the stored search vector of posts
+    """
+
+    def get_search_vector(self, post: Post) -> str:
+        """
+        Returns the search vector of the post as a string
+        """
+        return Post.objects.filter(pk=post.pk).values_list("search_vector", flat=True).get()
+
+    def test_search_vector_weights(self):
+        """
+        Test that title, epigraph and article are weighted and HTML is stripped
+        """
+        author = CustomUser.objects.get(username="author")
+        post = Post.objects.create(
+            title="Заголовок",
+            epigraph="Эпиграф",
+            article="<p>Текст&nbsp;<strong>статьи</strong></p>",
+            author=author,
+        )
+        search_vector = self.get_search_vector(post)
+        self.assertIn(":1A", search_vector)
+        self.assertIn(":2B", search_vector)
+        self.assertIn(":3C", search_vector)
+        self.assertNotIn("strong", search_vector)
+        self.assertNotIn("nbsp", search_vector)
+
+    def test_search_vector_update(self):
+        """
+        Test that the search vector follows changes of the post
+        """
+        post = Post.objects.get(slug="published-post")
+        post.title = "обновленный заголовок"
+        post.save()
+        self.assertIn("обновлен", self.get_search_vector(post))
+        self.assertNotIn("publish", self.get_search_vector(post))
+
+    def test_search_uses_index(self):
+        """
+        Test that search queries can use the GIN index
+        """
+        query = SearchQuery("published", config=SEARCH_CONFIG)
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = Post.objects.filter(search_vector=query).explain()
+        self.assertIn("blog_post_search_vector_idx", plan)
+
+
+class TestSearchResults(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test ranking, pagination and snippets of search results
+    """
+
+    def setUp(self):
+        self.author = CustomUser.objects.get(username="author")
+
+    def test_ranking(self):
+        """
+        Test that a match in the title outranks a match in the article
+        """
+        in_article = Post.objects.create(
+            title="first", article="<p>редиска</p>", is_draft=False, is_published=True, author=self.author
+        )
+        in_title = Post.objects.create(
+            title="редиска", article="<p>second</p>", is_draft=False, is_published=True, author=self.author
+        )
+        response = self.client.get(reverse("search"), data={"text": "редиска"})
+        self.assertEqual(list(response.context["posts"]), [in_title, in_article])
+
+    def test_pagination(self):
+        """
+        Test that results are paginated and page links keep the search text
+        """
+        for i in range(7):
+            Post.objects.create(
+                title=f"search_post_{i}", article="<p>text</p>", is_draft=False, is_published=True, author=self.author
+            )
+        response = self.client.get(reverse("search"), data={"text": "search_post"})
+        self.assertEqual(len(response.context["posts"]), 5)
+        self.assertTrue(response.context["is_paginated"])
+        self.assertIn("?text=search_post&amp;page=2", response.content.decode())
+
+        response = self.client.get(reverse("search"), data={"text": "search_post", "page": 2})
+        self.assertEqual(len(response.context["posts"]), 2)
+
+    def test_headline(self):
+        """
+        Test that results show a highlighted snippet instead of the article
+        """
+        article = "<p>" + " ".join(["вода"] * 200) + " <strong>огурец</strong> " + " ".join(["земля"] * 200) + "</p>"
+        Post.objects.create(title="garden", article=article, is_draft=False, is_published=True, author=self.author)
+
+        response = self.client.get(reverse("search"), data={"text": "огурец"})
+        content = response.content.decode()
+        self.assertIn("<mark>огурец</mark>", content)
+        self.assertNotIn("<strong>", content)
+        self.assertLess(content.count("вода") + content.count("земля"), SEARCH_HEADLINE_MAX_WORDS)
+
+
+class TestSearchCache(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test the search results cache
+    """
+
+    def setUp(self):
+        bump_search_generation()
+        self.author = CustomUser.objects.get(username="author")
+
+    def search(self, text, page=1):
+        """
+        Makes a search request and returns the response and executed SQL queries
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("search"), data={"text": text, "page": page})
+        return response, [query["sql"] for query in queries.captured_queries]
+
+    def test_repeated_search_is_cached(self):
+        """
+        Test that a repeated search skips the full-text query and COUNT
+        """
+        response, queries = self.search("published")
+        self.assertTrue(any("COUNT(*)" in sql for sql in queries))
+
+        cached_response, cached_queries = self.search("  Published ")
+        self.assertEqual(len(cached_queries), 1)
+        self.assertNotIn("COUNT(*)", cached_queries[0])
+        self.assertEqual(list(cached_response.context["posts"]), list(response.context["posts"]))
+        self.assertEqual(cached_response.context["paginator"].count, 1)
+
+    def test_unpublished_post_is_not_served(self):
+        """
+        Test that unpublishing a post invalidates cached results
+        """
+        post = Post.objects.get(slug="published-post")
+        self.search("published")
+
+        generation = get_search_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            post.is_published = False
+            post.save()
+            self.assertEqual(get_search_generation(), generation)
+
+        response, _ = self.search("published")
+        self.assertNotIn(post, response.context["posts"])
+        self.assertEqual(response.context["paginator"].count, 0)
+
+    def test_cached_page_does_not_serve_unpublished_post(self):
+        """
+        Test that a post unpublished without the signal is filtered out of a cached page
+        """
+        post = Post.objects.get(slug="published-post")
+        self.search("published")
+
+        Post.objects.filter(pk=post.pk).update(is_published=False)
+
+        response, _ = self.search("published")
+        self.assertNotIn(post, response.context["posts"])
+
+    @override_settings(SEARCH_CACHE_MAX_ENTRIES=2)
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used page is evicted
+        """
+        generation = get_search_generation()
+        set_cached_search_page(generation, "first", 1, [1], 1)
+        set_cached_search_page(generation, "second", 1, [2], 1)
+        get_cached_search_page(generation, "first", 1)
+        set_cached_search_page(generation, "third", 1, [3], 1)
+
+        self.assertEqual(get_cached_search_page(generation, "first", 1), ([1], 1))
+        self.assertIsNone(get_cached_search_page(generation, "second", 1))
+        self.assertEqual(get_cached_search_page(generation, "third", 1), ([3], 1))
+
+
+class TestAutocomplete(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test the autocomplete endpoint and its prefix index
+    """
+
+    def setUp(self):
+        call_command("rebuild_autocomplete_index", stdout=StringIO())
+        self.post = Post.objects.get(slug="published-post")
+
+    def autocomplete(self, text):
+        """
+        Returns labels of autocomplete results
+        """
+        response = self.client.get(reverse("autocomplete"), data={"q": text})
+        return [item["label"] for item in response.json()["results"]]
+
+    def test_autocomplete(self):
+        """
+        Test that published posts and their authors are found by a prefix of any word
+        """
+        self.post.title = "Ёжик в тумане"
+        self.post.save()
+
+        self.assertEqual(self.autocomplete("ежи"), ["Ёжик в тумане"])
+        self.assertEqual(self.autocomplete("ТУМ"), ["Ёжик в тумане"])
+        self.assertEqual(self.autocomplete("auth"), ["author"])
+        self.assertEqual(self.autocomplete("unpubl"), [])
+        self.assertEqual(self.autocomplete("d"), [])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("autocomplete"), data={"q": "ежи"})
+        self.assertEqual(response.json()["results"][0]["url"], self.post.get_absolute_url())
+
+    def test_index_is_maintained(self):
+        """
+        Test that renamed, unpublished and deleted posts are updated in the index
+        """
+        self.assertEqual(self.autocomplete("published"), ["published_post"])
+
+        self.post.title = "renamed_post"
+        self.post.save()
+        self.assertEqual(self.autocomplete("published"), [])
+        self.assertEqual(self.autocomplete("renamed"), ["renamed_post"])
+
+        self.post.is_published = False
+        self.post.save()
+        self.assertEqual(self.autocomplete("renamed"), [])
+
+        unpublished = Post.objects.get(slug="unpublished-post")
+        unpublished.is_published = True
+        unpublished.save()
+        self.assertEqual(self.autocomplete("unpubl"), ["unpublished_post"])
+
+        unpublished.delete()
+        self.assertEqual(self.autocomplete("unpubl"), [])
+
+
+class TestCursorPagination(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test keyset pagination of post lists
+    """
+
+    def setUp(self):
+        author = CustomUser.objects.get(username="author")
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(12):
+                Post.objects.create(author=author, title=f"cursor_post_{number}", is_draft=False, is_published=True)
+        # Posts with equal time are ordered by id
+        Post.objects.filter(title__in=["cursor_post_3", "cursor_post_4", "cursor_post_5"]).update(
+            time_update=Post.objects.get(title="cursor_post_3").time_update
+        )
+        self.expected = list(
+            Post.objects.filter(is_draft=False, is_published=True, is_pinned=False)
+            .order_by("-time_update", "-pk")
+            .values_list("pk", flat=True)
+        )
+
+    def test_walk_pages(self):
+        """
+        Test that walking forward and backward by cursors returns every post once and in order
+        """
+        pages = []
+        response = self.client.get(reverse("home"))
+        pages.append([post.pk for post in response.context["posts"]])
+        while response.context["page_obj"].has_next():
+            response = self.client.get(reverse("home"), data={"after": response.context["page_obj"].next_cursor})
+            pages.append([post.pk for post in response.context["posts"]])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual(len(pages), 3)
+        self.assertFalse(response.context["page_obj"].has_next())
+
+        page_obj = response.context["page_obj"]
+        response = self.client.get(reverse("home"), data={"before": page_obj.previous_cursor})
+        self.assertEqual([post.pk for post in response.context["posts"]], pages[1])
+        response = self.client.get(reverse("home"), data={"before": response.context["page_obj"].previous_cursor})
+        self.assertEqual([post.pk for post in response.context["posts"]], pages[0])
+        self.assertFalse(response.context["page_obj"].has_previous())
+        self.assertTrue(response.context["page_obj"].has_next())
+
+    def test_no_count_or_offset(self):
+        """
+        Test that a page is fetched without COUNT and OFFSET
+        """
+        response = self.client.get(reverse("home"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("home"), data={"after": response.context["page_obj"].next_cursor})
+        sql = " ".join(query["sql"] for query in queries.captured_queries)
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+        self.assertIn(f"after={response.context['page_obj'].next_cursor}", response.content.decode())
+
+    def test_page_number_and_invalid_cursor(self):
+        """
+        Test that old links with a page number still work and a broken cursor returns 404
+        """
+        response = self.client.get(reverse("home"), data={"page": 2})
+        self.assertEqual([post.pk for post in response.context["posts"]], self.expected[5:10])
+        self.assertEqual(self.client.get(reverse("home"), data={"after": "broken"}).status_code, 404)
+
+    def test_author_posts(self):
+        """
+        Test cursor pagination of the author's posts
+        """
+        response = self.client.get(reverse("users:author_posts", kwargs={"username": "author"}))
+        first_page = [post.pk for post in response.context["posts"]]
+        response = self.client.get(
+            reverse("users:author_posts", kwargs={"username": "author"}),
+            data={"after": response.context["page_obj"].next_cursor},
+        )
+        second_page = [post.pk for post in response.context["posts"]]
+        expected = list(
+            Post.objects.filter(author__username="author", is_published=True)
+            .order_by("-time_create", "-pk")
+            .values_list("pk", flat=True)
+        )
+        self.assertEqual(first_page + second_page, expected[:10])
+
+
+class TestPostListIndexes(TestCase):
+    """
+    Test that the post lists are read by index on a large table
+    """
+
+    posts_count = 50000
+    authors_count = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Seed posts of many authors: 20% drafts, 10% unpublished, the rest published
+        """
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f"seed_author_{number}", email=f"seed_author_{number}@test.com", is_author=True)
+            for number in range(cls.authors_count)
+        )
+        author_ids = list(CustomUser.objects.values_list("pk", flat=True))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO blog_post (
+                    title, slug, epigraph, article, excerpt, author_id, image, time_create, time_update,
+                    is_draft, is_published, is_pinned, views, comments_count
+                )
+                SELECT
+                    'seed post ' || n, 'seed-post-' || n, '', 'seed', 'seed', (%s::bigint[])[1 + n / 10 %% %s], '',
+                    now() - n * interval '1 minute', now() - (n * 7 %% %s) * interval '1 minute',
+                    n %% 10 < 2, n %% 10 >= 3, n %% 5000 = 0, 0, 0
+                FROM generate_series(1, %s) AS n
+                """,
+                [author_ids, len(author_ids), cls.posts_count, cls.posts_count],
+            )
+        cls.author = CustomUser.objects.get(username="seed_author_1")
+        cls.author.subscriptions.set(
+            CustomUser.objects.filter(username__in=["seed_author_1", "seed_author_2", "seed_author_3"])
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE blog_post")
+            cursor.execute("ANALYZE users_customuser")
+            cursor.execute(f"ANALYZE {CustomUser.subscriptions.through._meta.db_table}")
+
+    def get_view_queryset(self, view_class, **kwargs):
+        """
+        Returns the queryset of the view as it is built for a request
+        """
+        request = RequestFactory().get("/")
+        request.user = self.author
+        view = view_class()
+        view.setup(request, **kwargs)
+        return view, view.get_queryset()
+
+    def assert_no_seq_scan(self, queryset):
+        """
+        Fails if the plan of the queryset reads the whole posts table
+        """
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan on blog_post", plan, plan)
+
+    def test_list_views(self):
+        """
+        Test the first and a deep page of each post list
+        """
+        view_classes = [
+            (IndexView, {}),
+            (UnpublishedPostsView, {}),
+            (DraftPostsView, {}),
+            (AuthorPosts, {"username": "seed_author_1"}),
+        ]
+        for view_class, kwargs in view_classes:
+            with self.subTest(view=view_class.__name__):
+                view, queryset = self.get_view_queryset(view_class, **kwargs)
+                paginator = CursorPaginator(queryset, view.paginate_by, view.cursor_ordering)
+                self.assert_no_seq_scan(paginator.get_page_queryset())
+
+    def test_timeline_pull_authors(self):
+        """
+        Test the first and a deep page of the posts by the followed authors that are not fanned out,
+        the timeline paginator reads them from the database
+        """
+        view, queryset = self.get_view_queryset(SubscriptionsView)
+        pull_authors = list(self.author.subscriptions.values_list("pk", flat=True))
+        paginator = TimelinePaginator(queryset, view.paginate_by, view.cursor_ordering, self.author.pk, pull_authors)
+        deep_post = queryset.order_by("time_create")[view.paginate_by]
+        for after in (None, paginator.encode_cursor(deep_post)):
+            with self.subTest(after=after):
+                self.assert_no_seq_scan(paginator.get_pulled_queryset(after, None))
+
+                deep_post = queryset.order_by(view.cursor_ordering, "-pk")[queryset.count() // 2]
+                cursor = paginator.encode_cursor(deep_post)
+                self.assert_no_seq_scan(paginator.get_page_queryset(after=cursor))
+                self.assert_no_seq_scan(paginator.get_page_queryset(before=cursor))
+
+    def test_pinned_posts(self):
+        """
+        Test the pinned posts of the main page
+        """
+        self.assert_no_seq_scan(Post.objects.filter(is_pinned=True).select_related())
+
+
+class TestPostExcerpt(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test plain text excerpts of posts
+    """
+
+    article = "<p>Первый&nbsp;абзац &laquo;статьи&raquo;</p><p><img src='/media/a.png'><b>второй</b> абзац</p>"
+
+    def test_make_excerpt(self):
+        """
+        Test that tags and entities are stripped and long text is truncated
+        """
+        self.assertEqual(make_excerpt(self.article), "Первый абзац «статьи» второй абзац")
+        excerpt = make_excerpt("<p>слово</p> " * (EXCERPT_WORDS + 10))
+        self.assertEqual(len(excerpt.split()), EXCERPT_WORDS)
+        self.assertTrue(excerpt.endswith("…"))
+
+    def test_excerpt_on_save(self):
+        """
+        Test that the excerpt follows the article, also when only some fields are saved
+        """
+        post = Post.objects.get(slug="published-post")
+        post.article = self.article
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, "Первый абзац «статьи» второй абзац")
+
+        post.article = "<p>новый текст</p>"
+        post.save(update_fields=["article"])
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, "новый текст")
+
+        deferred_post = Post.objects.defer("article").get(pk=post.pk)
+        deferred_post.title = "renamed"
+        with CaptureQueriesContext(connection) as queries:
+            deferred_post.save()
+        self.assertNotIn('"article"', queries.captured_queries[-1]["sql"])
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, "новый текст")
+
+    def test_backfill_command(self):
+        """
+        Test that the command fills empty excerpts
+        """
+        Post.objects.update(article=self.article, excerpt="")
+        out = StringIO()
+        call_command("backfill_post_excerpts", batch_size=3, stdout=out)
+        self.assertEqual(out.getvalue().strip(), f"Updated {Post.objects.count()} posts")
+        self.assertEqual(set(Post.objects.values_list("excerpt", flat=True)), {"Первый абзац «статьи» второй абзац"})
+
+    def test_list_views_defer_article(self):
+        """
+        Test that the lists show the excerpt and don't load articles
+        """
+        post = Post.objects.get(slug="published-post")
+        post.article = self.article
+        post.save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("home"))
+        self.assertContains(response, "Первый абзац «статьи» второй абзац")
+        self.assertNotContains(response, "<b>второй</b>")
+        for query in queries.captured_queries:
+            self.assertNotIn('"blog_post"."article"', query["sql"])
+
+        response = self.client.get(reverse("users:author_posts", kwargs={"username": "author"}))
+        self.assertContains(response, "Первый абзац «статьи» второй абзац")
+
+
+class TestAnonymousPageCache(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test the full-page cache for anonymous visitors and its invalidation
+    """
+
+    def setUp(self):
+        self.post = Post.objects.get(slug="published-post")
+        self.author = CustomUser.objects.get(username="author")
+        invalidate_cached_pages(
+            HOME_PAGE_GROUP, get_post_page_group(self.post.slug), get_author_page_group("author"), "about"
+        )
+
+    def test_pages_are_cached(self):
+        """
+        Test that repeated anonymous requests don't query the database
+        """
+        urls = [
+            reverse("home"),
+            reverse("users:author_posts", kwargs={"username": "author"}),
+            reverse("about"),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                content = self.client.get(url).content
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.content, content)
+
+    def test_query_string(self):
+        """
+        Test that pages with unknown query parameters are not cached
+        and the known parameters share the cached page in any order
+        """
+        url = reverse("home")
+        self.client.get(url, data={"utm_source": "mail"})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, data={"utm_source": "mail"})
+        self.assertTrue(queries.captured_queries)
+
+        cursor = CursorPaginator(Post.objects.all(), 5, "-time_update").encode_cursor(self.post)
+        self.client.get(f"{url}?before={cursor}&after={cursor}")
+        with self.assertNumQueries(0):
+            self.client.get(f"{url}?after={cursor}&before={cursor}")
+
+    def test_logged_in_users_bypass_cache(self):
+        """
+        Test that logged in users get pages rendered for them
+        """
+        self.client.get(reverse("home"))
+        self.client.force_login(CustomUser.objects.get(username="user"))
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, reverse("users:logout"))
+        self.assertIsNotNone(response.context)
+
+    def test_post_page_counts_views(self):
+        """
+        Test that views are counted and the visitor cookie is set when the page is taken from the cache
+        """
+        self.client.get(self.post.get_absolute_url())
+        views = int(get_post_views(self.post))
+        visitor = Client()
+        with self.assertNumQueries(1):
+            response = visitor.get(self.post.get_absolute_url())
+        self.assertIsNone(response.context)
+        self.assertIn(VISITOR_ID_COOKIE, response.cookies)
+        self.assertEqual(int(get_post_views(self.post)), views + 1)
+
+    def test_invalidation_on_post_changes(self):
+        """
+        Test that publishing, editing, pinning and unpublishing a post updates the cached pages
+        """
+        self.client.get(reverse("home"))
+        self.client.get(self.post.get_absolute_url())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_post = Post.objects.create(author=self.author, title="new_post", is_draft=False, is_published=True)
+        self.assertContains(self.client.get(reverse("home")), "new_post")
+
+        self.post.article = "<p>edited article</p>"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        self.assertContains(self.client.get(self.post.get_absolute_url()), "edited article")
+
+        new_post.is_pinned = True
+        with self.captureOnCommitCallbacks(execute=True):
+            new_post.save()
+        self.assertContains(self.client.get(reverse("home")), "📌")
+
+        old_url = self.post.get_absolute_url()
+        self.post.title = "renamed_post"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+
+        self.post.is_published = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        self.assertEqual(self.client.get(self.post.get_absolute_url()).status_code, 404)
+        self.assertNotContains(self.client.get(reverse("home")), "renamed_post")
+
+    def test_drafts_dont_invalidate_pages(self):
+        """
+        Test that saving a draft keeps the cached lists
+        """
+        self.client.get(reverse("home"))
+        draft = Post.objects.get(slug="draft-post")
+        draft.article = "<p>draft</p>"
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.save()
+        with self.assertNumQueries(0):
+            self.client.get(reverse("home"))
+
+    def test_invalidation_on_new_comment(self):
+        """
+        Test that a new comment appears on the cached post page
+        """
+        self.client.get(self.post.get_absolute_url())
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.author, content="new comment")
+        self.assertContains(self.client.get(self.post.get_absolute_url()), "new comment")
+
+    def test_invalidation_after_commit(self):
+        """
+        Test that cached pages are kept until the change is committed,
+        a request before the commit would cache the old page again
+        """
+        self.client.get(reverse("home"))
+        self.client.get(self.post.get_absolute_url())
+        with self.captureOnCommitCallbacks() as callbacks:
+            Post.objects.create(author=self.author, title="new_post", is_draft=False, is_published=True)
+            Comment.objects.create(post=self.post, author=self.author, content="new comment")
+            self.author.first_name = "Писатель"
+            self.author.save()
+        with self.assertNumQueries(0):
+            self.assertNotContains(self.client.get(reverse("home")), "new_post")
+
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get(reverse("home")), "new_post")
+        self.assertContains(self.client.get(self.post.get_absolute_url()), "new comment")
+
+
+class TestFragmentCache(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test versioned caching of post cards, author info and comment lists
+    """
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.post = Post.objects.get(slug="published-post")
+        self.author = CustomUser.objects.get(username="author")
+        # Logged in users bypass the full-page cache
+        self.client.force_login(CustomUser.objects.get(username="user"))
+
+    def get_queries(self, url):
+        """
+        Makes a GET request and returns the response and executed SQL queries
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query["sql"] for query in queries.captured_queries]
+
+    def test_comment_list(self):
+        """
+        Test that the comment list is read from the cache until a comment changes
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(post=self.post, author=self.author, content="first comment")
+        response, queries = self.get_queries(self.post.get_absolute_url())
+        self.assertContains(response, "first comment")
+        self.assertTrue(any("comments_comment" in query for query in queries))
+
+        response, queries = self.get_queries(self.post.get_absolute_url())
+        self.assertContains(response, "first comment")
+        self.assertFalse(any("comments_comment" in query for query in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.author, content="second comment")
+        self.assertContains(self.client.get(self.post.get_absolute_url()), "second comment")
+
+        comment.is_published = False
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.save()
+        self.assertNotContains(self.client.get(self.post.get_absolute_url()), "first comment")
+
+    def test_comments_version_after_commit(self):
+        """
+        Test that the comments version changes only when the comment is committed
+        """
+        version = get_comments_version(self.post)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.author, content="comment")
+            self.assertEqual(get_comments_version(self.post), version)
+        self.assertEqual(get_comments_version(self.post), version + 1)
+
+    def test_post_card(self):
+        """
+        Test that edited posts and authors are rendered again
+        """
+        self.assertContains(self.client.get(reverse("home")), "published_post")
+
+        self.post.title = "edited_post"
+        self.post.save()
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, "edited_post")
+        self.assertNotContains(response, "published_post")
+
+        self.author.first_name = "Писатель"
+        self.author.save()
+        self.assertContains(self.client.get(reverse("home")), "Писатель")
+
+    def test_views_are_not_cached(self):
+        """
+        Test that the number of views is rendered on every request
+        """
+        self.client.get(reverse("home"))
+        increase_post_views(self.post)
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, f"Просмотров: {get_post_views(self.post)}")
+
+
+class TestConditionalGet(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test ETag and Last-Modified of the home and post pages
+    """
+
+    def setUp(self):
+        self.post = Post.objects.get(slug="published-post")
+        self.author = CustomUser.objects.get(username="author")
+        invalidate_cached_pages(HOME_PAGE_GROUP)
+
+    def test_home_page(self):
+        """
+        Test that an unchanged home page is answered with 304 without database queries
+        """
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response.headers["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(reverse("home"), HTTP_IF_NONE_MATCH=response.headers["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers["ETag"], response.headers["ETag"])
+        not_modified = self.client.get(reverse("home"), HTTP_IF_MODIFIED_SINCE=response.headers["Last-Modified"])
+        self.assertEqual(not_modified.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author, title="new_post", is_draft=False, is_published=True)
+        response = self.client.get(reverse("home"), HTTP_IF_NONE_MATCH=response.headers["ETag"])
+        self.assertContains(response, "new_post")
+
+    def test_post_page(self):
+        """
+        Test that an unchanged post page is answered with 304 and the view is counted
+        """
+        response = self.client.get(self.post.get_absolute_url())
+        etag = response.headers["ETag"]
+        views = int(get_post_views(self.post))
+
+        visitor = Client()
+        with self.assertNumQueries(1):
+            not_modified = visitor.get(self.post.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn(VISITOR_ID_COOKIE, not_modified.cookies)
+        self.assertEqual(int(get_post_views(self.post)), views + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.author, content="new comment")
+        response = self.client.get(self.post.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "new comment")
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+        self.author.first_name = "Писатель"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        response = self.client.get(self.post.get_absolute_url(), HTTP_IF_NONE_MATCH=response.headers["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_logged_in_users_get_full_pages(self):
+        """
+        Test that personalized pages have no validators
+        """
+        self.client.force_login(CustomUser.objects.get(username="user"))
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertNotIn("ETag", response.headers)
+        self.assertEqual(self.client.get(self.post.get_absolute_url(), HTTP_IF_NONE_MATCH="*").status_code, 200)
+
+    def test_missing_post(self):
+        """
+        Test that a missing post is still 404
+        """
+        response = self.client.get(reverse("post", kwargs={"post_slug": "missing"}), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestPostLoadedOnce(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test that single post views load the post once per request
+    """
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.author = CustomUser.objects.get(username="author")
+        self.staff = CustomUser.objects.get(username="staff")
+
+    def count_post_loads(self, method, url, data=None):
+        """
+        Makes a request and returns the response and the number of queries loading whole posts
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data=data)
+        loads = [
+            query["sql"]
+            for query in queries.captured_queries
+            if 'FROM "blog_post"' in query["sql"] and '"blog_post"."article"' in query["sql"]
+        ]
+        return response, len(loads)
+
+    def test_post_detail_view(self):
+        """
+        Test reading and commenting a published post
+        """
+        url = reverse("post", kwargs={"post_slug": "published-post"})
+        response, loads = self.count_post_loads("get", url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads, 1)
+
+        self.client.force_login(CustomUser.objects.get(username="user"))
+        response, loads = self.count_post_loads("get", url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads, 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data={"content": "comment"})
+        self.assertContains(response, "comment")
+        self.assertEqual(sum('FROM "blog_post"' in query["sql"] for query in queries.captured_queries), 1)
+        self.assertTrue(Comment.objects.filter(content="comment", author__username="user").exists())
+
+    def test_draft_views(self):
+        """
+        Test reading and editing a draft by its author
+        """
+        self.client.force_login(self.author)
+        response, loads = self.count_post_loads("get", reverse("draft", kwargs={"post_slug": "draft-post"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads, 1)
+
+        url = reverse("edit_draft", kwargs={"post_slug": "draft-post"})
+        response, loads = self.count_post_loads("get", url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads, 1)
+
+        data = {"title": "draft_post", "epigraph": "", "article": "edited", "image": "", "status": "is_draft"}
+        response, loads = self.count_post_loads("post", url, data=data)
+        self.assertRedirects(response, reverse("drafts"))
+        self.assertEqual(loads, 1)
+
+    def test_unpublished_views(self):
+        """
+        Test reading and editing an unpublished post by staff
+        """
+        self.client.force_login(self.staff)
+        url = reverse("unpublished_post", kwargs={"post_slug": "unpublished-post"})
+        response, loads = self.count_post_loads("get", url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads, 1)
+
+        response, loads = self.count_post_loads(
+            "get", reverse("edit_unpublished_post", kwargs={"post_slug": "unpublished-post"})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads, 1)
+
+    def test_anonymous_comment(self):
+        """
+        Test that anonymous visitors are sent to log in instead of commenting
+        """
+        url = reverse("post", kwargs={"post_slug": "published-post"})
+        response = self.client.post(url, data={"content": "comment"})
+        self.assertRedirects(response, reverse("users:login") + f"?next={url}")
+        self.assertFalse(Comment.objects.exists())
+
+
+class TestPostCommentCounters(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test comment counters of posts
+    """
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.post = Post.objects.get(slug="published-post")
+        self.user = CustomUser.objects.get(username="user")
+
+    def get_counters(self, post=None):
+        """
+        Returns the saved comment counters of the post
+        """
+        return Post.objects.values_list("comments_count", "last_commented_at").get(pk=(post or self.post).pk)
+
+    def test_create_and_delete(self):
+        """
+        Test that published comments are counted and the last comment time follows them
+        """
+        first = Comment.objects.create(post=self.post, author=self.user, content="first")
+        second = Comment.objects.create(post=self.post, author=self.user, content="second")
+        Comment.objects.create(post=self.post, author=self.user, content="hidden", is_published=False)
+        self.assertEqual(self.get_counters(), (2, second.time_create))
+
+        second.delete()
+        self.assertEqual(self.get_counters(), (1, first.time_create))
+        Comment.objects.filter(post=self.post).delete()
+        self.assertEqual(self.get_counters(), (0, None))
+
+    def test_publication(self):
+        """
+        Test that unpublished comments are not counted
+        """
+        comment = Comment.objects.create(post=self.post, author=self.user, content="comment")
+        comment.is_published = False
+        comment.save()
+        self.assertEqual(self.get_counters(), (0, None))
+        comment.content = "edited"
+        comment.save()
+        self.assertEqual(self.get_counters(), (0, None))
+        comment.is_published = True
+        comment.save()
+        self.assertEqual(self.get_counters(), (1, comment.time_create))
+
+    def test_move_to_another_post(self):
+        """
+        Test that a comment moved to another post is counted there
+        """
+        other_post = Post.objects.get(slug="unpublished-post")
+        comment = Comment.objects.create(post=self.post, author=self.user, content="comment")
+        comment.post = other_post
+        comment.save()
+        self.assertEqual(self.get_counters(), (0, None))
+        self.assertEqual(self.get_counters(other_post), (1, comment.time_create))
+
+    def test_stale_post_save(self):
+        """
+        Test that saving a post loaded before a comment doesn't overwrite the counters
+        """
+        post = Post.objects.get(pk=self.post.pk)
+        comment = Comment.objects.create(post=self.post, author=self.user, content="comment")
+        post.title = "renamed"
+        post.save()
+        self.assertEqual(self.get_counters(), (1, comment.time_create))
+
+    def test_reconcile_command(self):
+        """
+        Test that the command repairs drifted counters
+        """
+        comment = Comment.objects.create(post=self.post, author=self.user, content="comment")
+        Post.objects.update(comments_count=5)
+        out = StringIO()
+        call_command("reconcile_post_comments", stdout=out)
+        self.assertEqual(out.getvalue().strip(), f"Fixed {Post.objects.count()} posts")
+        self.assertEqual(self.get_counters(), (1, comment.time_create))
+        self.assertEqual(set(Post.objects.exclude(pk=self.post.pk).values_list("comments_count", flat=True)), {0})
+
+        out = StringIO()
+        call_command("reconcile_post_comments", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Fixed 0 posts")
+
+    def test_lists_show_counters(self):
+        """
+        Test that the cached home page shows the new counter after a comment
+        """
+        url = reverse("home")
+        self.assertContains(self.client.get(url), "Комментариев: 0")
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.user, content="comment")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, "Комментариев: 1")
+        self.assertFalse(any('"comments_comment"' in query["sql"] for query in queries.captured_queries))
+
+
+class TestSubscriptionTimeline(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test subscription timelines in Redis
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.get(username="user")
+        self.author = CustomUser.objects.get(username="author")
+        self.other_author = CustomUser.objects.get(username="authorstaff")
+        delete_redis_keys(f"{TIMELINE_PREFIX}*")
+        self.user.subscriptions.add(self.author)
+        self.client.force_login(self.user)
+
+    def create_posts(self, author, count, **kwargs):
+        """
+        Creates published posts of the author, newer posts go first
+        """
+        posts = [
+            Post.objects.create(title=f"{author.username} post {number}", author=author, is_draft=False, **kwargs)
+            for number in range(count)
+        ]
+        return posts[::-1]
+
+    def get_timeline(self, user):
+        """
+        Returns ids of the posts in the user's timeline, newer posts go first
+        """
+        return [int(pk) for pk in get_redis_connection().zrevrange(get_timeline_key(user.pk), 0, -1)]
+
+    def get_page_titles(self, response):
+        """
+        Returns titles of the posts on the page
+        """
+        return [post.title for post in response.context["posts"]]
+
+    def test_fan_out(self):
+        """
+        Test that a published post is added to timelines of the author's subscribers only
+        """
+        rebuild_timeline(self.user.pk)
+        rebuild_timeline(self.other_author.pk)
+        published = Post.objects.get(slug="published-post")
+        post = self.create_posts(self.author, 1, is_published=True)[0]
+        fan_out_post(post.pk)
+        self.assertEqual(self.get_timeline(self.user), [post.pk, published.pk])
+        self.assertEqual(self.get_timeline(self.other_author), [])
+
+        fan_out_post(Post.objects.get(slug="unpublished-post").pk)
+        self.assertEqual(self.get_timeline(self.user), [post.pk, published.pk])
+
+    def test_cold_timeline_is_not_filled(self):
+        """
+        Test that the fan-out and a new subscription don't create a timeline without the earlier posts
+        """
+        other_posts = self.create_posts(self.other_author, 2, is_published=True)
+        self.client.get(reverse("users:subscribe", kwargs={"author_username": self.other_author.username}))
+        post = self.create_posts(self.author, 1, is_published=True)[0]
+        fan_out_post(post.pk)
+        self.assertFalse(timeline_exists(self.user.pk))
+
+        response = self.client.get(reverse("subscriptions"))
+        self.assertEqual(
+            self.get_page_titles(response), [post.title, *(post.title for post in other_posts), "published_post"]
+        )
+
+    @override_settings(TIMELINE_MAX_LENGTH=3)
+    def test_timeline_is_capped(self):
+        """
+        Test that only the newest posts are kept
+        """
+        rebuild_timeline(self.user.pk)
+        posts = self.create_posts(self.author, 5, is_published=True)
+        for post in posts[::-1]:
+            fan_out_post(post.pk)
+        self.assertEqual(self.get_timeline(self.user), [post.pk for post in posts[:3]])
+
+    def test_publish_form_fans_out(self):
+        """
+        Test that publishing a post by staff starts the fan-out after the commit
+        """
+        self.client.force_login(CustomUser.objects.get(username="staff"))
+        post = Post.objects.get(slug="unpublished-post")
+        form_data = {
+            "title": "unpublished_post",
+            "epigraph": "",
+            "article": "text",
+            "image": "",
+            "status": "is_published",
+        }
+        with patch("blog.tasks.fan_out_post_task.delay") as mock_fan_out:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("edit_unpublished_post", kwargs={"post_slug": post.slug}), data=form_data)
+        mock_fan_out.assert_called_once_with(post.pk)
+
+    def test_admin_publication_fans_out(self):
+        """
+        Test that a post published in the admin, outside the staff form, reaches a built timeline
+        """
+        rebuild_timeline(self.user.pk)
+        post = Post.objects.get(slug="unpublished-post")
+        self.client.force_login(CustomUser.objects.get(username="admin"))
+        form_data = {
+            "title": post.title,
+            "slug": post.slug,
+            "epigraph": "",
+            "article": "text",
+            "author": post.author_id,
+            "is_published": "on",
+        }
+        with patch("blog.tasks.fan_out_post_task.delay", side_effect=fan_out_post):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse("admin:blog_post_change", args=[post.pk]), data=form_data)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(post.pk, self.get_timeline(self.user))
+
+        self.client.force_login(self.user)
+        self.assertIn(post.title, self.get_page_titles(self.client.get(reverse("subscriptions"))))
+
+    def test_view_reads_timeline(self):
+        """
+        Test that the page is read from the timeline and hydrated with one query
+        """
+        rebuild_timeline(self.user.pk)
+        posts = self.create_posts(self.author, 6, is_published=True)
+        for post in posts[::-1]:
+            fan_out_post(post.pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("subscriptions"))
+        self.assertEqual(self.get_page_titles(response), [post.title for post in posts[:5]])
+        self.assertEqual(sum('FROM "blog_post"' in query["sql"] for query in queries.captured_queries), 1)
+
+        response = self.client.get(reverse("subscriptions"), {"after": response.context["page_obj"].next_cursor})
+        page = response.context["page_obj"]
+        self.assertEqual(self.get_page_titles(response), [posts[5].title, "published_post"])
+        self.assertFalse(page.has_next())
+        response = self.client.get(reverse("subscriptions"), {"before": page.previous_cursor})
+        self.assertEqual(self.get_page_titles(response), [post.title for post in posts[:5]])
+
+    def test_cold_timeline_is_rebuilt(self):
+        """
+        Test that a missing timeline is filled from the database
+        """
+        response = self.client.get(reverse("subscriptions"))
+        self.assertEqual(self.get_page_titles(response), ["published_post"])
+        self.assertEqual(self.get_timeline(self.user), [Post.objects.get(slug="published-post").pk])
+
+    def test_unpublished_posts_are_removed(self):
+        """
+        Test that posts unpublished after the fan-out are skipped and removed from the timeline
+        """
+        rebuild_timeline(self.user.pk)
+        posts = self.create_posts(self.author, 2, is_published=True)
+        for post in posts:
+            fan_out_post(post.pk)
+        Post.objects.filter(pk=posts[0].pk).update(is_published=False)
+        response = self.client.get(reverse("subscriptions"))
+        self.assertNotIn(posts[0].title, self.get_page_titles(response))
+        self.assertNotIn(posts[0].pk, self.get_timeline(self.user))
+
+    @override_settings(TIMELINE_FANOUT_MAX_SUBSCRIBERS=0)
+    def test_large_audience_is_pulled(self):
+        """
+        Test that posts of authors with large audiences are read from the database and merged with the timeline
+        """
+        self.user.subscriptions.add(self.other_author)
+        rebuild_timeline(self.user.pk)
+        published = Post.objects.get(slug="published-post")
+        pulled_post = self.create_posts(self.author, 1, is_published=True)[0]
+        fan_out_post(pulled_post.pk)
+        self.assertEqual(self.get_timeline(self.user), [published.pk])
+        self.assertEqual(get_timeline_pull_authors(), {self.author.pk})
+
+        with override_settings(TIMELINE_FANOUT_MAX_SUBSCRIBERS=10):
+            pushed_post = self.create_posts(self.other_author, 1, is_published=True)[0]
+            fan_out_post(pushed_post.pk)
+            fan_out_post(Post.objects.create(title="later", author=self.author, is_draft=False, is_published=True).pk)
+        self.assertEqual(self.get_timeline(self.user), [pushed_post.pk, published.pk])
+
+        response = self.client.get(reverse("subscriptions"))
+        self.assertEqual(
+            self.get_page_titles(response), ["later", pushed_post.title, pulled_post.title, "published_post"]
+        )
+
+    def test_subscribe_and_unsubscribe(self):
+        """
+        Test that posts of a followed author are added to the timeline and removed on unsubscribing
+        """
+        rebuild_timeline(self.user.pk)
+        published = Post.objects.get(slug="published-post")
+        posts = self.create_posts(self.other_author, 2, is_published=True)
+        self.client.get(reverse("users:subscribe", kwargs={"author_username": self.other_author.username}))
+        self.assertEqual(self.get_timeline(self.user), [*(post.pk for post in posts), published.pk])
+        self.client.get(reverse("users:unsubscribe", kwargs={"author_username": self.other_author.username}))
+        self.assertEqual(self.get_timeline(self.user), [published.pk])
+
+
+class TestTrendingPosts(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test trending posts
+    """
+
+    # The start of an epoch of every window
+    START = 100800 * 17000
+
+    def setUp(self):
+        self.redis = get_redis_connection()
+        delete_redis_keys(f"{TRENDING_PREFIX}*")
+        author = CustomUser.objects.get(username="author")
+        self.first, self.second, self.third = [
+            Post.objects.create(title=f"trending {number}", author=author, is_draft=False, is_published=True)
+            for number in range(3)
+        ]
+        self.post_ids = [self.first.pk, self.second.pk, self.third.pk]
+        self.views_keys = [get_post_views_key(post) for post in (self.first, self.second, self.third)]
+
+    def tearDown(self):
+        self.redis.hdel(POST_VIEWS_HASH, *self.views_keys)
+        self.redis.hdel(POST_VIEWS_PENDING_HASH, *self.post_ids)
+
+    def view(self, post, count, now):
+        """
+        Counts views of the post made at the time
+        """
+        with patch("blog.redis_services.time.time", return_value=now):
+            increase_posts_views([post] * count)
+
+    def test_views_rank_posts(self):
+        """
+        Test that posts are ranked by views
+        """
+        self.view(self.first, 1, self.START)
+        self.view(self.second, 3, self.START)
+        self.view(self.third, 2, self.START)
+        for window in settings.TRENDING_WINDOWS:
+            self.assertEqual(get_trending_post_ids(window, 2), [self.second.pk, self.third.pk])
+
+    def test_decay(self):
+        """
+        Test that older views weigh less in shorter windows
+        """
+        renormalize_trending_posts(self.START)
+        self.view(self.first, 3, self.START)
+        later = self.START + 2 * settings.TRENDING_WINDOWS["hour"]
+        renormalize_trending_posts(later)
+        renormalize_trending_posts(later)
+        self.view(self.second, 1, later)
+
+        self.assertEqual(get_trending_post_ids("hour", 10), [self.second.pk, self.first.pk])
+        self.assertEqual(get_trending_post_ids("week", 10), [self.first.pk, self.second.pk])
+        self.assertAlmostEqual(self.redis.zscore(get_trending_key("hour"), self.first.pk), 0.75)
+
+    def test_old_posts_dropped(self):
+        """
+        Test that posts without recent views are dropped
+        """
+        renormalize_trending_posts(self.START)
+        self.view(self.first, 1, self.START)
+        renormalize_trending_posts(self.START + 10 * settings.TRENDING_WINDOWS["hour"])
+        self.assertEqual(get_trending_post_ids("hour", 10), [])
+        self.assertEqual(get_trending_post_ids("day", 10), [self.first.pk])
+
+    def test_view(self):
+        """
+        Test the page shows published posts of the period in the order of the ranking
+        """
+        increase_posts_views([self.first] * 2 + [self.second] * 3 + [self.third])
+        self.third.is_published = False
+        self.third.save()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("popular"), {"period": "hour"})
+        content = response.content.decode("utf-8")
+        self.assertLess(content.index(self.second.title), content.index(self.first.title))
+        self.assertNotIn(self.third.title, content)
+
+        self.second.delete()
+        self.assertEqual(get_trending_post_ids("hour", 10), [self.first.pk, self.third.pk])
@@ -5,10 +5,12 @@ from . import views
 urlpatterns = [
     path("", views.IndexView.as_view(), name="home"),
     path("subscriptions", views.SubscriptionsView.as_view(), name="subscriptions"),
+    path("popular", views.PopularPostsView.as_view(), name="popular"),
     path("about", views.about, name="about"),
     path("gallery", views.gallery, name="gallery"),
     path("contact", views.contact, name="contact"),
-    path("search", views.search, name="search"),
+    path("search", views.SearchView.as_view(), name="search"),
+    path("search/autocomplete", views.autocomplete, name="autocomplete"),
     path("add", views.AddPost.as_view(), name="add_post"),
     path("post/<slug:post_slug>", views.PostDetailView.as_view(), name="post"),
     path("drafts", views.DraftPostsView.as_view(), name="drafts"),
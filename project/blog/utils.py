@@ -1,12 +1,72 @@
+import html
+import re
+from datetime import timedelta
+from functools import wraps
+from typing import Callable, Iterable
+from urllib.parse import urlencode
+
 from django.apps import apps
 from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
 from django.core.mail import send_mail
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Func, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from users.utils import get_subscription_ids
+
+from .redis_services import (
+    add_timeline_pull_author,
+    add_to_timelines,
+    delete_views_batch,
+    get_cached_page,
+    get_timeline_pull_authors,
+    get_trending_post_ids,
+    get_views_batch,
+    index_autocomplete_item,
+    invalidate_cached_pages,
+    remove_autocomplete_item,
+    remove_from_timeline,
+    rotate_pending_views,
+    set_cached_page,
+)
 
 # Rules for replacing characters in slug
 slug_replacements = (("|", "or"), ("%", "percent"))
 
+# Number of words in the excerpt shown in the post lists
+EXCERPT_WORDS = 100
+HTML_TAG_RE = re.compile(r"<[^>]*>")
+
+# Group of the cached home pages
+HOME_PAGE_GROUP = "home"
+# Query parameters of the cached pages, pages requested with any other parameter are not cached
+PAGE_CACHE_QUERY_PARAMS = ("after", "before")
+
+
+class StripTags(Func):
+    """
+    Replaces HTML tags and entities with spaces in the database.
+    Uses the same expression as the search vector trigger.
+    """
+
+    function = "regexp_replace"
+    template = "%(function)s(%(expressions)s, '<[^>]*>|&[#a-z0-9]+;', ' ', 'gi')"
+
+
+def make_excerpt(article: str) -> str:
+    """
+    Returns the first EXCERPT_WORDS words of the article as plain text.
+    Tags are replaced with spaces, so words of adjacent paragraphs are not glued together.
+    """
+    text = " ".join(html.unescape(HTML_TAG_RE.sub(" ", article)).split())
+    return Truncator(text).words(EXCERPT_WORDS)
+
 
 def send_mail_your_post_has_been_returned(post_id):
     """
@@ -38,3 +98,310 @@ def send_feedback(data):
     body = render_to_string("blog/email/feedback_body.txt", data)
     admin_email = settings.ADMINS[0][1]
     send_mail(subject=subject, message=body, from_email=data["email"], recipient_list=[admin_email])
+
+
+def add_post_views(deltas: dict[int, int]) -> None:
+    """
+    Adds views to posts with a single UPDATE ... FROM (VALUES ...) query.
+    """
+    if not deltas:
+        return
+    table = apps.get_model("blog", "Post")._meta.db_table
+    values = ", ".join(["(%s, %s)"] * len(deltas))
+    params = [item for pair in deltas.items() for item in pair]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET views = {table}.views + delta.views "
+            f"FROM (VALUES {values}) AS delta (id, views) "
+            f"WHERE {table}.id = delta.id",
+            params,
+        )
+
+
+def flush_post_views() -> None:
+    """
+    Moves views accumulated in Redis to the Post.views column.
+
+    Each batch is recorded in PostViewsFlush in the same transaction as the UPDATE,
+    so a batch left in Redis by a crash after the commit is not added twice.
+    """
+    PostViewsFlush = apps.get_model("blog", "PostViewsFlush")
+    for batch_id in rotate_pending_views():
+        deltas = get_views_batch(batch_id)
+        if deltas:
+            with transaction.atomic():
+                _, created = PostViewsFlush.objects.get_or_create(batch_id=batch_id)
+                if created:
+                    add_post_views(deltas)
+        delete_views_batch(batch_id)
+    PostViewsFlush.objects.filter(
+        time_create__lt=timezone.now() - timedelta(seconds=settings.POST_VIEWS_FLUSH_LOG_TTL)
+    ).delete()
+
+
+def get_published_comments(post_ref):
+    """
+    Returns published comments of a post, post_ref is a post id or an OuterRef.
+    """
+    return apps.get_model("comments", "Comment").objects.filter(post=post_ref, is_published=True).order_by()
+
+
+def add_post_comment(post_id: int, time_create) -> None:
+    """
+    Counts a published comment in the post counters with a single UPDATE.
+    """
+    apps.get_model("blog", "Post").objects.filter(pk=post_id).update(
+        comments_count=F("comments_count") + 1,
+        last_commented_at=Greatest(Coalesce("last_commented_at", Value(time_create)), Value(time_create)),
+    )
+
+
+def remove_post_comment(post_id: int) -> None:
+    """
+    Removes a published comment from the post counters with a single UPDATE.
+    The last comment time is taken from the remaining published comments.
+    """
+    apps.get_model("blog", "Post").objects.filter(pk=post_id).update(
+        comments_count=Greatest(F("comments_count") - 1, Value(0)),
+        last_commented_at=Subquery(
+            get_published_comments(OuterRef("pk")).order_by("-time_create").values("time_create")[:1]
+        ),
+    )
+
+
+def reconcile_post_comments(batch_size: int = 500) -> int:
+    """
+    Recalculates comment counters of posts that differ from their published comments.
+    Returns the number of fixed posts.
+    """
+    Post = apps.get_model("blog", "Post")
+    comments = get_published_comments(OuterRef("pk")).values("post")
+    posts = (
+        Post.objects.only("comments_count", "last_commented_at")
+        .annotate(
+            actual_count=Coalesce(Subquery(comments.annotate(count=Count("pk")).values("count")), 0),
+            actual_last=Subquery(comments.order_by("-time_create").values("time_create")[:1]),
+        )
+        .order_by("pk")
+    )
+
+    batch = []
+    count = 0
+    for post in posts.iterator(chunk_size=batch_size):
+        if (post.comments_count, post.last_commented_at) == (post.actual_count, post.actual_last):
+            continue
+        post.comments_count, post.last_commented_at = post.actual_count, post.actual_last
+        batch.append(post)
+        if len(batch) == batch_size:
+            count += Post.objects.bulk_update(batch, ["comments_count", "last_commented_at"])
+            batch = []
+    if batch:
+        count += Post.objects.bulk_update(batch, ["comments_count", "last_commented_at"])
+    return count
+
+
+def update_autocomplete_index(post) -> None:
+    """
+    Adds a published post and its author to the autocomplete index, removes an unpublished post.
+    """
+    if post.is_published and not post.is_draft:
+        index_autocomplete_item("post", post.pk, post.title, post.get_absolute_url())
+        author = post.author
+        index_autocomplete_item("author", author.pk, author.username, author.get_absolute_url())
+    else:
+        remove_autocomplete_item("post", post.pk)
+
+
+def get_subscribers(author_id: int) -> models.QuerySet:
+    """
+    Returns ids of the author's subscribers.
+    """
+    through = apps.get_model("users", "CustomUser").subscriptions.through
+    return through.objects.filter(to_customuser_id=author_id).values_list("from_customuser_id", flat=True).order_by()
+
+
+def get_timeline_score(time_create) -> float:
+    """
+    Returns the score of a post in timelines, posts are ordered by creation time like the post lists.
+    """
+    return time_create.timestamp()
+
+
+def get_timeline_posts(**filters) -> dict[int, float]:
+    """
+    Returns {id: score} of the newest published posts matching the filters.
+    """
+    posts = (
+        apps.get_model("blog", "Post")
+        .objects.filter(is_published=True, **filters)
+        .order_by("-time_create")
+        .values_list("pk", "time_create")[: settings.TIMELINE_MAX_LENGTH]
+    )
+    return {post_id: get_timeline_score(time_create) for post_id, time_create in posts}
+
+
+def fan_out_post(post_id: int) -> None:
+    """
+    Adds a published post to the built timelines of the author's subscribers.
+    Authors with more than TIMELINE_FANOUT_MAX_SUBSCRIBERS subscribers are switched to reading
+    their posts from the database, they stay so, because their older posts are not in the timelines.
+    """
+    post = (
+        apps.get_model("blog", "Post")
+        .objects.filter(pk=post_id, is_published=True)
+        .values_list("author_id", "time_create")
+        .first()
+    )
+    if post is None:
+        return
+    author_id, time_create = post
+    items = {post_id: get_timeline_score(time_create)}
+    if author_id in get_timeline_pull_authors():
+        return
+    subscribers = get_subscribers(author_id)
+    if subscribers.count() > settings.TIMELINE_FANOUT_MAX_SUBSCRIBERS:
+        add_timeline_pull_author(author_id)
+        return
+
+    batch = []
+    for user_id in subscribers.iterator(chunk_size=settings.TIMELINE_FANOUT_BATCH_SIZE):
+        batch.append(user_id)
+        if len(batch) == settings.TIMELINE_FANOUT_BATCH_SIZE:
+            add_to_timelines(batch, items)
+            batch = []
+    if batch:
+        add_to_timelines(batch, items)
+
+
+def rebuild_timeline(user_id: int) -> None:
+    """
+    Fills the user's timeline with the newest posts of the followed authors.
+    """
+    items = get_timeline_posts(author_id__in=get_subscription_ids(user_id))
+    if items:
+        add_to_timelines([user_id], items, create=True)
+
+
+def add_author_to_timeline(user_id: int, author_id: int) -> None:
+    """
+    Adds posts of a newly followed author to the user's timeline, if it has been built.
+    """
+    items = get_timeline_posts(author_id=author_id)
+    if items:
+        add_to_timelines([user_id], items)
+
+
+def remove_author_from_timeline(user_id: int, author_id: int) -> None:
+    """
+    Removes posts of an unfollowed author from the user's timeline.
+    """
+    remove_from_timeline(user_id, get_timeline_posts(author_id=author_id))
+
+
+def get_post_page_group(slug: str) -> str:
+    """
+    Returns the group of the cached pages of a post.
+    """
+    return f"post:{slug}"
+
+
+def get_author_page_group(username: str) -> str:
+    """
+    Returns the group of the cached pages with posts of an author.
+    """
+    return f"author:{username}"
+
+
+def invalidate_author_info_pages(user_ids: Iterable[int]) -> None:
+    """
+    Invalidates cached pages showing the users' counters in the author info:
+    the home pages and pages of their published posts.
+    """
+    slugs = (
+        apps.get_model("blog", "Post")
+        .objects.filter(author_id__in=user_ids, is_published=True)
+        .values_list("slug", flat=True)
+    )
+    invalidate_cached_pages(HOME_PAGE_GROUP, *(get_post_page_group(slug) for slug in slugs))
+
+
+def is_page_cacheable(request: HttpRequest) -> bool:
+    """
+    Pages are cached only for anonymous GET requests without a session or pending messages,
+    everyone else may see personalized content.
+    """
+    return (
+        request.method == "GET"
+        and not request.user.is_authenticated
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def get_page_cache_path(request: HttpRequest) -> str | None:
+    """
+    Returns the path the page is cached under, the query parameters are sorted.
+    Returns None for unknown or repeated parameters, otherwise every query string
+    a visitor makes up would take its own cache entry.
+    """
+    if any(key not in PAGE_CACHE_QUERY_PARAMS or len(values) > 1 for key, values in request.GET.lists()):
+        return None
+    if not request.GET:
+        return request.path
+    return f"{request.path}?{urlencode(sorted(request.GET.items()))}"
+
+
+def cache_anonymous_page(request: HttpRequest, group: str, get_response: Callable[[], HttpResponse]) -> HttpResponse:
+    """
+    Returns the cached page for an anonymous visitor, or gets the response and caches it after rendering.
+    Only the content is cached, cookies and headers of the response are not.
+    """
+    path = get_page_cache_path(request)
+    if path is None or not is_page_cacheable(request):
+        return get_response()
+    generation, content = get_cached_page(group, path)
+    if content is not None:
+        return HttpResponse(content)
+
+    response = get_response()
+    if response.status_code == 200:
+
+        def cache_response(response: HttpResponse) -> None:
+            set_cached_page(group, generation, path, response.content)
+
+        if hasattr(response, "add_post_render_callback"):
+            response.add_post_render_callback(cache_response)
+        else:
+            cache_response(response)
+    return response
+
+
+def anonymous_page_cache(group: str) -> Callable:
+    """
+    Caches pages of a function view for anonymous visitors.
+    """
+
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            return cache_anonymous_page(request, group, lambda: view(request, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def get_trending_posts(window: str, limit: int) -> list:
+    """
+    Returns the top published posts of the trending window with one query.
+    Posts unpublished since they were viewed are skipped.
+    """
+    post_ids = get_trending_post_ids(window, limit)
+    posts = (
+        apps.get_model("blog", "Post")
+        .objects.filter(is_published=True, is_draft=False)
+        .defer("article")
+        .select_related("author")
+        .in_bulk(post_ids)
+    )
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
@@ -1,12 +1,16 @@
+import hashlib
+import uuid
 from typing import Any
 
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.contrib.postgres.search import SearchVector
-from django.db.models import Model
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.core.paginator import Page
+from django.db.models import F, Model
 from django.db.models.query import QuerySet
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.response import TemplateResponse
 from django.urls import reverse, reverse_lazy
@@ -16,46 +20,97 @@ from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
 
 from comments.forms import CommentForm
+from comments.models import Comment
 from users.mixins import (
     IsAuthorDraftRequiredMixin,
     IsAuthorRequiredMixin,
     IsStaffRequiredMixin,
 )
+from users.utils import get_subscription_ids
 
 from .forms import AddPostForm, EditStaffPostForm, FeedbackForm, SearchForm
-from .mixins import TitleMixin
-from .models import Post
-from .redis_services import increase_post_views
+from .mixins import (
+    AnonymousPageCacheMixin,
+    ConditionalGetMixin,
+    CursorPaginationMixin,
+    PostViewsMixin,
+    RequestObjectMixin,
+    TitleMixin,
+)
+from .models import SEARCH_CONFIG, Post
+from .paginators import TimelinePaginator
+from .redis_services import (
+    get_autocomplete_items,
+    get_cached_search_page,
+    get_comments_state,
+    get_page_group_state,
+    get_search_generation,
+    get_timeline_pull_authors,
+    prefetch_posts_views,
+    register_post_view,
+    set_cached_search_page,
+)
 from .tasks import send_feedback_task
+from .utils import (
+    HOME_PAGE_GROUP,
+    StripTags,
+    anonymous_page_cache,
+    get_post_page_group,
+    get_trending_posts,
+)
 
 # Create your views here.
 
-
-class IndexView(TitleMixin, ListView):
+VISITOR_ID_COOKIE = "visitor_id"
+VISITOR_ID_COOKIE_MAX_AGE = 3600 * 24 * 30 * 12
+SEARCH_HEADLINE_MIN_WORDS = 15
+SEARCH_HEADLINE_MAX_WORDS = 35
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_LIMIT = 10
+POPULAR_POSTS_LIMIT = 10
+# Titles of the trending windows, see TRENDING_WINDOWS in neuron/settings.py
+POPULAR_PERIODS = {"hour": "За час", "day": "За день", "week": "За неделю"}
+POPULAR_DEFAULT_PERIOD = "day"
+
+
+class IndexView(
+    ConditionalGetMixin, AnonymousPageCacheMixin, CursorPaginationMixin, PostViewsMixin, TitleMixin, ListView
+):
     """Main page view"""
 
     title = "Главная страница"
     model = Post
     template_name = "blog/index.html"
     paginate_by = 5
+    cursor_ordering = "-time_update"
     context_object_name = "posts"
     queryset = (
         Post.objects.filter(is_draft=False)
         .filter(is_published=True)
         .filter(is_pinned=False)
         .order_by("-time_update")
+        .defer("article")
         .select_related()
     )
 
     def get_context_data(self, *, object_list=None, **kwargs) -> dict:
         """Add in context pinned post object"""
         context = super().get_context_data(**kwargs)
-        if pinned_posts := self.model.objects.filter(is_pinned=True).select_related():
+        if pinned_posts := self.model.objects.filter(is_pinned=True).defer("article").select_related():
             context["pinned_posts"] = pinned_posts
         return context
 
+    def get_page_cache_group(self) -> str:
+        """Home pages are cached in one group"""
+        return HOME_PAGE_GROUP
+
+    def get_validators(self) -> tuple[str, int | None]:
+        """Home pages change together with their cache group"""
+        generation, modified = get_page_group_state(HOME_PAGE_GROUP)
+        return f"{HOME_PAGE_GROUP}-{generation}", modified
 
-class SubscriptionsView(LoginRequiredMixin, TitleMixin, ListView):
+
+class SubscriptionsView(LoginRequiredMixin, CursorPaginationMixin, TitleMixin, ListView):
     """
     Subscriptions view
     """
@@ -64,6 +119,7 @@ class SubscriptionsView(LoginRequiredMixin, TitleMixin, ListView):
     model = Post
     template_name = "blog/subscriptions_posts.html"
     paginate_by = 5
+    cursor_ordering = "-time_create"
     context_object_name = "posts"
     login_url = reverse_lazy("users:login")
 
@@ -71,31 +127,48 @@ class SubscriptionsView(LoginRequiredMixin, TitleMixin, ListView):
         """
         Returns posts only from those authors who are in the current user's subscriptions.
         """
-        queryset = self.model.objects.filter(
-            author__username__in=self.request.session["subscriptions"],
-            is_published=True,
-        ).select_related()
+        queryset = (
+            self.model.objects.filter(author_id__in=get_subscription_ids(self.request.user.pk), is_published=True)
+            .defer("article")
+            .select_related()
+        )
         return queryset
 
+    def get_cursor_paginator(self, queryset, page_size):
+        """
+        Pages are read from the user's timeline, posts of followed authors with large audiences
+        are read from the database.
+        """
+        pull_authors = list(get_timeline_pull_authors() & get_subscription_ids(self.request.user.pk))
+        return TimelinePaginator(queryset, page_size, self.cursor_ordering, self.request.user.pk, pull_authors)
+
 
-class UnpublishedPostsView(IsStaffRequiredMixin, TitleMixin, ListView):
+class UnpublishedPostsView(IsStaffRequiredMixin, CursorPaginationMixin, TitleMixin, ListView):
     """Unpublished Posts View"""
 
     title = "Неопубликованные посты"
     model = Post
     template_name = "blog/unpublished_posts.html"
     paginate_by = 5
+    cursor_ordering = "-time_update"
     context_object_name = "posts"
-    queryset = Post.objects.filter(is_draft=False).filter(is_published=False).order_by("-time_update").select_related()
+    queryset = (
+        Post.objects.filter(is_draft=False)
+        .filter(is_published=False)
+        .order_by("-time_update")
+        .defer("article")
+        .select_related()
+    )
 
 
-class DraftPostsView(IsAuthorRequiredMixin, TitleMixin, ListView):
+class DraftPostsView(IsAuthorRequiredMixin, CursorPaginationMixin, TitleMixin, ListView):
     """Drafts view"""
 
     title = "Черновики"
     model = Post
     template_name = "blog/draft_posts.html"
     paginate_by = 5
+    cursor_ordering = "-time_create"
     context_object_name = "posts"
 
     def get_queryset(self):
@@ -104,12 +177,13 @@ class DraftPostsView(IsAuthorRequiredMixin, TitleMixin, ListView):
             Post.objects.filter(is_draft=True)
             .filter(author=self.request.user)
             .order_by("-time_create")
+            .defer("article")
             .select_related()
         )
         return queryset
 
 
-class PostDetailView(DetailView):
+class PostDetailView(RequestObjectMixin, ConditionalGetMixin, AnonymousPageCacheMixin, DetailView):
     """Post detail view"""
 
     model = Post
@@ -125,38 +199,76 @@ class PostDetailView(DetailView):
         """
         context = super().get_context_data(**kwargs)
         if self.request.method == "GET":
-            context["form"] = self.comment_form()
+            reply_to = self.request.GET.get("reply_to", "")
+            context["form"] = self.comment_form(initial={"parent": reply_to} if reply_to.isdigit() else None)
         return context
 
     def post(self, request, *args, **kwargs):
         """
         Create post comment, if method is POST
         """
-        post = get_object_or_404(self.model, slug=kwargs["post_slug"])
-        author = request.user
-        content = request.POST["content"]
-        form = CommentForm({"post": post, "author": author, "content": content})
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), reverse("users:login"))
+        self.object = self.get_object()
+        form = CommentForm(
+            {"content": request.POST["content"], "parent": request.POST.get("parent")},
+            instance=Comment(post=self.object, author=request.user),
+        )
         if form.is_valid():
             form.save()
-            self.object = self.get_object()
             context = super().get_context_data(**kwargs)
             context["form"] = self.comment_form()
             return self.render_to_response(context=context)
-        self.object = self.get_object()
         context = super().get_context_data(**kwargs)
         context["form"] = form
         return self.render_to_response(context=context)
 
+    def get_page_cache_group(self) -> str:
+        """Pages of the post are cached in its own group"""
+        return get_post_page_group(self.kwargs["post_slug"])
+
+    def get_validators(self) -> tuple[str, int]:
+        """
+        The page changes with the post, its author's profile and counters and its comments.
+        The number of views is not taken into account.
+        """
+        post = self.get_object()
+        author = post.author
+        comments_version, comments_modified = get_comments_state(post.pk)
+        validators = (
+            post.pk,
+            post.time_update,
+            author.username,
+            author.first_name,
+            author.photo.name,
+            author.bio,
+            author.subscribers_count,
+            author.subscriptions_count,
+            author.published_posts_count,
+        )
+        etag = hashlib.sha1(repr((*validators, comments_version)).encode()).hexdigest()
+        return etag, max(int(post.time_update.timestamp()), comments_modified or 0)
+
     def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
         """
-        Increases the number of views if there are no cookies. Sets the cookie if it does not exist.
+        Increases the number of views if the visitor has not viewed the post yet,
+        also when the page is taken from the cache or has not been modified.
+        Sets the visitor id cookie if it does not exist.
         """
         response: HttpResponse = super().get(request, *args, **kwargs)
         object_instance = self.get_object()
-        cookie_name = "post_view_" + str(object_instance.pk)
-        if cookie_name not in self.request.COOKIES:
-            increase_post_views(object_instance)
-            response.set_cookie(cookie_name, "true", max_age=3600 * 24 * 30 * 12)
+        visitor_id = request.COOKIES.get(VISITOR_ID_COOKIE)
+        if visitor_id is None:
+            visitor_id = uuid.uuid4().hex
+            response.set_cookie(
+                VISITOR_ID_COOKIE, visitor_id, max_age=VISITOR_ID_COOKIE_MAX_AGE, httponly=True, samesite="Lax"
+            )
+        register_post_view(object_instance, visitor_id)
+
+        # Remove the per post cookies used before the visitor id
+        for cookie_name in request.COOKIES:
+            if cookie_name.startswith("post_view_"):
+                response.delete_cookie(cookie_name)
 
         return response
 
@@ -194,7 +306,7 @@ class AddPost(IsAuthorRequiredMixin, TitleMixin, CreateView):
         return kwargs
 
 
-class EditUnpublishedPost(IsStaffRequiredMixin, TitleMixin, UpdateView):
+class EditUnpublishedPost(IsStaffRequiredMixin, RequestObjectMixin, TitleMixin, UpdateView):
     """View for staff to edit an unpublished post"""
 
     title = "Редактирование поста"
@@ -229,7 +341,7 @@ class EditUnpublishedPost(IsStaffRequiredMixin, TitleMixin, UpdateView):
         return queryset
 
 
-class EditDraftPost(IsAuthorDraftRequiredMixin, TitleMixin, UpdateView):
+class EditDraftPost(IsAuthorDraftRequiredMixin, RequestObjectMixin, TitleMixin, UpdateView):
     """View for staff to edit a draft"""
 
     title = "Редактирование поста"
@@ -276,6 +388,7 @@ def set_editor(request: HttpRequest) -> HttpResponseRedirect:
     return HttpResponseRedirect(reverse_lazy("unpublished_posts"))
 
 
+@anonymous_page_cache("about")
 def about(request):
     """
     Page about view
@@ -283,6 +396,7 @@ def about(request):
     return TemplateResponse(request, "blog/about.html")
 
 
+@anonymous_page_cache("gallery")
 def gallery(request):
     """
     Page gallery view
@@ -304,13 +418,118 @@ def contact(request: HttpRequest) -> HttpResponse:
     return render(request, "blog/contact.html", context={"form": form})
 
 
-def search(request: HttpRequest) -> HttpResponse:
-    if request.method == "GET":
-        form = SearchForm(request.GET)
-        if form.is_valid():
-            posts = Post.objects.annotate(search=SearchVector("title", "article")).filter(
-                search=request.GET["text"], is_published=True, is_draft=False
+class SearchView(PostViewsMixin, TitleMixin, ListView):
+    """
+    Search view.
+
+    Results are ordered by relevance and show a highlighted snippet of the article instead of the article itself.
+    """
+
+    title = "Поиск"
+    model = Post
+    template_name = "blog/search.html"
+    paginate_by = 5
+    context_object_name = "posts"
+
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        """
+        Bind the search form to the query parameters
+        """
+        self.form = SearchForm(request.GET or None)
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self) -> QuerySet:
+        """
+        Return published posts matching the query, the most relevant first
+        """
+        if not self.form.is_valid():
+            return self.model.objects.none()
+        query = SearchQuery(self.form.cleaned_data["text"], config=SEARCH_CONFIG)
+        queryset = (
+            self.model.objects.filter(search_vector=query, is_published=True, is_draft=False)
+            .defer("article")
+            .annotate(
+                rank=SearchRank(F("search_vector"), query),
+                headline=SearchHeadline(
+                    StripTags("article"),
+                    query,
+                    config=SEARCH_CONFIG,
+                    start_sel="<mark>",
+                    stop_sel="</mark>",
+                    min_words=SEARCH_HEADLINE_MIN_WORDS,
+                    max_words=SEARCH_HEADLINE_MAX_WORDS,
+                ),
             )
-            return render(request, "blog/search.html", context={"form": form, "posts": posts})
-    form = SearchForm()
-    return render(request, "blog/search.html", context={"form": form})
+            .order_by("-rank", "-time_update", "-pk")
+            .select_related("author")
+        )
+        return queryset
+
+    def paginate_queryset(self, queryset: QuerySet, page_size: int) -> tuple:
+        """
+        Serve the page from the search cache.
+
+        On a miss the page is paginated as usual and its post ids are cached.
+        On a hit the full-text query and COUNT are skipped, the posts are loaded by id.
+        """
+        page_number = self.request.GET.get(self.page_kwarg) or "1"
+        if not self.form.is_valid() or not page_number.isdigit():
+            return super().paginate_queryset(queryset, page_size)
+
+        text = " ".join(self.form.cleaned_data["text"].lower().split())
+        generation = get_search_generation()
+        cached = get_cached_search_page(generation, text, int(page_number))
+        if cached is None:
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            set_cached_search_page(generation, text, page.number, [post.pk for post in object_list], paginator.count)
+            return paginator, page, object_list, is_paginated
+
+        ids, count = cached
+        # The filters of the queryset still apply, so a post unpublished since is never shown
+        posts = queryset.order_by().in_bulk(ids)
+        paginator = self.get_paginator(queryset, page_size)
+        paginator.count = count
+        page = Page([posts[pk] for pk in ids if pk in posts], int(page_number), paginator)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, *, object_list=None, **kwargs) -> dict:
+        """Add in context search form object"""
+        context = super().get_context_data(**kwargs)
+        context["form"] = self.form
+        return context
+
+
+class PopularPostsView(PostViewsMixin, TitleMixin, ListView):
+    """
+    Posts with the most views in the trending window of the "period" parameter
+    """
+
+    title = "Популярное"
+    template_name = "blog/popular_posts.html"
+    context_object_name = "posts"
+
+    def get_period(self) -> str:
+        """Return the requested window, unknown windows fall back to the default one"""
+        period = self.request.GET.get("period")
+        return period if period in POPULAR_PERIODS else POPULAR_DEFAULT_PERIOD
+
+    def get_queryset(self) -> list:
+        """Posts are ranked in Redis and loaded by id"""
+        return get_trending_posts(self.get_period(), POPULAR_POSTS_LIMIT)
+
+    def get_context_data(self, *, object_list=None, **kwargs) -> dict:
+        """Add in context the periods and the current one"""
+        context = super().get_context_data(**kwargs)
+        context["periods"] = POPULAR_PERIODS
+        context["period"] = self.get_period()
+        return context
+
+
+def autocomplete(request: HttpRequest) -> JsonResponse:
+    """
+    Returns post titles and author usernames with a word starting with the "q" parameter.
+    Served from the prefix index in Redis, the database is not queried.
+    """
+    text = request.GET.get("q", "").strip()
+    results = get_autocomplete_items(text, AUTOCOMPLETE_LIMIT) if len(text) >= AUTOCOMPLETE_MIN_LENGTH else []
+    return JsonResponse({"results": results}, json_dumps_params={"ensure_ascii": False})
@@ -5,8 +5,8 @@ from .models import Comment
 
 # Register your models here.
 class CommentAdmin(admin.ModelAdmin):
-    readonly_fields = ("time_create",)
-    list_display = ("cut_content", "author", "post")
+    readonly_fields = ("time_create", "parent")
+    list_display = ("cut_content", "author", "post", "parent")
 
 
 admin.site.register(Comment, CommentAdmin)
@@ -4,16 +4,23 @@ from .models import Comment
 
 
 class CommentForm(forms.ModelForm):
-    """Comment's form"""
+    """
+    Comment's form.
+    The post and the author are taken from the request, not from the submitted data.
+    A reply can be given only to a published comment of the same post.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["parent"].queryset = Comment.objects.filter(post=self.instance.post_id, is_published=True)
 
     class Meta:
         """Metadata"""
 
         model = Comment
-        fields = ("content", "post", "author")
+        fields = ("content", "parent")
         widgets = {
-            "post": forms.HiddenInput,
-            "author": forms.HiddenInput,
+            "parent": forms.HiddenInput(),
             "content": forms.Textarea(
                 attrs={
                     "name": "message",
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comments", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="comment",
+            options={"ordering": ["time_create"], "verbose_name": "Комментарий", "verbose_name_plural": "Комментарии"},
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("is_published", True)),
+                fields=["post", "time_create", "id"],
+                name="comments_post_published_idx",
+            ),
+        ),
+    ]
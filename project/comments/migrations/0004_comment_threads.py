@@ -0,0 +1,42 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Existing comments are comments to the post, their path is their own id
+FILL_PATHS = "UPDATE comments_comment SET path = lpad(id::text, 12, '0');"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comments", "0003_comment_post_published_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="comments.comment",
+                verbose_name="Ответ на",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(db_collation="C", default="", editable=False, max_length=255, verbose_name="Путь"),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(FILL_PATHS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("is_published", True)), fields=["post", "path"], name="comments_post_thread_idx"
+            ),
+        ),
+    ]
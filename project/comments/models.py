@@ -1,7 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 
 # Create your models here.
 
+# The path of a comment is the ids of its ancestors and its own id, each zero-padded to the same length,
+# so ordering by path lists a thread in reading order and a subtree is a range of paths.
+PATH_STEP_LENGTH = 12
+# Greater than any digit, path + PATH_SUBTREE_END is the upper bound of the subtree paths
+PATH_SUBTREE_END = "~"
+# Replies to comments at the maximum depth are added to their thread at the same depth
+COMMENT_MAX_DEPTH = 5
+
 
 class Comment(models.Model):
     """Comment's model"""
@@ -11,10 +19,33 @@ class Comment(models.Model):
     author = models.ForeignKey("users.CustomUser", on_delete=models.CASCADE, verbose_name="Автор")
     time_create = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
     is_published = models.BooleanField(default=True, verbose_name="Опубликовать?")
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, null=True, blank=True, verbose_name="Ответ на", related_name="replies"
+    )
+    # Compared byte by byte, so that PATH_SUBTREE_END sorts after the digits in any database locale
+    path = models.CharField(max_length=255, editable=False, db_collation="C", verbose_name="Путь")
 
     def __str__(self):
         return f"{self.post.title} - {self.author.username} - {self.content[:20]}"
 
+    @property
+    def depth(self) -> int:
+        """Returns the nesting level of the comment, 0 for comments to the post"""
+        return len(self.path) // PATH_STEP_LENGTH - 1
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the comment in one transaction with the comment counters of the post.
+        The path of a new comment is built from its id, so it is written after the insert.
+        """
+        if self.parent is not None and self.parent.depth >= COMMENT_MAX_DEPTH:
+            self.parent = self.parent.parent
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not self.path:
+                self.path = (self.parent.path if self.parent is not None else "") + f"{self.pk:0{PATH_STEP_LENGTH}d}"
+                Comment.objects.filter(pk=self.pk).update(path=self.path)
+
     def cut_content(self):
         """Returns the first 50 characters of a comment"""
         cut = self.content[:50]
@@ -26,3 +57,17 @@ class Comment(models.Model):
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ["time_create"]
+        indexes = [
+            # The last comment of a post for the post counters, see blog.utils.remove_post_comment
+            models.Index(
+                fields=["post", "time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="comments_post_published_idx",
+            ),
+            # Threads of a post are read page by page in the path order, see comments.paginators
+            models.Index(
+                fields=["post", "path"],
+                condition=models.Q(is_published=True),
+                name="comments_post_thread_idx",
+            ),
+        ]
@@ -0,0 +1,75 @@
+from django.db import models
+from django.db.models import Subquery, Value
+from django.db.models.functions import Coalesce
+
+from blog.paginators import InvalidCursor
+
+from .models import PATH_SUBTREE_END, Comment
+
+
+class ThreadPage:
+    """
+    Page of comment threads: comments to the post with all their replies, in reading order
+    """
+
+    def __init__(self, object_list: list[Comment], has_next: bool):
+        self.object_list = object_list
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    @property
+    def next_cursor(self) -> str | None:
+        """Cursor of the next page, the path of the last thread on the page"""
+        roots = [comment for comment in self.object_list if comment.parent_id is None]
+        return roots[-1].path if roots else None
+
+
+class ThreadPaginator:
+    """
+    Paginator of comment threads.
+
+    A page is per_page comments to the post with all their replies. Threads follow each other
+    in the path order, so the page is one range of paths, loaded by a single query.
+    """
+
+    def __init__(self, object_list: models.QuerySet, per_page: int):
+        self.object_list = object_list
+        self.per_page = per_page
+
+    def get_page_queryset(self, after: str | None = None) -> models.QuerySet:
+        """
+        Returns comments of the page ordered by path.
+        The range ends at the first thread of the next page, which is annotated as page_end.
+        """
+        comments = self.object_list.order_by("path")
+        if after is not None:
+            if not after.isdigit():
+                raise InvalidCursor(after)
+            comments = comments.filter(path__gt=after + PATH_SUBTREE_END)
+        next_page_root = comments.filter(parent=None).values("path")[self.per_page : self.per_page + 1]
+        return comments.annotate(page_end=Subquery(next_page_root)).filter(
+            path__lt=Coalesce("page_end", Value(PATH_SUBTREE_END))
+        )
+
+    def page(self, after: str | None = None) -> ThreadPage:
+        """
+        Returns the page of threads following the "after" cursor, without a cursor the first page.
+        Replies to hidden comments are hidden too.
+        """
+        comments = list(self.get_page_queryset(after))
+        visible = set()
+        object_list = []
+        for comment in comments:
+            if comment.parent_id is None or comment.parent_id in visible:
+                visible.add(comment.pk)
+                object_list.append(comment)
+        has_next = bool(comments) and comments[0].page_end is not None
+        return ThreadPage(object_list, has_next)
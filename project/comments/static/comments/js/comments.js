@@ -0,0 +1,24 @@
+/* Load more comments
+  -----------------------------------------------*/
+
+// The link to the next page of comments is replaced with the loaded page
+document.addEventListener("click", function(event) {
+  var link = event.target.closest(".comments-more");
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  fetch(link.href)
+    .then(function(response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function(html) {
+      link.outerHTML = html;
+    })
+    .catch(function() {
+      window.location = link.href;
+    });
+});
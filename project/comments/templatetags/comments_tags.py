@@ -0,0 +1,14 @@
+from django import template
+
+from ..paginators import ThreadPaginator
+from ..views import COMMENTS_PER_PAGE
+
+register = template.Library()
+
+
+@register.inclusion_tag("comments/comment_list.html")
+def post_comments(post) -> dict:
+    """
+    Inserts the first page of the post's comment threads, the following pages are loaded on demand.
+    """
+    return {"post": post, "page_obj": ThreadPaginator(post.get_comments(), COMMENTS_PER_PAGE).page()}
@@ -1,9 +1,16 @@
+import re
+
 from blog.models import Post
 from blog.tests import CreateTestUsersAndPostsMixin
+from django.core.cache import caches
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
 from users.models import CustomUser
 
-from .models import Comment
+from .models import COMMENT_MAX_DEPTH, Comment
+from .paginators import ThreadPaginator
+from .views import COMMENTS_PER_PAGE
 
 # Create your tests here.
 
@@ -28,9 +35,160 @@ class CommentTestCase(CreateTestUsersAndPostsMixin, TestCase):
 
     def test_comment_get_record(self):
         """Test comment's data"""
-        test_comment: Comment = Comment.objects.get(pk=2)
+        test_comment: Comment = Comment.objects.get(pk=self.comment.pk)
         self.assertEqual(self.comment.content, test_comment.content)
         self.assertEqual(self.comment.post, test_comment.post)
         self.assertEqual(self.comment.author, test_comment.author)
         self.assertEqual(self.comment.time_create, test_comment.time_create)
         self.assertEqual(self.comment.is_published, test_comment.is_published)
+
+
+class PostCommentsTestCase(CreateTestUsersAndPostsMixin, TestCase):
+    """Test paginated comments of a post"""
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.author: CustomUser = CustomUser.objects.get(username="author")
+        self.post: Post = Post.objects.get(slug="published-post")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comments = [
+                Comment.objects.create(content=f"comment {number}", post=self.post, author=self.author)
+                for number in range(COMMENTS_PER_PAGE + 5)
+            ]
+            Comment.objects.create(content="hidden comment", post=self.post, author=self.author, is_published=False)
+
+    def test_first_page_on_post_page(self):
+        """Test that the post page shows only the first page of comments"""
+        response = self.client.get(reverse("post", kwargs={"post_slug": self.post.slug}))
+        self.assertContains(response, "comment 0<")
+        self.assertContains(response, f"comment {COMMENTS_PER_PAGE - 1}<")
+        self.assertNotContains(response, f"comment {COMMENTS_PER_PAGE}<")
+        self.assertNotContains(response, "hidden comment")
+        self.assertContains(response, 'class="comments-more"')
+
+    def test_next_page(self):
+        """Test that the link of the post page loads the rest of comments"""
+        response = self.client.get(reverse("post", kwargs={"post_slug": self.post.slug}))
+        url = re.search(r'href="([^"]+)" class="comments-more"', response.content.decode()).group(1)
+        response = self.client.get(url.replace("&amp;", "&"))
+        self.assertEqual(response.status_code, 200)
+        contents = re.findall(r"<p>(.*?)</p>", response.content.decode())
+        self.assertEqual(contents, [comment.content for comment in self.comments[COMMENTS_PER_PAGE:]])
+        self.assertNotContains(response, 'class="comments-more"')
+
+    def test_deleted_comment_invalidates_pages(self):
+        """Test that cached pages of comments don't show a deleted comment"""
+        url = reverse("comments:post_comments", kwargs={"post_slug": self.post.slug})
+        self.assertContains(self.client.get(url), "comment 0<")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comments[0].delete()
+        response = self.client.get(url)
+        self.assertNotContains(response, "comment 0<")
+        self.assertContains(response, f"comment {COMMENTS_PER_PAGE}<")
+
+    def test_not_found(self):
+        """Test that comments of unpublished posts and broken cursors are not found"""
+        url = reverse("comments:post_comments", kwargs={"post_slug": "unpublished-post"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse("comments:post_comments", kwargs={"post_slug": self.post.slug})
+        self.assertEqual(self.client.get(url, {"after": "broken"}).status_code, 404)
+
+    def test_page_query_uses_index(self):
+        """Test that a page of threads is read by the partial index"""
+        paginator = ThreadPaginator(self.post.get_comments(), COMMENTS_PER_PAGE)
+        queryset = paginator.get_page_queryset(after=self.comments[3].path)
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+        self.assertIn("comments_post_thread_idx", plan)
+        self.assertNotIn("comments_post_published_idx", plan)
+
+
+class CommentThreadsTestCase(CreateTestUsersAndPostsMixin, TestCase):
+    """Test threaded comments"""
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.author: CustomUser = CustomUser.objects.get(username="author")
+        self.post: Post = Post.objects.get(slug="published-post")
+
+    def add_comment(self, content, parent=None, **kwargs) -> Comment:
+        """Creates a comment to the post"""
+        return Comment.objects.create(content=content, post=self.post, author=self.author, parent=parent, **kwargs)
+
+    def test_path(self):
+        """Test that the path consists of ids of the ancestors and the comment"""
+        root = self.add_comment("root")
+        reply = self.add_comment("reply", root)
+        self.assertEqual(root.path, f"{root.pk:012d}")
+        self.assertEqual(Comment.objects.get(pk=reply.pk).path, f"{root.pk:012d}{reply.pk:012d}")
+        self.assertEqual((root.depth, reply.depth), (0, 1))
+
+    def test_max_depth(self):
+        """Test that replies deeper than the maximum depth are added at the maximum depth"""
+        comment = self.add_comment("root")
+        for number in range(COMMENT_MAX_DEPTH + 2):
+            comment = self.add_comment(f"reply {number}", comment)
+        self.assertEqual(comment.depth, COMMENT_MAX_DEPTH)
+        self.assertEqual(max(comment.depth for comment in Comment.objects.all()), COMMENT_MAX_DEPTH)
+
+    def test_page_in_reading_order(self):
+        """Test that threads are listed in reading order and the page is loaded by one query"""
+        first = self.add_comment("first")
+        second = self.add_comment("second")
+        first_reply = self.add_comment("first reply", first)
+        second_reply = self.add_comment("second reply", second)
+        nested_reply = self.add_comment("nested reply", first_reply)
+        later_reply = self.add_comment("later reply", first)
+        with self.assertNumQueries(1):
+            page = ThreadPaginator(self.post.get_comments(), COMMENTS_PER_PAGE).page()
+            self.assertEqual(
+                [comment.content for comment in page],
+                [first.content, first_reply.content, nested_reply.content, later_reply.content]
+                + [second.content, second_reply.content],
+            )
+        self.assertFalse(page.has_next())
+
+    def test_pages_keep_threads(self):
+        """Test that a page contains whole threads"""
+        roots = [self.add_comment(f"root {number}") for number in range(3)]
+        replies = [self.add_comment(f"reply {number}", roots[1]) for number in range(3)]
+        paginator = ThreadPaginator(self.post.get_comments(), 2)
+        page = paginator.page()
+        self.assertEqual(page.object_list, [roots[0], roots[1], *replies])
+        self.assertTrue(page.has_next())
+        self.assertEqual(page.next_cursor, roots[1].path)
+        page = paginator.page(after=page.next_cursor)
+        self.assertEqual(page.object_list, [roots[2]])
+        self.assertFalse(page.has_next())
+
+    def test_hidden_comment_hides_replies(self):
+        """Test that replies to an unpublished comment are not shown"""
+        root = self.add_comment("root")
+        reply = self.add_comment("reply", root)
+        self.add_comment("nested reply", reply)
+        reply.is_published = False
+        reply.save()
+        page = ThreadPaginator(self.post.get_comments(), COMMENTS_PER_PAGE).page()
+        self.assertEqual(page.object_list, [root])
+
+    def test_reply_on_post_page(self):
+        """Test replying to a comment on the post page"""
+        root = self.add_comment("root")
+        url = reverse("post", kwargs={"post_slug": self.post.slug})
+        self.client.force_login(CustomUser.objects.get(username="user"))
+        response = self.client.get(url, {"reply_to": root.pk})
+        self.assertContains(response, f'name="parent" value="{root.pk}"')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data={"content": "reply", "parent": root.pk})
+        self.assertEqual(response.status_code, 200)
+        reply = Comment.objects.get(content="reply")
+        self.assertEqual(reply.parent, root)
+        self.assertContains(self.client.get(url), f'id="comment-{reply.pk}" style="margin-left: 40px"')
+
+        other_post_comment = Comment.objects.create(
+            content="other", post=Post.objects.get(slug="unpublished-post"), author=self.author
+        )
+        self.client.post(url, data={"content": "wrong reply", "parent": other_post_comment.pk})
+        self.assertFalse(Comment.objects.filter(content="wrong reply").exists())
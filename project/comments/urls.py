@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import views
+
+app_name = "comments"
+urlpatterns = [
+    path("<slug:post_slug>", views.PostCommentsView.as_view(), name="post_comments"),
+]
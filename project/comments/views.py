@@ -1,3 +1,54 @@
-from django.shortcuts import render
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.views.generic.list import ListView
+
+from blog.mixins import AnonymousPageCacheMixin
+from blog.models import Post
+from blog.paginators import InvalidCursor
+from blog.utils import get_post_page_group
+
+from .paginators import ThreadPaginator
 
 # Create your views here.
+
+COMMENTS_PER_PAGE = 20
+
+
+class PostCommentsView(AnonymousPageCacheMixin, ListView):
+    """
+    Returns a page of comment threads of a post as an HTML fragment.
+    The post page shows the first page, the following pages are loaded on demand.
+    """
+
+    template_name = "comments/comment_list.html"
+    paginate_by = COMMENTS_PER_PAGE
+
+    def get_queryset(self):
+        """
+        Comments of a published post
+        """
+        self.post = get_object_or_404(
+            Post.objects.filter(is_draft=False, is_published=True).only("slug"), slug=self.kwargs["post_slug"]
+        )
+        return self.post.get_comments()
+
+    def paginate_queryset(self, queryset, page_size):
+        """Return the page of threads following the "after" cursor"""
+        paginator = ThreadPaginator(queryset, page_size)
+        try:
+            page = paginator.page(after=self.request.GET.get("after"))
+        except InvalidCursor:
+            raise Http404("Неверный курсор")
+        return (paginator, page, page.object_list, page.has_next())
+
+    def get_context_data(self, **kwargs):
+        """
+        Add the post to the context for links to the next page
+        """
+        context = super().get_context_data(**kwargs)
+        context["post"] = self.post
+        return context
+
+    def get_page_cache_group(self) -> str:
+        """Comment pages are invalidated together with the post page"""
+        return get_post_page_group(self.kwargs["post_slug"])
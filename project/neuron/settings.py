@@ -109,11 +109,19 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "neuron.wsgi.application"
 
+TEST_RUNNER = "neuron.test_runner.TestRunner"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
 
+# Connections are kept open between requests for CONN_MAX_AGE seconds and checked before they are reused.
+# Set POSTGRES_PGBOUNCER to connect through PgBouncer in transaction pooling mode (POSTGRES_HOST is then
+# the PgBouncer host). A server connection is not kept between transactions there, so server-side cursors
+# of QuerySet.iterator() are disabled.
+POSTGRES_PGBOUNCER = os.getenv("POSTGRES_PGBOUNCER", "False") == "True"
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -122,9 +130,28 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
+        "CONN_MAX_AGE": int(os.getenv("POSTGRES_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "DISABLE_SERVER_SIDE_CURSORS": POSTGRES_PGBOUNCER,
     }
 }
 
+# Cache settings
+
+# Template fragments are cached in the memory of each process. Their keys include versions of the rendered
+# objects, so changed objects are rendered again and processes don't need to invalidate each other's entries.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "fragments",
+        "TIMEOUT": 3600,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", 5000))},
+    },
+}
+
 # CustomUser settings
 
 AUTH_USER_MODEL = "users.CustomUser"
@@ -191,6 +218,63 @@ CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_TIMEZONE = "Europe/Moscow"
+CELERY_BEAT_SCHEDULE = {
+    "flush-post-views": {
+        "task": "blog.tasks.flush_post_views_task",
+        "schedule": float(os.getenv("POST_VIEWS_FLUSH_INTERVAL", 60)),
+    },
+    "renormalize-trending-posts": {
+        "task": "blog.tasks.renormalize_trending_posts_task",
+        "schedule": float(os.getenv("TRENDING_RENORMALIZE_INTERVAL", 60)),
+    },
+}
+
+# Redis settings
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_DB = int(os.getenv("REDIS_DB", 1))
+# Tests run against their own database, see neuron/test_runner.py
+REDIS_TEST_DB = int(os.getenv("REDIS_TEST_DB", 15))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 20))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 1.0))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+# Post views settings
+
+# How long records of flushed view batches are kept
+POST_VIEWS_FLUSH_LOG_TTL = 3600 * 24
+
+# Search settings
+
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 300))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 1000))
+
+# Page cache settings
+
+# Pages for anonymous visitors are invalidated on changes, the TTL bounds staleness of the rest (view counters)
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", 300))
+
+# Subscription settings
+
+# How long ids of followed authors stay cached after they are loaded
+SUBSCRIPTIONS_CACHE_TTL = int(os.getenv("SUBSCRIPTIONS_CACHE_TTL", 3600 * 24))
+
+# Subscription timeline settings
+
+# Number of the newest posts kept in a timeline
+TIMELINE_MAX_LENGTH = int(os.getenv("TIMELINE_MAX_LENGTH", 1000))
+# Posts of authors with more subscribers are read from the database instead of being fanned out
+TIMELINE_FANOUT_MAX_SUBSCRIBERS = int(os.getenv("TIMELINE_FANOUT_MAX_SUBSCRIBERS", 5000))
+TIMELINE_FANOUT_BATCH_SIZE = 1000
+
+# Trending posts settings
+
+# Half-lives of views in the trending windows, seconds
+TRENDING_WINDOWS = {"hour": 3600, "day": 3600 * 24, "week": 3600 * 24 * 7}
+# Number of posts kept in a window and the score below which a post is dropped
+TRENDING_MAX_POSTS = int(os.getenv("TRENDING_MAX_POSTS", 1000))
+TRENDING_MIN_SCORE = 0.1
 
 # Message settings
 MESSAGE_TAGS = {
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test.runner import DiscoverRunner
+
+from blog.redis_services import get_redis_connection, reset_connection_pool
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests against a separate Redis database, like Django does with PostgreSQL.
+    Tests remove Redis keys freely, so they must not touch the database with real views and timelines.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        if settings.REDIS_TEST_DB == settings.REDIS_DB:
+            raise ImproperlyConfigured("REDIS_TEST_DB must differ from REDIS_DB")
+        self.redis_db = settings.REDIS_DB
+        settings.REDIS_DB = settings.REDIS_TEST_DB
+        reset_connection_pool()
+        get_redis_connection().flushdb()
+
+    def teardown_test_environment(self, **kwargs):
+        get_redis_connection().flushdb()
+        settings.REDIS_DB = self.redis_db
+        reset_connection_pool()
+        super().teardown_test_environment(**kwargs)
@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
@@ -25,6 +26,7 @@ urlpatterns = [
     path("ckeditor/", include("ckeditor_uploader.urls")),
     path("", include("blog.urls")),
     path("user/", include("users.urls", namespace="users")),
+    path("comments/", include("comments.urls", namespace="comments")),
     path("__debug__/", include("debug_toolbar.urls")),
 ]
 
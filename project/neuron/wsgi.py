@@ -14,3 +14,26 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "neuron.settings")
 
 application = get_wsgi_application()
+
+
+def close_connections() -> None:
+    """
+    Closes connections opened while the application was loaded.
+    Without lazy-apps uWSGI loads the application in the master and forks the workers from it,
+    the workers must not share its sockets.
+
+    This is the only safe place to do it: a connection inherited by a worker can't be dropped
+    after the fork, because the garbage collector would still close the shared socket and end
+    the session of the master and the other workers. Closed here, every worker opens its own
+    connections on the first request.
+    """
+    from django.db import connections
+
+    from blog.redis_services import reset_connection_pool
+
+    connections.close_all()
+    reset_connection_pool()
+
+
+# Runs before uWSGI forks the workers
+close_connections()
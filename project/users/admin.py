@@ -7,7 +7,7 @@ from .models import CustomUser
 # Register your models here.
 class CustomUserAdmin(UserAdmin):
     empty_value_display = "Пусто"
-    readonly_fields = ("date_joined", "last_login")
+    readonly_fields = ("date_joined", "last_login", "subscribers_count", "subscriptions_count", "published_posts_count")
     list_display = (
         "username",
         "first_name",
@@ -35,6 +35,7 @@ class CustomUserAdmin(UserAdmin):
                 ),
             },
         ),
+        (("Counters"), {"fields": ("subscribers_count", "subscriptions_count", "published_posts_count")}),
         (("Important dates"), {"fields": ("last_login", "date_joined")}),
     )
 
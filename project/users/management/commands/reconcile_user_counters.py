@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from users.utils import reconcile_user_counters
+
+
+class Command(BaseCommand):
+    """
+    Command to repair subscribers, subscriptions and published posts counters of users.
+    The counters are maintained by the subscription and post signals, the command fixes drift
+    left by changes that bypass them, such as QuerySet.update() or raw SQL.
+    """
+
+    help = "Recalculates subscribers, subscriptions and published posts counters of users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of users updated by one query")
+
+    def handle(self, *args, **options):
+        count = reconcile_user_counters(options["batch_size"])
+        self.stdout.write(f"Fixed {count} users")
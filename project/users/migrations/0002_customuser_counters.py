@@ -0,0 +1,51 @@
+# Generated by Django 4.2.9 on 2026-10-18 19:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Counters of existing users, later they are maintained by the subscription and post signals
+FILL_COUNTERS = """
+UPDATE users_customuser
+SET
+    subscribers_count = (
+        SELECT count(*) FROM users_customuser_subscriptions WHERE to_customuser_id = users_customuser.id
+    ),
+    subscriptions_count = (
+        SELECT count(*) FROM users_customuser_subscriptions WHERE from_customuser_id = users_customuser.id
+    ),
+    published_posts_count = (
+        SELECT count(*) FROM blog_post WHERE author_id = users_customuser.id AND is_published
+    );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+        ("blog", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="published_posts_count",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Опубликованные посты"),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="subscribers_count",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Подписчики"),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="subscriptions",
+            field=models.ManyToManyField(blank=True, related_name="subscribers", to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="subscriptions_count",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Подписки"),
+        ),
+        migrations.RunSQL(FILL_COUNTERS, migrations.RunSQL.noop),
+    ]
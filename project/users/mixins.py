@@ -4,7 +4,6 @@ from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.contrib.auth.models import AnonymousUser
 from django.db import models
 from django.http.request import HttpRequest
-from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
 
 from .models import CustomUser
@@ -47,7 +46,10 @@ class IsStaffRequiredMixin(PermissionRequiredMixin):
 
 
 class IsAuthorDraftRequiredMixin(PermissionRequiredMixin):
-    """Verify that the current user has author permissions for current post."""
+    """
+    Verify that the current user has author permissions for current post.
+    The view has to load the post with blog.mixins.RequestObjectMixin, which shares it with the view.
+    """
 
     redirect_field_name = "next"
     login_url = reverse_lazy("users:login")
@@ -59,7 +61,9 @@ class IsAuthorDraftRequiredMixin(PermissionRequiredMixin):
         """Returns True or False depending on the user's status."""
         if self.request.user.is_superuser:
             return True
-        self.post_instanse = get_object_or_404(self.model, slug=self.kwargs["post_slug"])
-        if self.post_instanse.author.id == self.request.user.id:
+        if self.request.user.is_anonymous:
+            return False
+        self.post_instanse = self.get_requested_object()
+        if self.post_instanse.author_id == self.request.user.id:
             return True
         return False
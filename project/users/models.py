@@ -7,6 +7,8 @@ from .utils import user_directory_path
 
 # Create your models here.
 
+COUNTER_FIELDS = ("subscribers_count", "subscriptions_count", "published_posts_count")
+
 
 class CustomUser(AbstractUser):
     """
@@ -23,6 +25,9 @@ class CustomUser(AbstractUser):
     is_author = models.BooleanField(default=False, verbose_name="Статус автора")
     is_active = models.BooleanField(default=False, verbose_name="Активен")
     is_banned = models.BooleanField(default=False, verbose_name="Заблокирован")
+    subscribers_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Подписчики")
+    subscriptions_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Подписки")
+    published_posts_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Опубликованные посты")
     objects = CustomUserManager()
 
     def __str__(self):
@@ -41,6 +46,20 @@ class CustomUser(AbstractUser):
         if not self.is_banned:
             self.is_active = True
 
+    def save(self, *args, **kwargs):
+        """
+        Counters are updated by the subscription and post signals with single UPDATE queries,
+        so saving a stale instance doesn't overwrite them.
+        """
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            deferred_fields = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS and field.attname not in deferred_fields
+            ]
+        return super().save(*args, **kwargs)
+
     class Meta:
         """
         Metadata
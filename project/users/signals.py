@@ -1,10 +1,88 @@
-from django.contrib.auth.signals import user_logged_in
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
 from django.dispatch import receiver
-from django.http import HttpRequest
+
+from blog.redis_services import delete_cached_subscription_ids
+from blog.utils import invalidate_author_info_pages
 
 from .models import CustomUser
+from .utils import update_user_counters
+
+
+@receiver(m2m_changed, sender=CustomUser.subscriptions.through)
+def handle_subscriptions_change(sender, instance, action: str, reverse: bool, pk_set: set[int] | None, **kwargs):
+    """
+    Removes cached subscriptions of the users whose subscriptions changed.
+    They are removed once more after the commit, a request may cache the old subscriptions in between.
+    """
+    if action == "pre_clear" and reverse:
+        # Subscribers of the author are cleared, they are not known after the clear
+        instance._cleared_subscribers = list(instance.subscribers.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == "post_clear":
+        user_ids = instance._cleared_subscribers
+    else:
+        user_ids = list(pk_set)
+    delete_cached_subscription_ids(*user_ids)
+    transaction.on_commit(lambda: delete_cached_subscription_ids(*user_ids))
+
+
+@receiver(m2m_changed, sender=CustomUser.subscriptions.through)
+def update_subscription_counters(sender, instance, action: str, reverse: bool, pk_set: set[int] | None, **kwargs):
+    """
+    Updates subscribers and subscriptions counters in the transaction of the change,
+    cached pages showing the counters are invalidated after the commit.
+    Removed subscriptions are read before the change, the signal is sent with missing subscriptions as well.
+    """
+    if reverse:
+        instance_field, related_field = "to_customuser_id", "from_customuser_id"
+    else:
+        instance_field, related_field = "from_customuser_id", "to_customuser_id"
+    if action in ("pre_remove", "pre_clear"):
+        removed = sender.objects.filter(**{instance_field: instance.pk})
+        if pk_set is not None:
+            removed = removed.filter(**{f"{related_field}__in": pk_set})
+        instance._removed_subscriptions = list(removed.values_list(related_field, flat=True))
+        return
+    if action == "post_add":
+        related_ids, delta = list(pk_set), 1
+    elif action in ("post_remove", "post_clear"):
+        related_ids, delta = instance._removed_subscriptions, -1
+    else:
+        return
+    if not related_ids:
+        return
+    user_ids, author_ids = (related_ids, [instance.pk]) if reverse else ([instance.pk], related_ids)
+    update_user_counters(user_ids, subscriptions_count=delta * len(author_ids))
+    update_user_counters(author_ids, subscribers_count=delta * len(user_ids))
+    transaction.on_commit(partial(invalidate_author_info_pages, [*user_ids, *author_ids]))
+
+
+@receiver(pre_delete, sender=CustomUser)
+def handle_user_delete(sender, instance: CustomUser, **kwargs):
+    """
+    Subscriptions of a deleted user are removed by the cascade without m2m signals,
+    counters of the users on the other side are updated here.
+    """
+    subscriptions = sender.subscriptions.through.objects
+    update_user_counters(
+        subscriptions.filter(from_customuser_id=instance.pk).values("to_customuser_id"), subscribers_count=-1
+    )
+    update_user_counters(
+        subscriptions.filter(to_customuser_id=instance.pk).values("from_customuser_id"), subscriptions_count=-1
+    )
 
 
-@receiver(user_logged_in)
-def handle_user_login(sender, request: HttpRequest, user: CustomUser, **kwargs):
-    request.session["subscriptions"] = [item.username for item in user.subscriptions.all()]
+@receiver(post_save, sender=CustomUser)
+def handle_user_create(sender, instance: CustomUser, created: bool, **kwargs):
+    """
+    A new user has no subscriptions, subscriptions cached for a reused id are removed.
+    """
+    if created:
+        delete_cached_subscription_ids(instance.pk)
@@ -1,5 +1,7 @@
 from django import template
 
+from ..utils import is_subscribed
+
 register = template.Library()
 
 
@@ -18,6 +20,8 @@ def author_info(author) -> dict:
 @register.inclusion_tag("users/tags_templates/subscribe.html", takes_context=True)
 def subscribe_link(context):
     """
-    Adds a link to subscribe
+    Adds a link to subscribe or unsubscribe
     """
-    return {"author": context["post"].author, "user": context["user"]}
+    author, user = context["post"].author, context["user"]
+    subscribed = user.is_authenticated and is_subscribed(user.pk, author.pk)
+    return {"author": author, "user": user, "subscribed": subscribed}
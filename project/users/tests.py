@@ -1,10 +1,15 @@
 import json
+from io import StringIO
 
+from blog.models import Post
+from blog.redis_services import delete_cached_subscription_ids
 from blog.tests import CreateTestUsersAndPostsMixin
+from blog.utils import invalidate_author_info_pages
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.core import mail
+from django.core.management import call_command
 from django.core.signing import Signer
 from django.http import HttpRequest
 from django.http.response import Http404
@@ -16,7 +21,12 @@ from users.views import subscribe, unsubscribe
 
 from neuron.settings import ALLOWED_HOSTS
 
-from .utils import send_activation_notification
+from .utils import (
+    change_subscription,
+    get_subscription_ids,
+    is_subscribed,
+    send_activation_notification,
+)
 
 # Create your tests here.
 # Users for tests
@@ -184,7 +194,6 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
         if not isinstance(user, AnonymousUser):
             middleware = SessionMiddleware(lambda request: None)
             middleware.process_request(request)
-            request.session["subscriptions"] = []
             request.session.save()
 
             middleware = MessageMiddleware(lambda request, response: None)
@@ -193,6 +202,7 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
         return request
 
     def setUp(self):
+        delete_cached_subscription_ids(self.user.pk)
         self.request = self.get_request(self.user)
 
     def tearDown(self):
@@ -240,7 +250,7 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
         self.assertIn("message", json_response)
         self.assertEqual(json_response["message"], f"Вы подписались на автора {self.author.username}")
         self.assertNotEqual(json_response["message"], f"{self.author.username} не является автором")
-        self.assertEqual(self.request.session["subscriptions"], [self.author.username])
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
 
         response = subscribe(self.request, self.author.username)
         self.assertEqual(response.status_code, 200)
@@ -251,7 +261,7 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
         self.assertEqual(json_response["message"], f"Вы уже подписаны на {self.author.username}")
         self.assertNotEqual(json_response["message"], f"Вы подписались на автора {self.author.username}")
         self.assertNotEqual(json_response["message"], f"{self.author.username} не является автором")
-        self.assertEqual(self.request.session["subscriptions"], [self.author.username])
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
 
     def test_subscribe_function_if_username_is_not_owned_by_author(self):
         """
@@ -263,8 +273,7 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
 
         with self.assertRaises(Http404):
             subscribe(self.request, not_author.username)
-        self.assertNotEqual(self.request.session["subscriptions"], [not_author])
-        self.assertEqual(self.request.session["subscriptions"], [])
+        self.assertEqual(get_subscription_ids(self.user.pk), set())
 
     def test_subscribe_function_if_username_does_not_exist(self):
         """
@@ -276,8 +285,7 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
 
         with self.assertRaises(Http404):
             subscribe(self.request, do_not_exist)
-        self.assertNotEqual(self.request.session["subscriptions"], [do_not_exist])
-        self.assertEqual(self.request.session["subscriptions"], [])
+        self.assertEqual(get_subscription_ids(self.user.pk), set())
 
     def test_subscribe_function_if_user_is_anonymous(self):
         """
@@ -347,12 +355,13 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.context["user"].is_authenticated)
-        self.assertIsNotNone(self.client.session.get("subscriptions"))
-        self.assertEqual(self.client.session.get("subscriptions"), [])
+        self.assertIsNone(self.client.session.get("subscriptions"))
+        self.assertEqual(get_subscription_ids(self.user.pk), set())
 
         response = self.client.get(reverse("users:subscribe", kwargs={"author_username": self.author.username}))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(self.client.session.get("subscriptions"), ["author"])
+        self.assertIsNone(self.client.session.get("subscriptions"))
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
 
     def test_get_subscribe_data_in_session_when_user_login(self):
         """
@@ -363,8 +372,7 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.context["user"].is_authenticated)
-        self.assertIsNotNone(self.client.session.get("subscriptions"))
-        self.assertEqual(self.client.session.get("subscriptions"), [])
+        self.assertIsNone(self.client.session.get("subscriptions"))
 
         response = self.client.get(reverse("users:subscribe", kwargs={"author_username": self.author.username}))
         self.assertEqual(response.status_code, 200)
@@ -377,9 +385,8 @@ class TestSubscription(CreateTestUsersAndPostsMixin, TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.context["user"].is_authenticated)
-        self.assertIsNotNone(self.client.session.get("subscriptions"))
-        self.assertEqual(self.client.session.get("subscriptions"), ["author"])
-        self.assertIn("author", self.client.session.get("subscriptions"))
+        self.assertIsNone(self.client.session.get("subscriptions"))
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
 
 
 class TestUnsubscribe(CreateTestUsersAndPostsMixin, TestCase):
@@ -418,7 +425,6 @@ class TestUnsubscribe(CreateTestUsersAndPostsMixin, TestCase):
         if not isinstance(user, AnonymousUser):
             middleware = SessionMiddleware(lambda request: None)
             middleware.process_request(request)
-            request.session["subscriptions"] = ["author"]
             request.session.save()
 
             middleware = MessageMiddleware(lambda request, response: None)
@@ -427,6 +433,7 @@ class TestUnsubscribe(CreateTestUsersAndPostsMixin, TestCase):
         return request
 
     def setUp(self):
+        delete_cached_subscription_ids(self.user.pk)
         self.user.subscriptions.add(self.author)
         self.request = self.get_request(self.user)
 
@@ -443,8 +450,7 @@ class TestUnsubscribe(CreateTestUsersAndPostsMixin, TestCase):
         self.assertEqual(json_response["message"], f"Вы отписались от автора {self.author.username}")
         self.assertNotEqual(json_response["message"], "Неавторизованные пользователи не могут отписываться")
         self.assertNotEqual(json_response["message"], f"Вы не подписаны на {self.author}")
-        self.assertNotEqual(self.request.session["subscriptions"], [self.author.username])
-        self.assertEqual(self.request.session["subscriptions"], [])
+        self.assertEqual(get_subscription_ids(self.user.pk), set())
 
     def test_unsubscribe_function_if_username_is_not_owned_by_author(self):
         """
@@ -460,7 +466,7 @@ class TestUnsubscribe(CreateTestUsersAndPostsMixin, TestCase):
         self.assertEqual(json_response["message"], f"Вы не подписаны на {not_author}")
         self.assertNotEqual(json_response["message"], f"Вы отписались от автора {not_author.username}")
         self.assertNotEqual(json_response["message"], "Неавторизованные пользователи не могут отписываться")
-        self.assertEqual(self.request.session["subscriptions"], ["author"])
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
 
     def test_unsubscribe_function_if_username_does_not_exist(self):
         """
@@ -470,14 +476,13 @@ class TestUnsubscribe(CreateTestUsersAndPostsMixin, TestCase):
 
         with self.assertRaises(Http404):
             unsubscribe(self.request, do_not_exist)
-        self.assertEqual(self.request.session["subscriptions"], ["author"])
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
 
     def test_unsubscribe_function_if_username_does_not_in_subscriptions(self):
         """
         Tests the "unsubscribe" function if the author_username does not in user's subscriptions.
         """
         self.user.subscriptions.remove(self.author)
-        self.request.session["subscriptions"].remove(self.author.username)
 
         response = unsubscribe(self.request, self.author.username)
         self.assertEqual(response.status_code, 200)
@@ -488,7 +493,7 @@ class TestUnsubscribe(CreateTestUsersAndPostsMixin, TestCase):
         self.assertEqual(json_response["message"], f"Вы не подписаны на {self.author}")
         self.assertNotEqual(json_response["message"], f"Вы отписались от автора {self.author.username}")
         self.assertNotEqual(json_response["message"], "Неавторизованные пользователи не могут отписываться")
-        self.assertEqual(self.request.session["subscriptions"], [])
+        self.assertEqual(get_subscription_ids(self.user.pk), set())
 
     def test_unsubscribe_function_if_user_is_anonymous(self):
         """
@@ -545,4 +550,218 @@ class TestUnsubscribe(CreateTestUsersAndPostsMixin, TestCase):
 
         response = self.client.get(reverse("users:unsubscribe", kwargs={"author_username": self.author.username}))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(self.client.session.get("subscriptions"), [])
+        self.assertIsNone(self.client.session.get("subscriptions"))
+        self.assertEqual(get_subscription_ids(self.user.pk), set())
+
+
+class TestSubscriptionsCache(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test cached ids of followed authors
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.get(username="user")
+        self.author = CustomUser.objects.get(username="author")
+        self.other_author = CustomUser.objects.get(username="authorstaff")
+        # The cache is not rolled back with the test transaction
+        delete_cached_subscription_ids(self.user.pk, self.other_author.pk)
+
+    def test_cached_after_first_call(self):
+        """
+        Test that subscriptions are loaded from the database once
+        """
+        self.user.subscriptions.add(self.author)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
+        with self.assertNumQueries(1):
+            self.assertEqual(get_subscription_ids(self.other_author.pk), set())
+            self.assertEqual(get_subscription_ids(self.other_author.pk), set())
+
+    def test_invalidated_on_change(self):
+        """
+        Test that changes from both sides of the relation are seen
+        """
+        self.assertEqual(get_subscription_ids(self.user.pk), set())
+        self.user.subscriptions.add(self.author, self.other_author)
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk, self.other_author.pk})
+        self.author.subscribers.remove(self.user)
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.other_author.pk})
+        self.other_author.subscribers.clear()
+        self.assertEqual(get_subscription_ids(self.user.pk), set())
+        self.user.subscriptions.set([self.author])
+        self.assertEqual(get_subscription_ids(self.user.pk), {self.author.pk})
+
+    def test_login_keeps_session_small(self):
+        """
+        Test that subscriptions are not stored in the session
+        """
+        self.user.subscriptions.add(self.author)
+        self.client.force_login(self.user)
+        self.assertNotIn("subscriptions", self.client.session)
+        response = self.client.get(reverse("subscriptions"))
+        self.assertEqual(response.status_code, 200)
+
+
+class TestSubscriptionState(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test checks of subscriptions
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.get(username="user")
+        self.author = CustomUser.objects.get(username="author")
+        delete_cached_subscription_ids(self.user.pk)
+
+    def test_is_subscribed(self):
+        """
+        Test that checks don't query the database once subscriptions are cached
+        """
+        self.user.subscriptions.add(self.author)
+        with self.assertNumQueries(1):
+            self.assertTrue(is_subscribed(self.user.pk, self.author.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_subscribed(self.user.pk, self.author.pk))
+            self.assertFalse(is_subscribed(self.user.pk, self.user.pk))
+
+    def test_change_subscription_checks_database(self):
+        """
+        Test that a stale cache doesn't lead to a second subscription
+        """
+        self.assertFalse(is_subscribed(self.user.pk, self.author.pk))
+        self.assertTrue(change_subscription(self.user, self.author, subscribe=True))
+        self.assertFalse(change_subscription(self.user, self.author, subscribe=True))
+        self.assertEqual(self.user.subscriptions.count(), 1)
+        self.assertTrue(change_subscription(self.user, self.author, subscribe=False))
+        self.assertFalse(change_subscription(self.user, self.author, subscribe=False))
+        self.assertEqual(self.user.subscriptions.count(), 0)
+
+    def test_subscribe_link(self):
+        """
+        Test the link on the post page
+        """
+        self.client.force_login(self.user)
+        url = reverse("post", kwargs={"post_slug": "published-post"})
+        response = self.client.get(url)
+        self.assertContains(response, 'id="subscribe-link"')
+        self.assertNotContains(response, 'id="unsubscribe-link"')
+
+        self.client.get(reverse("users:subscribe", kwargs={"author_username": self.author.username}))
+        response = self.client.get(url)
+        self.assertContains(response, 'id="unsubscribe-link"')
+        self.assertNotContains(response, 'id="subscribe-link"')
+
+
+class TestUserCounters(CreateTestUsersAndPostsMixin, TestCase):
+    """
+    Test subscribers, subscriptions and published posts counters
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.get(username="user")
+        self.author = CustomUser.objects.get(username="author")
+        self.other_author = CustomUser.objects.get(username="authorstaff")
+
+    def assertCounters(self, user, subscribers, subscriptions, posts):
+        user.refresh_from_db()
+        self.assertEqual(
+            (user.subscribers_count, user.subscriptions_count, user.published_posts_count),
+            (subscribers, subscriptions, posts),
+        )
+
+    def test_subscriptions(self):
+        """
+        Test counters after subscriptions are changed from both sides
+        """
+        self.user.subscriptions.add(self.author, self.other_author)
+        self.user.subscriptions.add(self.author)
+        self.assertCounters(self.user, 0, 2, 0)
+        self.assertCounters(self.author, 1, 0, 1)
+        self.assertCounters(self.other_author, 1, 0, 0)
+
+        self.user.subscriptions.remove(self.author)
+        self.user.subscriptions.remove(self.author)
+        self.assertCounters(self.user, 0, 1, 0)
+        self.assertCounters(self.author, 0, 0, 1)
+
+        self.author.subscriptions.add(self.other_author)
+        self.other_author.subscribers.clear()
+        self.assertCounters(self.user, 0, 0, 0)
+        self.assertCounters(self.author, 0, 0, 1)
+        self.assertCounters(self.other_author, 0, 0, 0)
+
+    def test_published_posts(self):
+        """
+        Test counters after posts are published, unpublished and deleted
+        """
+        self.assertCounters(self.author, 0, 0, 1)
+        post = Post.objects.get(slug="unpublished-post")
+        post.is_published = True
+        post.save()
+        self.assertCounters(self.author, 0, 0, 2)
+        post.save()
+        self.assertCounters(self.author, 0, 0, 2)
+        post.is_published = False
+        post.save()
+        self.assertCounters(self.author, 0, 0, 1)
+        Post.objects.get(slug="published-post").delete()
+        self.assertCounters(self.author, 0, 0, 0)
+
+    def test_stale_instance(self):
+        """
+        Test that saving a stale user doesn't overwrite the counters
+        """
+        author = CustomUser.objects.get(pk=self.author.pk)
+        self.user.subscriptions.add(self.author)
+        author.bio = "bio"
+        author.save()
+        self.assertCounters(self.author, 1, 0, 1)
+
+    def test_reconcile_command(self):
+        """
+        Test that the command repairs counters changed bypassing the signals
+        """
+        self.user.subscriptions.add(self.author)
+        CustomUser.objects.update(subscribers_count=5, subscriptions_count=0, published_posts_count=0)
+        out = StringIO()
+        call_command("reconcile_user_counters", batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), f"Fixed {CustomUser.objects.count()} users")
+        self.assertCounters(self.user, 0, 1, 0)
+        self.assertCounters(self.author, 1, 0, 1)
+
+    def test_author_info(self):
+        """
+        Test counters on the post page
+        """
+        self.user.subscriptions.add(self.author)
+        response = self.client.get(reverse("post", kwargs={"post_slug": "published-post"}))
+        self.assertContains(response, "Подписчиков: 1, подписок: 0, постов: 1")
+
+    def test_cached_pages_show_counters(self):
+        """
+        Test that cached pages and validators of anonymous visitors change with the counters after the commit
+        """
+        invalidate_author_info_pages([self.author.pk])
+        post_url = reverse("post", kwargs={"post_slug": "published-post"})
+        urls = [post_url, reverse("home")]
+        for url in urls:
+            self.assertContains(self.client.get(url), "Подписчиков: 0, подписок: 0, постов: 1")
+        etag = self.client.get(post_url).headers["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.subscriptions.add(self.author)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), "Подписчиков: 1, подписок: 0, постов: 1")
+        self.assertEqual(self.client.get(post_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pinned_author_info(self):
+        """
+        Test that the cached card of a pinned post shows the new counters of the author
+        """
+        Post.objects.filter(slug="published-post").update(is_pinned=True)
+        self.client.force_login(self.other_author)
+        self.assertContains(self.client.get(reverse("home")), "Подписчиков: 0, подписок: 0, постов: 1")
+        self.user.subscriptions.add(self.author)
+        self.assertContains(self.client.get(reverse("home")), "Подписчиков: 1, подписок: 0, постов: 1")
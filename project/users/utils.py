@@ -1,9 +1,21 @@
+from typing import Iterable
+
+from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.signing import Signer
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
 
+from blog.redis_services import (
+    cache_subscription_ids,
+    get_cached_subscription_ids,
+    is_cached_subscription,
+)
+
 # from .models import CustomUser
 
 # Create signer object
@@ -28,3 +40,102 @@ def send_activation_notification(user_id) -> None:
     subject = render_to_string("email/activation_letter_subject.txt", context)
     body_text = render_to_string("email/activation_letter_body.txt", context)
     user.email_user(subject.strip(), body_text)
+
+
+def get_subscription_ids(user_id: int) -> set[int]:
+    """
+    Returns ids of the authors the user follows.
+    They are loaded from the database on the first call and cached in Redis, see users.signals.
+    """
+    author_ids = get_cached_subscription_ids(user_id)
+    if author_ids is None:
+        through = get_user_model().subscriptions.through
+        author_ids = set(through.objects.filter(from_customuser_id=user_id).values_list("to_customuser_id", flat=True))
+        cache_subscription_ids(user_id, author_ids)
+    return author_ids
+
+
+def is_subscribed(user_id: int, author_id: int) -> bool:
+    """
+    Checks if the user follows the author without loading the followed users.
+    """
+    subscribed = is_cached_subscription(user_id, author_id)
+    if subscribed is None:
+        subscribed = author_id in get_subscription_ids(user_id)
+    return subscribed
+
+
+def change_subscription(user, author, subscribe: bool) -> bool:
+    """
+    Subscribes the user to the author or unsubscribes them.
+    Returns False if there is nothing to change.
+
+    The row of the user is locked, so concurrent requests of the user are applied one by one
+    and the state is checked in the database, the cached subscriptions may be stale at this moment.
+    """
+    user_model = get_user_model()
+    with transaction.atomic():
+        user_model.objects.select_for_update().filter(pk=user.pk).values_list("pk").get()
+        subscribed = user_model.subscriptions.through.objects.filter(
+            from_customuser_id=user.pk, to_customuser_id=author.pk
+        ).exists()
+        if subscribed == subscribe:
+            return False
+        if subscribe:
+            user.subscriptions.add(author)
+        else:
+            user.subscriptions.remove(author)
+    return True
+
+
+def update_user_counters(user_ids: Iterable[int], **deltas: int) -> None:
+    """
+    Changes counters of the users by the deltas with a single UPDATE, counters don't go below zero.
+    """
+    get_user_model().objects.filter(pk__in=user_ids).update(
+        **{name: Greatest(F(name) + delta, Value(0)) for name, delta in deltas.items()}
+    )
+
+
+def reconcile_user_counters(batch_size: int = 500) -> int:
+    """
+    Recalculates counters of users that differ from their subscriptions and published posts.
+    Returns the number of fixed users.
+    """
+    user_model = get_user_model()
+    through = user_model.subscriptions.through
+    posts = apps.get_model("blog", "Post").objects.filter(is_published=True)
+
+    def count_related(queryset, field: str):
+        return Coalesce(
+            Subquery(
+                queryset.filter(**{field: OuterRef("pk")}).values(field).annotate(count=Count("pk")).values("count")
+            ),
+            0,
+        )
+
+    fields = ["subscribers_count", "subscriptions_count", "published_posts_count"]
+    users = (
+        user_model.objects.only(*fields)
+        .annotate(
+            actual_subscribers=count_related(through.objects.order_by(), "to_customuser"),
+            actual_subscriptions=count_related(through.objects.order_by(), "from_customuser"),
+            actual_posts=count_related(posts.order_by(), "author"),
+        )
+        .order_by("pk")
+    )
+
+    batch = []
+    count = 0
+    for user in users.iterator(chunk_size=batch_size):
+        actual = (user.actual_subscribers, user.actual_subscriptions, user.actual_posts)
+        if (user.subscribers_count, user.subscriptions_count, user.published_posts_count) == actual:
+            continue
+        user.subscribers_count, user.subscriptions_count, user.published_posts_count = actual
+        batch.append(user)
+        if len(batch) == batch_size:
+            count += user_model.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        count += user_model.objects.bulk_update(batch, fields)
+    return count
@@ -10,13 +10,18 @@ from django.urls import reverse_lazy
 from django.views.generic import CreateView, UpdateView
 from django.views.generic.list import ListView
 
-from blog.mixins import TitleMixin
+from blog.mixins import AnonymousPageCacheMixin, CursorPaginationMixin, TitleMixin
 from blog.models import Post
+from blog.utils import (
+    add_author_to_timeline,
+    get_author_page_group,
+    remove_author_from_timeline,
+)
 
 from .forms import RegisterUserForm
 from .mixins import IsAuthorRequiredMixin
 from .models import CustomUser
-from .utils import signer
+from .utils import change_subscription, is_subscribed, signer
 
 # Create your views here.
 
@@ -67,19 +72,24 @@ class EditProfileUser(IsAuthorRequiredMixin, TitleMixin, UpdateView):
         return self.request.user
 
 
-class AuthorPosts(TitleMixin, ListView):
+class AuthorPosts(AnonymousPageCacheMixin, CursorPaginationMixin, TitleMixin, ListView):
     """Author's posts"""
 
     model = Post
     template_name = "users/author_posts.html"
     context_object_name = "posts"
     paginate_by = 5
+    cursor_ordering = "-time_create"
 
     def setup(self, *args, **kwargs) -> None:
         """Adds title attribute"""
         super().setup(*args, **kwargs)
         self.title = f"Посты автора {self.kwargs['username']}"
 
+    def get_page_cache_group(self) -> str:
+        """Pages with posts of the author are cached in one group"""
+        return get_author_page_group(self.kwargs["username"])
+
     def get_context_data(self, *args, **kwargs) -> dict:
         """Adds author in context"""
         context = super().get_context_data(*args, **kwargs)
@@ -88,7 +98,12 @@ class AuthorPosts(TitleMixin, ListView):
 
     def get_queryset(self) -> QuerySet:
         """Returns a set of posts"""
-        return Post.objects.filter(author__username=self.kwargs["username"]).filter(is_published=True)
+        return (
+            Post.objects.filter(author__username=self.kwargs["username"])
+            .filter(is_published=True)
+            .defer("article")
+            .select_related()
+        )
 
 
 def user_activate(request: HttpRequest, sign: str) -> HttpResponse:
@@ -125,7 +140,7 @@ def subscribe(request: HttpRequest, author_username: str):
             json_dumps_params={"ensure_ascii": False},
         )
     author = get_object_or_404(CustomUser, username=author_username, is_author=True)
-    if author in request.user.subscriptions.all():
+    if is_subscribed(request.user.pk, author.pk) or not change_subscription(request.user, author, subscribe=True):
         return JsonResponse(
             {
                 "message": f"Вы уже подписаны на {author}",
@@ -134,10 +149,7 @@ def subscribe(request: HttpRequest, author_username: str):
             json_dumps_params={"ensure_ascii": False},
         )
 
-    request.user.subscriptions.add(author)
-
-    request.session["subscriptions"].append(author.username)
-    request.session.save()
+    add_author_to_timeline(request.user.pk, author.pk)
 
     return JsonResponse(
         {
@@ -164,7 +176,7 @@ def unsubscribe(request: HttpRequest, author_username: str):
 
     author = get_object_or_404(CustomUser, username=author_username)
 
-    if author not in request.user.subscriptions.all():
+    if not is_subscribed(request.user.pk, author.pk) or not change_subscription(request.user, author, subscribe=False):
         return JsonResponse(
             {
                 "message": f"Вы не подписаны на {author}",
@@ -173,9 +185,7 @@ def unsubscribe(request: HttpRequest, author_username: str):
             json_dumps_params={"ensure_ascii": False},
         )
 
-    request.user.subscriptions.remove(author)
-    request.session["subscriptions"].remove(author.username)
-    request.session.save()
+    remove_author_from_timeline(request.user.pk, author.pk)
 
     return JsonResponse(
         {